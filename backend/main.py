@@ -502,6 +502,58 @@ async def get_wave_analysis():
         conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/llm/usage")
+async def get_llm_usage(hours: int = 24):
+    """LLM calls rolled up by hour, service and model: tokens, latency, cache hits, errors"""
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+    try:
+        cur.execute("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables
+                WHERE table_name = 'llm_calls'
+            )
+        """)
+
+        if not cur.fetchone()[0]:
+            cur.close()
+            conn.close()
+            return []
+
+        cur.execute("""
+            SELECT
+                date_trunc('hour', created_at) as hour,
+                service,
+                model,
+                COUNT(*) as calls,
+                COUNT(*) FILTER (WHERE cache_hit) as cache_hits,
+                COUNT(*) FILTER (WHERE error_class IS NOT NULL) as errors,
+                SUM(prompt_tokens) as prompt_tokens,
+                SUM(completion_tokens) as completion_tokens,
+                SUM(cost) as cost,
+                AVG(latency_ms) FILTER (WHERE NOT cache_hit) as avg_latency_ms,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms)
+                    FILTER (WHERE NOT cache_hit) as p95_latency_ms
+            FROM llm_calls
+            WHERE created_at > NOW() - INTERVAL '1 hour' * %s
+            GROUP BY 1, 2, 3
+            ORDER BY 1 DESC, 2, 3
+        """, (hours,))
+
+        result = [dict(row) for row in cur.fetchall()]
+
+        cur.close()
+        conn.close()
+
+        return json.loads(json.dumps(result, default=decimal_to_float))
+
+    except Exception as e:
+        logger.error(f"Error getting LLM usage: {e}")
+        cur.close()
+        conn.close()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/market/current-prices")
 async def get_current_prices(tickers: str):
     """Get current prices for tickers (comma-separated)"""
@@ -4,6 +4,7 @@ Configuration for Experiment Manager - БЛОК 3
 """
 import os
 import logging
+from datetime import timezone, timedelta
 
 class Config:
     # Database
@@ -50,6 +51,17 @@ class Config:
     # Logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
+    # Волновые интервалы (в минутах от публикации новости) - как в Signal Extractor
+    WAVE_INTERVALS = {
+        0: (0, 5),
+        1: (5, 30),
+        2: (30, 120),
+        3: (120, 360),
+        4: (360, 1440),
+        5: (1440, 4320),
+        6: (4320, 10080),
+    }
+
     def validate(self):
         """Проверяем обязательные параметры"""
         # Настройка логирования
@@ -76,6 +88,13 @@ class Config:
         if self.BASE_POSITION_PERCENT <= 0 or self.BASE_POSITION_PERCENT > 10:
             raise ValueError("BASE_POSITION_PERCENT must be between 0 and 10")
 
+    def get_entry_window(self, published_at, wave):
+        """Окно входа (entry_start, entry_end) для волны, отсчёт от публикации новости"""
+        if published_at.tzinfo is None:
+            published_at = published_at.replace(tzinfo=timezone.utc)
+        start_min, end_min = self.WAVE_INTERVALS.get(wave, (0, 1440))
+        return published_at + timedelta(minutes=start_min), published_at + timedelta(minutes=end_min)
+
     def get_benchmark_tickers(self):
         """Возвращает список бенчмарк тикеров"""
         return {
@@ -3,6 +3,7 @@
 Experiment Manager Service - БЛОК 3
 Виртуальная торговая площадка для тестирования стратегии
 """
+import json
 import psycopg2
 import psycopg2.extras
 import signal
@@ -10,6 +11,7 @@ import sys
 import logging
 import time
 import threading
+import queue
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List
 
@@ -28,6 +30,7 @@ except Exception as e:
 from config import Config
 from market_data import MarketDataProvider
 from portfolio import PortfolioManager
+from signal_scheduler import SignalScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +45,12 @@ class ExperimentManagerService:
             finnhub_key=self.config.FINNHUB_API_KEY
         )
         self.portfolio = PortfolioManager(self.config, self.market_data)
+        # Сигналы ранних волн ждут начала окна входа, а не отбрасываются.
+        # Планировщик только кладёт id в очередь - исполняет их поток слушателя,
+        # чтобы проверки позиций и self.conn использовались из одного потока
+        self.fired_signals = queue.Queue()
+        self.last_expire_sweep = 0.0
+        self.scheduler = SignalScheduler(self.fired_signals.put)
 
         # Подключение к БД для уведомлений
         self.conn = None
@@ -80,6 +89,7 @@ class ExperimentManagerService:
         """Graceful shutdown"""
         logger.info("Shutting down Experiment Manager (SIGINT received)")
         self.running = False
+        self.scheduler.stop()
 
         # Ждем завершения мониторинга
         if self.monitoring_thread and self.monitoring_thread.is_alive():
@@ -102,6 +112,15 @@ class ExperimentManagerService:
             logger.info("Listening for notifications on channel 'new_trading_signals'")
 
             while self.running:
+                # Сигналы, у которых началось окно входа
+                while not self.fired_signals.empty():
+                    self.process_signal(self.fired_signals.get_nowait())
+
+                # Сигналы, окно которых прошло, - в этом же потоке: self.conn принадлежит слушателю
+                if time.monotonic() - self.last_expire_sweep >= self.config.PORTFOLIO_SNAPSHOT_INTERVAL_SECONDS:
+                    self.expire_stale_signals()
+                    self.last_expire_sweep = time.monotonic()
+
                 # Проверяем уведомления каждые 0.1 секунды
                 if self.conn.poll() is None:
                     time.sleep(0.1)
@@ -109,10 +128,11 @@ class ExperimentManagerService:
 
                 while self.conn.notifies:
                     notify = self.conn.notifies.pop(0)
-                    signal_id = notify.payload
+                    signal_ids = self.parse_signal_ids(notify.payload)
 
-                    logger.info(f"Received notification: new_trading_signal ({signal_id})")
-                    self.process_signal(signal_id)
+                    logger.info(f"Received notification: new_trading_signals ({signal_ids})")
+                    for signal_id in signal_ids:
+                        self.process_signal(signal_id)
 
         except Exception as e:
             logger.error(f"Error in signal listener: {e}")
@@ -122,6 +142,17 @@ class ExperimentManagerService:
                 self.connect_db()
                 self.listen_for_signals()
 
+    def parse_signal_ids(self, payload: str) -> List[int]:
+        """Payload уведомления: {"ids": [...]} от триггера уровня оператора или один id (старый триггер)"""
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Unexpected new_trading_signals payload: {payload[:100]}")
+            return []
+        if isinstance(data, dict):
+            return [int(signal_id) for signal_id in data.get('ids') or []]
+        return [int(data)]
+
     def process_signal(self, signal_id: str):
         """Обрабатывает новый сигнал"""
         try:
@@ -131,12 +162,26 @@ class ExperimentManagerService:
                 logger.warning(f"Signal {signal_id} not found")
                 return
 
+            if signal_data['state'] not in ('pending', 'scheduled'):
+                logger.info(f"Signal {signal_id} already {signal_data['state']} - skipping")
+                return
+
             logger.info(f"Processing signal: {signal_data['ticker']} {signal_data['action']}, "
                        f"wave {signal_data['wave']}, confidence {signal_data['confidence']}%")
 
+            # Окно входа ещё не открылось - исполним ровно в entry_start
+            if datetime.now(timezone.utc) < signal_data['entry_start']:
+                if self.scheduler.schedule(signal_data['id'], signal_data['entry_start'], signal_data['entry_end']):
+                    self.set_signal_state(signal_data['id'], 'scheduled',
+                                          f"entry at {signal_data['entry_start']:%Y-%m-%d %H:%M:%S} UTC")
+                    logger.info(f"Signal {signal_id} scheduled for {signal_data['entry_start']:%Y-%m-%d %H:%M:%S} UTC "
+                                f"(wave {signal_data['wave']})")
+                return
+
             # Проверяем время входа
             if not self.is_entry_time_valid(signal_data):
                 logger.info(f"Entry time not valid for signal {signal_id}")
+                self.set_signal_state(signal_data['id'], 'expired', "entry window closed")
                 return
 
             # Проверяем можем ли войти в позицию
@@ -145,6 +190,7 @@ class ExperimentManagerService:
 
             if not can_enter:
                 logger.warning(f"Cannot enter position: {reason}")
+                self.set_signal_state(signal_data['id'], 'rejected', reason)
                 return
 
             # Получаем реалистичную цену исполнения (пробуем с allow_stale если не получилось)
@@ -171,6 +217,7 @@ class ExperimentManagerService:
                     logger.info(f"Using stale price for {signal_data['ticker']}: ${current_price:.2f}")
                 else:
                     logger.error(f"Could not get any price for {signal_data['ticker']} - skipping")
+                    self.set_signal_state(signal_data['id'], 'rejected', "no price available")
                     return
 
             # Входим в позицию
@@ -189,8 +236,10 @@ class ExperimentManagerService:
                 self.stats['signals_processed'] += 1
                 self.stats['positions_opened'] += 1
                 logger.info(f"Position opened successfully: experiment {experiment_id}")
+                self.set_signal_state(signal_data['id'], 'executed', f"experiment {experiment_id}")
             else:
                 logger.error(f"Failed to open position for signal {signal_id}")
+                self.set_signal_state(signal_data['id'], 'rejected', "position not opened")
 
         except Exception as e:
             logger.error(f"Failed to process signal {signal_id}: {e}")
@@ -201,7 +250,8 @@ class ExperimentManagerService:
             cursor = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
             cursor.execute("""
                 SELECT ts.id, ts.signal_type, ts.confidence, ts.elliott_wave,
-                       ts.market_conditions, ts.created_at, ni.headline, ni.id as news_item_id
+                       ts.market_conditions, ts.created_at, ni.headline, ni.id as news_item_id,
+                       ni.published_at, ts.state
                 FROM trading_signals ts
                 JOIN news_items ni ON ts.news_item_id = ni.id
                 WHERE ts.id = %s
@@ -213,18 +263,10 @@ class ExperimentManagerService:
 
             market_conditions = row['market_conditions'] or {}
 
-            # Вычисляем временные окна входа на основе волны и времени создания
-            created_at = row['created_at']
+            # Окна входа отсчитываются от публикации новости - волны идут от неё, а не от сигнала
             wave = row['elliott_wave']
-            wave_intervals = {
-                0: (0, 5), 1: (5, 30), 2: (30, 120), 3: (120, 360),
-                4: (360, 1440), 5: (1440, 4320), 6: (4320, 10080)
-            }
-            start_min, end_min = wave_intervals.get(wave, (0, 1440))
-
-            from datetime import timedelta
-            entry_start = created_at + timedelta(minutes=start_min)
-            entry_end = created_at + timedelta(minutes=end_min)
+            entry_start, entry_end = self.config.get_entry_window(row['published_at'] or row['created_at'], wave)
+            start_min, end_min = self.config.WAVE_INTERVALS.get(wave, (0, 1440))
 
             return {
                 'id': row['id'],
@@ -233,17 +275,52 @@ class ExperimentManagerService:
                 'action': row['signal_type'],
                 'wave': wave,
                 'entry_start': entry_start,
-                'entry_optimal': created_at + timedelta(minutes=(start_min + end_min) / 2),
+                'entry_optimal': entry_start + timedelta(minutes=(end_min - start_min) / 2),
                 'entry_end': entry_end,
                 'expected_move': market_conditions.get('expected_move', 0),
                 'confidence': int(row['confidence']),  # Already 0-100 in DB
-                'headline': row['headline']
+                'headline': row['headline'],
+                'state': row['state']
             }
 
         except Exception as e:
             logger.error(f"Failed to load signal {signal_id}: {e}")
             return None
 
+    def set_signal_state(self, signal_id, state, reason=None):
+        """Переход сигнала по жизненному циклу. Конечные состояния (executed/rejected/expired) не меняются"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                UPDATE trading_signals
+                SET state = %s, state_reason = %s, state_updated_at = NOW()
+                WHERE id = %s AND state IN ('pending', 'scheduled')
+            """, (state, reason, signal_id))
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Failed to set signal {signal_id} state to {state}: {e}")
+            return False
+
+    def expire_stale_signals(self):
+        """Одним UPDATE переводит в expired все живые сигналы с закрытым окном входа"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                UPDATE trading_signals ts
+                SET state = 'expired', state_reason = 'entry window closed', state_updated_at = NOW()
+                FROM news_items ni
+                WHERE ts.news_item_id = ni.id
+                  AND ts.state IN ('pending', 'scheduled')
+                  AND COALESCE(ni.published_at, ts.created_at)
+                      + make_interval(mins => COALESCE((%s::jsonb ->> ts.elliott_wave::text)::int, 1440)) < NOW()
+            """, (json.dumps({str(wave): end for wave, (_, end) in self.config.WAVE_INTERVALS.items()}),))
+            if cursor.rowcount:
+                logger.info(f"Expired {cursor.rowcount} signals with closed entry windows")
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Failed to expire stale signals: {e}")
+            return 0
+
     def is_entry_time_valid(self, signal_data: Dict) -> bool:
         """Проверяет корректность времени входа"""
         now = datetime.now(timezone.utc)
@@ -450,6 +527,8 @@ class ExperimentManagerService:
 
         # Статистика сделок
         logger.info(f"  Signals processed: {self.stats['signals_processed']}")
+        logger.info(f"  Scheduled signals: {len(self.scheduler)} waiting, "
+                    f"{self.scheduler.stats['fired']} fired, {self.scheduler.stats['expired']} missed")
         logger.info(f"  Positions opened: {self.stats['positions_opened']}")
         logger.info(f"  Positions closed: {self.stats['positions_closed']}")
         logger.info(f"  Uptime: {uptime_str}")
@@ -459,43 +538,41 @@ class ExperimentManagerService:
         logger.info(f"  Price cache: {cache_stats['valid_entries']}/{cache_stats['total_entries']} valid")
 
     def process_pending_signals(self):
-        """Обрабатывает необработанные сигналы при запуске"""
+        """При запуске: живые сигналы (pending/scheduled) с ещё открытым или будущим окном входа.
+
+        Открытые окна исполняются сразу, будущие - ставятся в планировщик.
+        Просроченные сначала закрываются одним UPDATE, скан идёт по частичному индексу.
+        """
         try:
+            self.expire_stale_signals()
             cursor = self.conn.cursor()
-            # Ограничиваем обработку только сигналами с открытыми окнами входа
             cursor.execute("""
-                SELECT id, created_at, elliott_wave FROM trading_signals
-                WHERE created_at > NOW() - INTERVAL '24 hours'
-                ORDER BY created_at DESC
-                LIMIT 50
+                SELECT ts.id, ts.elliott_wave, COALESCE(ni.published_at, ts.created_at)
+                FROM trading_signals ts
+                JOIN news_items ni ON ts.news_item_id = ni.id
+                WHERE ts.state IN ('pending', 'scheduled')
+                ORDER BY ts.created_at
             """)
 
             pending_signals = cursor.fetchall()
-            if pending_signals:
-                logger.info(f"Found {len(pending_signals)} recent signals")
-
-                # Фильтруем сигналы с открытыми окнами входа
-                processable_count = 0
-                for (signal_id, created_at, wave) in pending_signals:
-                    # Быстрая проверка времени входа без загрузки полных данных
-                    wave_intervals = {
-                        0: (0, 5), 1: (5, 30), 2: (30, 120), 3: (120, 360),
-                        4: (360, 1440), 5: (1440, 4320), 6: (4320, 10080)
-                    }
-                    start_min, end_min = wave_intervals.get(wave, (0, 1440))
-                    entry_start = created_at + timedelta(minutes=start_min)
-                    entry_end = created_at + timedelta(minutes=end_min)
-                    now = datetime.now(timezone.utc)
-
-                    if entry_start <= now <= entry_end:
-                        logger.info(f"Processing signal {signal_id} (wave {wave}, entry window open)")
-                        self.process_signal(signal_id)
-                        processable_count += 1
-                        time.sleep(1.0)  # Задержка для rate limiting
-                    else:
-                        logger.debug(f"Signal {signal_id} entry window not open yet")
+            now = datetime.now(timezone.utc)
+            processable_count = scheduled_count = 0
+            for (signal_id, wave, anchor) in pending_signals:
+                entry_start, entry_end = self.config.get_entry_window(anchor, wave)
+                if now > entry_end:
+                    continue
+                if now < entry_start:
+                    if self.scheduler.schedule(signal_id, entry_start, entry_end):
+                        self.set_signal_state(signal_id, 'scheduled', f"entry at {entry_start:%Y-%m-%d %H:%M:%S} UTC")
+                    scheduled_count += 1
+                else:
+                    logger.info(f"Processing signal {signal_id} (wave {wave}, entry window open)")
+                    self.process_signal(signal_id)
+                    processable_count += 1
+                    time.sleep(1.0)  # Задержка для rate limiting
 
-                logger.info(f"Processed {processable_count}/{len(pending_signals)} signals with open entry windows")
+            logger.info(f"Pending signals: {processable_count} processed, {scheduled_count} scheduled, "
+                        f"{len(pending_signals) - processable_count - scheduled_count} expired")
 
         except Exception as e:
             logger.error(f"Failed to process pending signals: {e}")
@@ -520,7 +597,8 @@ class ExperimentManagerService:
         snapshot_thread = threading.Thread(target=self.create_portfolio_snapshots, daemon=True)
         snapshot_thread.start()
 
-        # Обрабатываем существующие сигналы
+        # Планировщик отложенных сигналов и сигналы, не исполненные до перезапуска
+        self.scheduler.start()
         self.process_pending_signals()
 
         last_hourly_log = datetime.now()
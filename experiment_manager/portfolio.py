@@ -5,6 +5,7 @@ Portfolio Manager - БЛОК 3
 """
 import psycopg2
 import psycopg2.extras
+import psycopg2.errors
 import logging
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Optional, Tuple
@@ -104,6 +105,35 @@ class PortfolioManager:
                 )
             """)
 
+            # Жизненный цикл сигнала: pending -> scheduled -> executed / rejected / expired
+            cursor.execute("""
+                ALTER TABLE trading_signals
+                ADD COLUMN IF NOT EXISTS state VARCHAR(20) NOT NULL DEFAULT 'pending'
+                    CHECK (state IN ('pending', 'scheduled', 'executed', 'rejected', 'expired')),
+                ADD COLUMN IF NOT EXISTS state_reason TEXT,
+                ADD COLUMN IF NOT EXISTS state_updated_at TIMESTAMP WITH TIME ZONE
+            """)
+            # Сигналы, по которым позиция уже открыта до появления колонки
+            cursor.execute("""
+                UPDATE trading_signals SET state = 'executed', state_reason = 'position opened',
+                                           state_updated_at = NOW()
+                WHERE state IN ('pending', 'scheduled')
+                  AND id IN (SELECT signal_id FROM experiments WHERE signal_id IS NOT NULL)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_trading_signals_live
+                ON trading_signals(created_at) WHERE state IN ('pending', 'scheduled')
+            """)
+
+            # Одна позиция на сигнал
+            try:
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_experiments_signal_id_unique
+                    ON experiments(signal_id) WHERE signal_id IS NOT NULL
+                """)
+            except Exception as e:
+                logger.warning(f"Could not create unique position-per-signal index (duplicate positions exist?): {e}")
+
             # Индексы
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_timestamp
@@ -336,6 +366,9 @@ class PortfolioManager:
 
             return experiment_id
 
+        except psycopg2.errors.UniqueViolation:
+            logger.warning(f"Signal {signal_data['signal_id']} already has a position - not opening another")
+            return None
         except Exception as e:
             logger.error(f"Failed to enter position: {e}")
             return None
@@ -83,21 +83,40 @@ CREATE INDEX IF NOT EXISTS idx_experiments_entry_time ON experiments(entry_time)
 CREATE INDEX IF NOT EXISTS idx_experiments_exit_time ON experiments(exit_time);
 CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_timestamp ON portfolio_snapshots(timestamp);
 
+-- Снимаем все триггеры на функции сигналов (старые построчные под любыми именами)
+DO $$
+DECLARE
+    t RECORD;
+BEGIN
+    FOR t IN
+        SELECT tg.tgname, tg.tgrelid::regclass AS rel
+        FROM pg_trigger tg JOIN pg_proc p ON tg.tgfoid = p.oid
+        WHERE p.proname = 'notify_new_trading_signals' AND NOT tg.tgisinternal
+    LOOP
+        EXECUTE format('DROP TRIGGER %I ON %s', t.tgname, t.rel);
+    END LOOP;
+END
+$$;
+
 -- Функция для уведомлений о новых сигналах
 CREATE OR REPLACE FUNCTION notify_new_trading_signals()
 RETURNS TRIGGER AS $$
 BEGIN
-    -- Уведомляем БЛОК 3 о новых сигналах
-    PERFORM pg_notify('new_trading_signals', NEW.id::text);
-    RETURN NEW;
+    -- Одно уведомление на INSERT: JSON со всеми id вставленных сигналов
+    IF EXISTS (SELECT 1 FROM new_signals) THEN
+        PERFORM pg_notify('new_trading_signals',
+            (SELECT json_build_object('ids', json_agg(id ORDER BY id))::text FROM new_signals));
+    END IF;
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
--- Триггер на новые сигналы
+-- Триггер уровня оператора: пачка сигналов одной новости - одно уведомление
 DROP TRIGGER IF EXISTS signal_insert_notify ON signals;
 CREATE TRIGGER signal_insert_notify
     AFTER INSERT ON signals
-    FOR EACH ROW
+    REFERENCING NEW TABLE AS new_signals
+    FOR EACH STATEMENT
     EXECUTE FUNCTION notify_new_trading_signals();
 
 -- Функция для автоматического обновления updated_at
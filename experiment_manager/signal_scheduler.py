@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Deferred signal execution for Experiment Manager - сигнал исполняется ровно в начале окна входа
+"""
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+class SignalScheduler:
+    def __init__(self, fire_fn):
+        # fire_fn(signal_id) вызывается в потоке планировщика в момент entry_start
+        self.fire_fn = fire_fn
+
+        self.heap = []  # (entry_start, seq, signal_id, entry_end)
+        self.ids = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self.thread = None
+        self.stats = {
+            'scheduled': 0,
+            'fired': 0,
+            'expired': 0
+        }
+
+    def __len__(self):
+        with self._cond:
+            return len(self.heap)
+
+    def schedule(self, signal_id, entry_start, entry_end):
+        """Ставит сигнал на исполнение в entry_start. Повторная постановка игнорируется"""
+        with self._cond:
+            if signal_id in self.ids:
+                return False
+            heapq.heappush(self.heap, (entry_start, next(self._seq), signal_id, entry_end))
+            self.ids.add(signal_id)
+            self.stats['scheduled'] += 1
+            # Будим поток: новый сигнал может быть раньше текущего ближайшего
+            self._cond.notify()
+        return True
+
+    def start(self):
+        self._running = True
+        self.thread = threading.Thread(target=self._loop, name="signal-scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _next_due(self):
+        """Ждёт ближайший сигнал, возвращает (signal_id, entry_end) или None при остановке"""
+        with self._cond:
+            while self._running:
+                if not self.heap:
+                    self._cond.wait()
+                    continue
+                entry_start, _, signal_id, entry_end = self.heap[0]
+                delay = (entry_start - datetime.now(timezone.utc)).total_seconds()
+                if delay > 0:
+                    self._cond.wait(timeout=delay)
+                    continue
+                heapq.heappop(self.heap)
+                self.ids.discard(signal_id)
+                return signal_id, entry_end
+            return None
+
+    def _loop(self):
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+            signal_id, entry_end = due
+
+            if datetime.now(timezone.utc) > entry_end:
+                self.stats['expired'] += 1
+                logger.info(f"Scheduled signal {signal_id} missed its entry window")
+                continue
+
+            self.stats['fired'] += 1
+            try:
+                self.fire_fn(signal_id)
+            except Exception as e:
+                logger.error(f"Scheduled signal {signal_id} failed: {e}")
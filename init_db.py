@@ -49,6 +49,11 @@ def init_database(database_url):
                 wave_description TEXT NOT NULL,
                 reasoning TEXT NOT NULL,
                 market_conditions JSONB,
+                source_news_ids INTEGER[],
+                state VARCHAR(20) NOT NULL DEFAULT 'pending'
+                    CHECK (state IN ('pending', 'scheduled', 'executed', 'rejected', 'expired')),
+                state_reason TEXT,
+                state_updated_at TIMESTAMP WITH TIME ZONE,
                 created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
             )
             """,
@@ -117,6 +122,7 @@ def init_database(database_url):
             "CREATE INDEX IF NOT EXISTS idx_news_items_is_significant ON news_items(is_significant)",
             "CREATE INDEX IF NOT EXISTS idx_trading_signals_news_item_id ON trading_signals(news_item_id)",
             "CREATE INDEX IF NOT EXISTS idx_trading_signals_signal_type ON trading_signals(signal_type)",
+            "CREATE INDEX IF NOT EXISTS idx_trading_signals_live ON trading_signals(created_at) WHERE state IN ('pending', 'scheduled')",
             "CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_timestamp ON portfolio_snapshots(timestamp)",
             "CREATE INDEX IF NOT EXISTS idx_trades_experiment_id ON trades(experiment_id)",
             "CREATE INDEX IF NOT EXISTS idx_experiments_status ON experiments(status)"
@@ -131,7 +137,7 @@ def init_database(database_url):
             CREATE OR REPLACE FUNCTION notify_new_significant_news()
             RETURNS TRIGGER AS $$
             BEGIN
-                IF NEW.is_significant = TRUE THEN
+                IF NEW.is_significant = TRUE AND (TG_OP = 'INSERT' OR OLD.is_significant IS DISTINCT FROM TRUE) THEN
                     PERFORM pg_notify('significant_news',
                         json_build_object(
                             'id', NEW.id,
@@ -147,21 +153,33 @@ def init_database(database_url):
             $$ LANGUAGE plpgsql
         """)
 
+        # Снимаем все триггеры на функции сигналов (старые построчные под любыми именами)
         cursor.execute("""
-            CREATE OR REPLACE FUNCTION notify_new_signal()
+            DO $$
+            DECLARE
+                t RECORD;
+            BEGIN
+                FOR t IN
+                    SELECT tg.tgname, tg.tgrelid::regclass AS rel
+                    FROM pg_trigger tg JOIN pg_proc p ON tg.tgfoid = p.oid
+                    WHERE p.proname = 'notify_new_trading_signals' AND NOT tg.tgisinternal
+                LOOP
+                    EXECUTE format('DROP TRIGGER %I ON %s', t.tgname, t.rel);
+                END LOOP;
+            END
+            $$
+        """)
+
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION notify_new_trading_signals()
             RETURNS TRIGGER AS $$
             BEGIN
-                PERFORM pg_notify('new_trading_signal',
-                    json_build_object(
-                        'id', NEW.id,
-                        'news_item_id', NEW.news_item_id,
-                        'signal_type', NEW.signal_type,
-                        'confidence', NEW.confidence,
-                        'elliott_wave', NEW.elliott_wave,
-                        'wave_description', NEW.wave_description
-                    )::text
-                );
-                RETURN NEW;
+                -- Одно уведомление на INSERT: JSON со всеми id вставленных сигналов
+                IF EXISTS (SELECT 1 FROM new_signals) THEN
+                    PERFORM pg_notify('new_trading_signals',
+                        (SELECT json_build_object('ids', json_agg(id ORDER BY id))::text FROM new_signals));
+                END IF;
+                RETURN NULL;
             END;
             $$ LANGUAGE plpgsql
         """)
@@ -178,10 +196,12 @@ def init_database(database_url):
 
         cursor.execute("""
             DROP TRIGGER IF EXISTS trigger_notify_new_signal ON trading_signals;
-            CREATE TRIGGER trigger_notify_new_signal
+            DROP TRIGGER IF EXISTS trigger_notify_new_signals ON trading_signals;
+            CREATE TRIGGER trigger_notify_new_signals
                 AFTER INSERT ON trading_signals
-                FOR EACH ROW
-                EXECUTE FUNCTION notify_new_signal()
+                REFERENCING NEW TABLE AS new_signals
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION notify_new_trading_signals()
         """)
         print("✅ Триггеры созданы")
 
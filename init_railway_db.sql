@@ -31,6 +31,13 @@ CREATE TABLE IF NOT EXISTS trading_signals (
     wave_description TEXT NOT NULL,
     reasoning TEXT NOT NULL,
     market_conditions JSONB,
+    -- Все новости, на которых основан сигнал (склейка новостей о тех же тикерах)
+    source_news_ids INTEGER[],
+    -- Жизненный цикл: pending -> scheduled -> executed / rejected / expired
+    state VARCHAR(20) NOT NULL DEFAULT 'pending'
+        CHECK (state IN ('pending', 'scheduled', 'executed', 'rejected', 'expired')),
+    state_reason TEXT,
+    state_updated_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
@@ -38,6 +45,8 @@ CREATE INDEX IF NOT EXISTS idx_trading_signals_news_item_id ON trading_signals(n
 CREATE INDEX IF NOT EXISTS idx_trading_signals_signal_type ON trading_signals(signal_type);
 CREATE INDEX IF NOT EXISTS idx_trading_signals_elliott_wave ON trading_signals(elliott_wave);
 CREATE INDEX IF NOT EXISTS idx_trading_signals_created_at ON trading_signals(created_at);
+-- Планировщик читает только живые сигналы
+CREATE INDEX IF NOT EXISTS idx_trading_signals_live ON trading_signals(created_at) WHERE state IN ('pending', 'scheduled');
 
 -- Experiment Manager schema
 CREATE TABLE IF NOT EXISTS experiments (
@@ -94,18 +103,38 @@ CREATE INDEX IF NOT EXISTS idx_trades_timestamp ON trades(timestamp);
 CREATE OR REPLACE FUNCTION notify_new_significant_news()
 RETURNS TRIGGER AS $$
 BEGIN
-    IF NEW.is_significant = TRUE THEN
+    -- Только при появлении значимости: обновления reasoning и отметки обработки не шлют повторный NOTIFY
+    IF NEW.is_significant = TRUE AND (TG_OP = 'INSERT' OR OLD.is_significant IS DISTINCT FROM TRUE) THEN
         PERFORM pg_notify('new_significant_news', NEW.id::text);
     END IF;
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
 
-CREATE OR REPLACE FUNCTION notify_new_signal()
+-- Снимаем все триггеры на функции сигналов (старые построчные под любыми именами)
+DO $$
+DECLARE
+    t RECORD;
+BEGIN
+    FOR t IN
+        SELECT tg.tgname, tg.tgrelid::regclass AS rel
+        FROM pg_trigger tg JOIN pg_proc p ON tg.tgfoid = p.oid
+        WHERE p.proname = 'notify_new_trading_signals' AND NOT tg.tgisinternal
+    LOOP
+        EXECUTE format('DROP TRIGGER %I ON %s', t.tgname, t.rel);
+    END LOOP;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION notify_new_trading_signals()
 RETURNS TRIGGER AS $$
 BEGIN
-    PERFORM pg_notify('new_trading_signals', NEW.id::text);
-    RETURN NEW;
+    -- Одно уведомление на INSERT: JSON со всеми id вставленных сигналов
+    IF EXISTS (SELECT 1 FROM new_signals) THEN
+        PERFORM pg_notify('new_trading_signals',
+            (SELECT json_build_object('ids', json_agg(id ORDER BY id))::text FROM new_signals));
+    END IF;
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -117,10 +146,12 @@ CREATE TRIGGER trigger_notify_significant_news
     EXECUTE FUNCTION notify_new_significant_news();
 
 DROP TRIGGER IF EXISTS trigger_notify_new_signal ON trading_signals;
-CREATE TRIGGER trigger_notify_new_signal
+DROP TRIGGER IF EXISTS trigger_notify_new_signals ON trading_signals;
+CREATE TRIGGER trigger_notify_new_signals
     AFTER INSERT ON trading_signals
-    FOR EACH ROW
-    EXECUTE FUNCTION notify_new_signal();
+    REFERENCING NEW TABLE AS new_signals
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_new_trading_signals();
 
 -- Insert sample experiment for testing
 INSERT INTO experiments (name, description, start_date, end_date, initial_balance, current_balance, settings)
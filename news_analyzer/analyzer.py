@@ -2,12 +2,38 @@
 """
 LLM analyzer for news significance - Proper DSPy configuration
 """
+import contextlib
 import dspy
+import json
+import litellm
 import logging
 import os
+import re
+import threading
+import uuid
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Версия промпта - входит в ключ кеша вердиктов, увеличивать при изменении
+# сигнатур или критериев оценки
+PROMPT_VERSION = "1"
+
+# Критерии оценки - в одиночном режиме добавляются к каждой новости,
+# в пакетном отправляются один раз на всю пачку
+SCORING_RUBRIC = """
+Анализируй эту новость для финансовых трейдеров.
+
+Оценивай по критериям:
+- 80-100: критически важно (слияния, решения ФРС, кризисы)
+- 60-79: очень важно (отчеты крупных компаний, макроданные)
+- 40-59: умеренно важно (отраслевые новости)
+- 20-39: мало важно (кадровые изменения)
+- 0-19: не важно (советы, мнения)
+
+Значимыми считай новости со score >= 60.
+"""
+
 class NewsSignificanceSignature(dspy.Signature):
     """Оценка значимости новости для финансовых рынков"""
 
@@ -18,8 +44,38 @@ class NewsSignificanceSignature(dspy.Signature):
     is_significant = dspy.OutputField(desc="Значимая ли новость (true/false)")
     reasoning = dspy.OutputField(desc="Объяснение почему важно или неважно")
 
+class NewsBatchSignificanceSignature(dspy.Signature):
+    """Оценка значимости пачки новостей для финансовых рынков - каждая новость оценивается независимо"""
+
+    rubric = dspy.InputField(desc="Критерии оценки, общие для всех новостей пачки")
+    news_batch = dspy.InputField(desc="Пронумерованный список новостей в формате [номер] заголовок: содержание")
+
+    results = dspy.OutputField(desc='JSON массив, по одному объекту на каждую новость: '
+                                    '{"index": номер, "significance_score": 0-100, '
+                                    '"is_significant": true/false, "reasoning": "кратко почему"}')
+
+# Заголовки полей в ответе ChatAdapter - score и флаг идут раньше reasoning
+EARLY_SCORE_RE = re.compile(r"\[\[ ## significance_score ## \]\]\s*(\d{1,3})\s*\n")
+EARLY_FLAG_RE = re.compile(r"\[\[ ## is_significant ## \]\]\s*([A-Za-zА-Яа-я0-9]+)\s*\n")
+
 class NewsAnalyzer:
-    def __init__(self, openrouter_api_key, model_name, temperature):
+    def __init__(self, openrouter_api_key, model_name, temperature, cache=None, fallback_scorer=None, recorder=None,
+                 streaming=False, cheap_model_name=None, escalation_band=(45, 75), timeout_seconds=None):
+        # Кеш вердиктов (VerdictCache) - повторные публикации не идут в LLM
+        self.cache = cache
+        # Локальная модель (NewsPrefilter) - оценивает, когда OpenRouter недоступен
+        self.fallback_scorer = fallback_scorer
+        # Учёт токенов и задержек (LLMCallRecorder)
+        self.recorder = recorder
+        self.model_name = model_name
+        self.temperature = temperature
+        # Потоковый режим: score и флаг отдаются до того, как модель допишет reasoning
+        self.streaming = streaming
+        self.adapter = dspy.ChatAdapter()
+        self.escalation_band = escalation_band
+        # Таймаут HTTP-вызова LLM - поток пула не висит дольше таймаута пула
+        self.timeout_seconds = timeout_seconds
+
         # Правильная конфигурация DSPy с OpenRouter
         try:
             # Настраиваем переменную окружения
@@ -29,11 +85,30 @@ class NewsAnalyzer:
             lm = dspy.LM(
                 model=f"openrouter/{model_name}",
                 temperature=temperature,
-                max_tokens=1000
+                max_tokens=1000,
+                timeout=timeout_seconds
             )
 
             # Конфигурируем DSPy правильно
             dspy.settings.configure(lm=lm)
+            if self.recorder is not None:
+                self.recorder.instrument(lm)
+            self.lm = lm
+
+            # Каскад: дешёвая модель оценивает всё, дорогая - только спорные оценки
+            self.cheap_lm = None
+            self.cheap_model_name = cheap_model_name or None
+            if cheap_model_name:
+                self.cheap_lm = dspy.LM(
+                    model=f"openrouter/{cheap_model_name}",
+                    temperature=temperature,
+                    max_tokens=1000,
+                    timeout=timeout_seconds
+                )
+                if self.recorder is not None:
+                    self.recorder.instrument(self.cheap_lm)
+                logger.info(f"Cascade enabled: {cheap_model_name} first, {model_name} for scores "
+                            f"{escalation_band[0]}-{escalation_band[1]}")
 
             logger.info(f"DSPy configured correctly with OpenRouter model: {model_name}")
 
@@ -43,54 +118,311 @@ class NewsAnalyzer:
 
         # Создаем предиктор с переопределением температуры
         self.predictor = dspy.Predict(NewsSignificanceSignature, temperature=temperature)
+        self.batch_predictor = dspy.Predict(NewsBatchSignificanceSignature, temperature=temperature)
+
+        # Статистика запросов (analyze вызывается из потоков пула)
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'batch_requests': 0,
+            'batch_items': 0,
+            'batch_fallbacks': 0,
+            'streamed': 0,
+            'early_verdicts': 0,
+            'cascade_cheap_only': 0,
+            'cascade_escalated': 0,
+            'cascade_flipped': 0
+        }
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _parse_verdict(self, raw_score, raw_significant, raw_reasoning):
+        """Приводит сырые поля ответа LLM к (score, is_significant, reasoning)"""
+        try:
+            score = int(float(str(raw_score).strip()))
+            score = max(0, min(100, score))  # Ограничиваем 0-100
+        except (ValueError, TypeError):
+            logger.warning(f"Invalid score from DSPy: {raw_score}")
+            score = 0
+
+        is_significant_str = str(raw_significant).strip().lower()
+        is_significant = is_significant_str in ['true', '1', 'yes', 'да'] or score >= 60
+
+        reasoning = str(raw_reasoning) if raw_reasoning is not None else "No reasoning provided"
+
+        return score, is_significant, reasoning
+
+    def _track(self, operation, lm=None):
+        """Учёт вызова LLM, если подключён recorder"""
+        if self.recorder is None:
+            return contextlib.nullcontext()
+        return self.recorder.track(operation, (lm or self.lm).model)
+
+    def _in_escalation_band(self, score):
+        low, high = self.escalation_band
+        return low <= score <= high
+
+    def _cache_get(self, headline, summary):
+        """Вердикт основной модели, в каскаде - затем вердикт дешёвой (хранятся под разными ключами)"""
+        if self.cache is None:
+            return None
+        models = [self.model_name] + ([self.cheap_model_name] if self.cheap_lm is not None else [])
+        for model_name in models:
+            verdict = self.cache.get(headline, summary, model_name)
+            if verdict:
+                logger.debug(f"Verdict cache hit ({model_name}): {headline[:50]}...")
+                if self.recorder is not None:
+                    self.recorder.record_cache_hit('significance', model_name)
+                return (*verdict, 'cache')
+        return None
+
+    def _cache_put(self, headline, summary, verdict, scored_by):
+        """Кеширует вердикт под моделью, которая его дала"""
+        if self.cache is None:
+            return
+        if scored_by == 'llm_cheap':
+            # Спорная оценка дешёвой модели (эскалация не удалась) - не кешируем
+            if self._in_escalation_band(verdict[0]):
+                return
+            self.cache.put(headline, summary, verdict, self.cheap_model_name)
+        else:
+            self.cache.put(headline, summary, verdict, self.model_name)
 
     def analyze(self, headline, summary):
-        """Анализ значимости новости"""
+        """Анализ значимости новости -> (score, is_significant, reasoning, scored_by)
+
+        scored_by: llm / llm_cheap / llm_escalated (каскад) / cache / fallback (локальная модель) / error
+        """
+        cached = self._cache_get(headline, summary)
+        if cached:
+            return cached
+        return self._analyze_fresh(headline, summary)
+
+    def _analyze_fresh(self, headline, summary, on_early=None):
+        """Анализ через LLM без проверки кеша, успешный вердикт сохраняется в кеш.
+
+        on_early(score, is_significant) - в потоковом режиме вызывается, как только
+        в ответе появились score и флаг значимости.
+        """
         try:
             # Обрезаем summary до 500 символов
             truncated_summary = summary[:500] if summary else ""
+            prompt_summary = truncated_summary + "\n\n" + SCORING_RUBRIC
 
-            # Создаем подробный промпт для лучшего анализа
-            analysis_context = f"""
-Анализируй эту новость для финансовых трейдеров.
+            self._count('requests')
+            if self.cheap_lm is None:
+                verdict = self._call_model(self.lm, headline, prompt_summary, on_early)
+                scored_by = 'llm'
+            else:
+                # Ранний вердикт дешёвой модели отдаём, только если он не уйдёт на эскалацию
+                cheap_early = None
+                if on_early is not None:
+                    cheap_early = lambda score, is_significant: (
+                        None if self._in_escalation_band(score) else on_early(score, is_significant))
+                cheap_verdict = self._call_model(self.cheap_lm, headline, prompt_summary, cheap_early)
+                verdict, scored_by = self._escalate_if_uncertain(headline, prompt_summary, cheap_verdict, on_early)
 
-Оценивай по критериям:
-- 80-100: критически важно (слияния, решения ФРС, кризисы)
-- 60-79: очень важно (отчеты крупных компаний, макроданные)
-- 40-59: умеренно важно (отраслевые новости)
-- 20-39: мало важно (кадровые изменения)
-- 0-19: не важно (советы, мнения)
+        except Exception as e:
+            logger.error(f"DSPy analysis failed: {e}")
+            if self.fallback_scorer is not None:
+                # Локальная оценка только для записи: без LLM новость не публикуется как значимая
+                score, _, reasoning = self.fallback_scorer.score(headline, summary, f"LLM unavailable: {e}")
+                return score, False, reasoning, 'fallback'
+            return 0, False, f"DSPy error: {str(e)}", 'error'
 
-Значимыми считай новости со score >= 60.
-"""
+        self._cache_put(headline, summary, verdict, scored_by)
+        logger.debug(f"DSPy analysis: score={verdict[0]}, significant={verdict[1]}, scored_by={scored_by}")
+        return (*verdict, scored_by)
+
+    def _call_model(self, lm, headline, prompt_summary, on_early=None):
+        """Один вызов модели -> (score, is_significant, reasoning)"""
+        if self.streaming:
+            fields = self._stream_fields(lm, headline, prompt_summary, on_early)
+        else:
+            with self._track('significance', lm), dspy.context(lm=lm):
+                response = self.predictor(headline=headline, summary=prompt_summary)
+            fields = {name: getattr(response, name, None)
+                      for name in ('significance_score', 'is_significant', 'reasoning')}
+
+        # Парсим ответ DSPy
+        return self._parse_verdict(
+            fields.get('significance_score'),
+            fields.get('is_significant'),
+            fields.get('reasoning')
+        )
 
-            response = self.predictor(
-                headline=headline,
-                summary=truncated_summary + "\n\n" + analysis_context
+    def _escalate_if_uncertain(self, headline, prompt_summary, cheap_verdict, on_early=None):
+        """Каскад: оценка дешёвой модели в полосе неуверенности перепроверяется основной.
+
+        Каждое решение логируется с префиксом "Cascade decision" для подбора полосы.
+        """
+        cheap_score = cheap_verdict[0]
+        low, high = self.escalation_band
+        if not self._in_escalation_band(cheap_score):
+            self._count('cascade_cheap_only')
+            logger.info(f"Cascade decision: keep cheap score={cheap_score} (band {low}-{high}): {headline[:60]}")
+            return cheap_verdict, 'llm_cheap'
+
+        self._count('cascade_escalated')
+        try:
+            verdict = self._call_model(self.lm, headline, prompt_summary, on_early)
+        except Exception as e:
+            logger.error(f"Cascade escalation failed, keeping cheap verdict: {e}")
+            return cheap_verdict, 'llm_cheap'
+
+        if verdict[1] != cheap_verdict[1]:
+            self._count('cascade_flipped')
+        logger.info(f"Cascade decision: escalate cheap score={cheap_score} -> {verdict[0]} "
+                    f"(significant {cheap_verdict[1]} -> {verdict[1]}): {headline[:60]}")
+        return verdict, 'llm_escalated'
+
+    def _stream_fields(self, lm, headline, summary, on_early):
+        """Потоковый вызов LLM в формате ChatAdapter; поля разбираются по мере поступления"""
+        messages = self.adapter.format(NewsSignificanceSignature, demos=[],
+                                       inputs={'headline': headline, 'summary': summary})
+        self._count('streamed')
+
+        text = ""
+        usage = None
+        early_sent = False
+        with self._track('significance_stream', lm):
+            # Параметры вызова (temperature, max_tokens, timeout) - из настроек dspy.LM
+            stream = litellm.completion(
+                model=lm.model,
+                messages=messages,
+                stream=True,
+                stream_options={'include_usage': True},
+                **lm.kwargs
             )
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                text += chunk.choices[0].delta.content or ""
 
-            # Парсим ответ DSPy
-            try:
-                score = int(response.significance_score)
-                score = max(0, min(100, score))  # Ограничиваем 0-100
-            except (ValueError, AttributeError):
-                logger.warning(f"Invalid score from DSPy: {response.significance_score}")
-                score = 0
+                if on_early is not None and not early_sent:
+                    score_match = EARLY_SCORE_RE.search(text)
+                    flag_match = EARLY_FLAG_RE.search(text)
+                    if score_match and flag_match:
+                        early_sent = True
+                        score, is_significant, _ = self._parse_verdict(score_match.group(1), flag_match.group(1), None)
+                        self._count('early_verdicts')
+                        on_early(score, is_significant)
 
-            try:
-                is_significant_str = str(response.is_significant).lower()
-                is_significant = is_significant_str in ['true', '1', 'yes', 'да'] or score >= 60
-            except AttributeError:
-                is_significant = score >= 60
+            # Потоковый ответ не проходит через dspy.LM - запись в историю для учёта токенов
+            lm.history.append({
+                'messages': messages,
+                'kwargs': {'stream': True},
+                'response': None,
+                'outputs': [text],
+                'usage': {
+                    'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+                    'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0
+                },
+                'cost': None,
+                'timestamp': datetime.now().isoformat(),
+                'uuid': str(uuid.uuid4()),
+                'model': lm.model,
+                'model_type': 'chat'
+            })
 
-            try:
-                reasoning = str(response.reasoning)
-            except AttributeError:
-                reasoning = "No reasoning provided"
+        return self.adapter.parse(NewsSignificanceSignature, text)
+
+    def analyze_batch(self, items, on_early=None):
+        """Пакетный анализ: items - список (headline, summary), результат в том же порядке.
+
+        Сначала проверяется кеш, в пакет уходят только промахи. Для новостей, которые
+        не удалось разобрать из пакетного ответа, результат None - вызывающий
+        переоценивает их по одной отдельными задачами пула (у каждой свой таймаут).
+        on_early(index, score, is_significant) - ранний вердикт одиночного потокового вызова.
+        """
+        results = [self._cache_get(headline, summary) for headline, summary in items]
+        misses = [i for i, verdict in enumerate(results) if verdict is None]
 
-            logger.debug(f"DSPy analysis: score={score}, significant={is_significant}")
-            return score, is_significant, reasoning
+        if len(misses) == 1:
+            index = misses[0]
+            early = (lambda score, is_significant: on_early(index, score, is_significant)) if on_early else None
+            results[index] = self._analyze_fresh(*items[index], on_early=early)
+            return results
+        if not misses:
+            return results
+
+        verdicts = {}
+        try:
+            lines = []
+            for index, i in enumerate(misses, start=1):
+                headline, summary = items[i]
+                truncated_summary = (summary[:500] if summary else "").replace("\n", " ")
+                lines.append(f"[{index}] {headline}: {truncated_summary}")
+
+            self._count('batch_requests')
+            self._count('batch_items', len(misses))
+            # В каскаде пачку оценивает дешёвая модель, спорные перепроверяются по одной
+            batch_lm = self.cheap_lm or self.lm
+            with self._track('significance_batch', batch_lm), dspy.context(lm=batch_lm):
+                response = self.batch_predictor(
+                    rubric=SCORING_RUBRIC,
+                    news_batch="\n".join(lines),
+                    config={'max_tokens': min(4000, 200 + 250 * len(misses))}
+                )
+            verdicts = self._parse_batch_results(response.results, len(misses))
 
         except Exception as e:
-            logger.error(f"DSPy analysis failed: {e}")
-            return 0, False, f"DSPy error: {str(e)}"
\ No newline at end of file
+            logger.error(f"DSPy batch analysis failed: {e}")
+
+        for index, i in enumerate(misses, start=1):
+            headline, summary = items[i]
+            if index in verdicts:
+                verdict, scored_by = verdicts[index], 'llm'
+                if self.cheap_lm is not None:
+                    prompt_summary = (summary[:500] if summary else "") + "\n\n" + SCORING_RUBRIC
+                    verdict, scored_by = self._escalate_if_uncertain(headline, prompt_summary, verdict)
+                results[i] = (*verdict, scored_by)
+                self._cache_put(headline, summary, verdict, scored_by)
+            else:
+                self._count('batch_fallbacks')
+                logger.debug(f"Batch verdict missing for [{index}], returning for single scoring: {headline[:50]}...")
+                results[i] = None
+
+        logger.debug(f"DSPy batch analysis: {len(verdicts)}/{len(misses)} parsed from batch")
+        return results
+
+    def _parse_batch_results(self, raw_results, count):
+        """Разбирает JSON массив пакетного ответа в {index: verdict}"""
+        text = str(raw_results).strip()
+
+        # Модель иногда оборачивает JSON в ```json ... ``` или добавляет текст вокруг
+        match = re.search(r"\[.*\]", text, re.DOTALL)
+        if not match:
+            logger.warning(f"Batch response is not a JSON array: {text[:100]}")
+            return {}
+
+        try:
+            parsed = json.loads(match.group(0))
+        except ValueError as e:
+            logger.warning(f"Batch response JSON invalid: {e}")
+            return {}
+
+        verdicts = {}
+        for entry in parsed:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                index = int(entry.get('index'))
+            except (TypeError, ValueError):
+                continue
+            if not 1 <= index <= count or index in verdicts:
+                continue
+            if entry.get('significance_score') is None:
+                continue
+
+            verdicts[index] = self._parse_verdict(
+                entry.get('significance_score'),
+                entry.get('is_significant'),
+                entry.get('reasoning')
+            )
+
+        return verdicts
@@ -16,8 +16,74 @@ class Config:
     CHECK_INTERVAL_SECONDS = int(os.getenv('CHECK_INTERVAL_SECONDS', '5'))
     SKIP_NEWS_OLDER_HOURS = int(os.getenv('SKIP_NEWS_OLDER_HOURS', '24'))
     MAX_NEWS_PER_CHECK = int(os.getenv('MAX_NEWS_PER_CHECK', '20'))
+
+    # Интервалы опроса вне основной сессии (ET), секунды
+    POLL_INTERVAL_PREMARKET = int(os.getenv('POLL_INTERVAL_PREMARKET', '30'))
+    POLL_INTERVAL_AFTERHOURS = int(os.getenv('POLL_INTERVAL_AFTERHOURS', '60'))
+    POLL_INTERVAL_OVERNIGHT = int(os.getenv('POLL_INTERVAL_OVERNIGHT', '300'))
+    POLL_INTERVAL_WEEKEND = int(os.getenv('POLL_INTERVAL_WEEKEND', '900'))
+
+    # Фазы с LLM оценкой в реальном времени; в остальных новости только копятся в news_raw
+    LIVE_SCORING_PHASES = [p.strip() for p in os.getenv('LIVE_SCORING_PHASES', 'premarket,regular,afterhours').split(',') if p.strip()]
+    BACKLOG_MAX_ITEMS = int(os.getenv('BACKLOG_MAX_ITEMS', '2000'))
+    BACKLOG_LLM_BATCH_SIZE = int(os.getenv('BACKLOG_LLM_BATCH_SIZE', '5'))  # Пачки для оценки накопленного
+    RAW_RETENTION_DAYS = int(os.getenv('RAW_RETENTION_DAYS', '7'))
+
+    # Очередь на LLM оценку: новость отбрасывается, когда прошли все волны до PRIORITY_MAX_WAVE
+    PRIORITY_MAX_WAVE = int(os.getenv('PRIORITY_MAX_WAVE', '4'))
+    PRIORITY_KEYWORDS = [k.strip() for k in os.getenv(
+        'PRIORITY_KEYWORDS', 'fed,fomc,cpi,payrolls,merger,acquisition,earnings,guidance,bankruptcy,tariffs'
+    ).split(',') if k.strip()]
+    PRIORITY_KEYWORD_BOOST_MINUTES = int(os.getenv('PRIORITY_KEYWORD_BOOST_MINUTES', '15'))  # Считать новость на N минут свежее
+
+    # Волновые интервалы (в минутах), как в signal_extractor
+    WAVE_INTERVALS = {
+        0: (0, 5),      # 0-5 минут - HFT алгоритмы
+        1: (5, 30),     # 5-30 минут - Smart money
+        2: (30, 120),   # 30-120 минут - Институционалы
+        3: (120, 360),  # 2-6 часов - Информированный retail
+        4: (360, 1440), # 6-24 часа - Массовый retail
+        5: (1440, 4320), # 1-3 дня - Переоценка
+        6: (4320, 10080), # 3-7 дней - Фундаментальный сдвиг
+    }
+
+    # Источники новостей
+    # По умолчанию только general: каждая категория - запрос за цикл из общего бюджета Finnhub,
+    # лишние категории отъедают его у company-news. merger,forex,crypto - по желанию
+    NEWS_CATEGORIES = [c.strip() for c in os.getenv('NEWS_CATEGORIES', 'general').split(',') if c.strip()]
+    COMPANY_NEWS_WATCHLIST = [t.strip().upper() for t in os.getenv('COMPANY_NEWS_WATCHLIST', '').split(',') if t.strip()]
+    COMPANY_NEWS_ACTIVE_POSITIONS = os.getenv('COMPANY_NEWS_ACTIVE_POSITIONS', 'true').lower() == 'true'
+    COMPANY_NEWS_REFRESH_SECONDS = int(os.getenv('COMPANY_NEWS_REFRESH_SECONDS', '300'))
+    FILE_DROP_DIR = os.getenv('FILE_DROP_DIR', '')  # Каталог с JSON новостями для тестов
+    FINNHUB_CALLS_PER_MINUTE = int(os.getenv('FINNHUB_CALLS_PER_MINUTE', '60'))
+
     LLM_MODEL = os.getenv('LLM_MODEL', 'anthropic/claude-3.7-sonnet')  # Upgraded for better news analysis
     LLM_TEMPERATURE = float(os.getenv('LLM_TEMPERATURE', '0.3'))
+    LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '5'))  # Одновременных LLM запросов
+    LLM_CALL_TIMEOUT_SECONDS = int(os.getenv('LLM_CALL_TIMEOUT_SECONDS', '30'))
+    LLM_BATCH_SIZE = int(os.getenv('LLM_BATCH_SIZE', '1'))  # >1 - несколько новостей в одном запросе
+    LLM_STREAMING = os.getenv('LLM_STREAMING', 'false').lower() == 'true'  # Ранний вердикт до окончания reasoning
+    LLM_CHEAP_MODEL = os.getenv('LLM_CHEAP_MODEL', '')  # Первая ступень каскада, пусто - без каскада
+    CASCADE_BAND_LOW = int(os.getenv('CASCADE_BAND_LOW', '45'))  # Оценки дешёвой модели в полосе перепроверяет LLM_MODEL
+    CASCADE_BAND_HIGH = int(os.getenv('CASCADE_BAND_HIGH', '75'))
+    SEEN_IDS_CAPACITY = int(os.getenv('SEEN_IDS_CAPACITY', '5000'))  # id новостей в памяти для проверки дубликатов
+    NEAR_DUP_WINDOW_HOURS = int(os.getenv('NEAR_DUP_WINDOW_HOURS', '6'))
+    NEAR_DUP_MAX_DISTANCE = int(os.getenv('NEAR_DUP_MAX_DISTANCE', '3'))  # Бит SimHash, < 4
+    # Выключен, пока модель не обучена на реальных вердиктах LLM
+    PREFILTER_ENABLED = os.getenv('PREFILTER_ENABLED', 'false').lower() == 'true'
+    PREFILTER_MIN_PROBABILITY = float(os.getenv('PREFILTER_MIN_PROBABILITY', '0.15'))  # Ниже - без LLM
+    PREFILTER_LABEL_SCORE = int(os.getenv('PREFILTER_LABEL_SCORE', '40'))
+    PREFILTER_MIN_TRAINING_ROWS = int(os.getenv('PREFILTER_MIN_TRAINING_ROWS', '200'))
+    PREFILTER_TRAINING_DAYS = int(os.getenv('PREFILTER_TRAINING_DAYS', '30'))
+    PREFILTER_RETRAIN_HOURS = int(os.getenv('PREFILTER_RETRAIN_HOURS', '24'))
+    PREFILTER_AUDIT_RATE = float(os.getenv('PREFILTER_AUDIT_RATE', '0.05'))  # Доля отклонённых для проверки recall
+    VERDICT_CACHE_ENABLED = os.getenv('VERDICT_CACHE_ENABLED', 'true').lower() == 'true'
+    VERDICT_CACHE_TTL_HOURS = int(os.getenv('VERDICT_CACHE_TTL_HOURS', '72'))
+
+    # Буферизованная запись в news_items
+    WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '20'))
+    WRITE_MAX_LATENCY_SECONDS = float(os.getenv('WRITE_MAX_LATENCY_SECONDS', '2'))
+
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
     def validate(self):
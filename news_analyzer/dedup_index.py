@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate headline index (SimHash + LSH bands) for News Analyzer
+"""
+import hashlib
+import logging
+import re
+from collections import deque
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+# Служебные слова не влияют на отпечаток
+STOP_WORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'with', 'at', 'by',
+    'from', 'as', 'is', 'are', 'was', 'were', 'be', 'its', 'it', 'that', 'this', 'after',
+    'says', 'said', 'amid', 'over', 'into', 'new'
+}
+
+FINGERPRINT_BITS = 64
+BANDS = 4
+BAND_BITS = FINGERPRINT_BITS // BANDS
+
+def _tokens(text):
+    words = re.findall(r"[a-z0-9$%.]+", (text or "").lower())
+    return [w.strip('.') for w in words if w.strip('.') and w.strip('.') not in STOP_WORDS]
+
+def _hash64(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def simhash(headline, summary):
+    """64-битный SimHash: слова и биграммы заголовка весят больше, чем слова summary"""
+    features = {}
+    head = _tokens(headline)
+    for word in head:
+        features[word] = features.get(word, 0) + 3
+    for first, second in zip(head, head[1:]):
+        features[f"{first} {second}"] = features.get(f"{first} {second}", 0) + 2
+    for word in _tokens((summary or "")[:300]):
+        features[word] = features.get(word, 0) + 1
+
+    if not features:
+        return None
+
+    vector = [0] * FINGERPRINT_BITS
+    for feature, weight in features.items():
+        h = _hash64(feature)
+        for bit in range(FINGERPRINT_BITS):
+            vector[bit] += weight if (h >> bit) & 1 else -weight
+
+    fingerprint = 0
+    for bit, value in enumerate(vector):
+        if value > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def _bands(fingerprint):
+    mask = (1 << BAND_BITS) - 1
+    return [(band, (fingerprint >> (band * BAND_BITS)) & mask) for band in range(BANDS)]
+
+class NearDuplicateIndex:
+    def __init__(self, window_hours, max_distance):
+        # При max_distance < BANDS хотя бы одна полоса у дубликатов совпадает целиком,
+        # поэтому поиск по полосам не теряет кандидатов
+        self.window = timedelta(hours=window_hours)
+        self.max_distance = max_distance
+        self.entries = deque()  # (published_at, fingerprint, news_id) по времени добавления
+        self.buckets = {}       # (band, value) -> список записей
+        self.ids = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _prune(self, now):
+        """Удаляет записи старше окна"""
+        cutoff = now - self.window
+        while self.entries and self.entries[0][0] < cutoff:
+            entry = self.entries.popleft()
+            self.ids.discard(entry[2])
+            for key in _bands(entry[1]):
+                bucket = self.buckets.get(key)
+                if bucket:
+                    try:
+                        bucket.remove(entry)
+                    except ValueError:
+                        pass
+                    if not bucket:
+                        del self.buckets[key]
+
+    def find(self, news_id, headline, summary, published_at):
+        """Возвращает news_id канонической новости, если это почти-дубликат в пределах окна"""
+        fingerprint = simhash(headline, summary)
+        if fingerprint is None:
+            return None
+
+        best = None
+        for key in _bands(fingerprint):
+            for entry_time, entry_fp, entry_id in self.buckets.get(key, ()):
+                if entry_id == news_id or abs(published_at - entry_time) > self.window:
+                    continue
+                distance = bin(fingerprint ^ entry_fp).count('1')
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, entry_id)
+
+        return best[1] if best else None
+
+    def add(self, news_id, headline, summary, published_at):
+        """Добавляет новость в индекс как каноническую"""
+        if news_id in self.ids:
+            return
+        fingerprint = simhash(headline, summary)
+        if fingerprint is None:
+            return
+
+        entry = (published_at, fingerprint, news_id)
+        self.entries.append(entry)
+        self.ids.add(news_id)
+        for key in _bands(fingerprint):
+            self.buckets.setdefault(key, []).append(entry)
+
+        self._prune(published_at)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+LLM call accounting for WaveSens services
+Records tokens, latency, cache hits and errors of every LLM call into llm_calls
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.extras
+
+logger = logging.getLogger(__name__)
+
+# Сколько записей держать в lm.history - DSPy сам её не ограничивает
+HISTORY_LIMIT = 200
+
+_local = threading.local()
+
+class _CapturingHistory(list):
+    """lm.history, который дополнительно отдаёт новые записи в текущий track() потока"""
+
+    def append(self, entry):
+        super().append(entry)
+        sink = getattr(_local, 'entries', None)
+        if sink is not None:
+            sink.append(entry)
+        if len(self) > HISTORY_LIMIT:
+            del self[:len(self) - HISTORY_LIMIT]
+
+class LLMCallRecorder:
+    def __init__(self, database_url, service, flush_size=50, flush_seconds=10):
+        self.database_url = database_url
+        self.service = service
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+
+        # Запись в БД в фоне - вызовы LLM не ждут INSERT
+        self.queue = queue.Queue(maxsize=10000)
+        self.conn = None
+        self._seen_responses = deque(maxlen=1000)  # id ответов - повтор означает кеш DSPy
+
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'errors': 0,
+            'cache_hits': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'latency_ms': 0,
+            'cost': 0.0,
+            'dropped': 0
+        }
+
+        self._stop = threading.Event()
+        self.worker = threading.Thread(target=self._writer_loop, name="llm-accounting", daemon=True)
+        self.worker.start()
+
+    def instrument(self, lm):
+        """Подменяет lm.history, чтобы записи DSPy попадали в текущий track()"""
+        if not isinstance(lm.history, _CapturingHistory):
+            lm.history = _CapturingHistory(lm.history[-HISTORY_LIMIT:])
+        return lm
+
+    @contextmanager
+    def track(self, operation, model):
+        """Учитывает один вызов предиктора: все записи lm.history за время блока.
+
+        Отдаёт список этих записей - по нему вызывающий может посчитать стоимость.
+        """
+        previous = getattr(_local, 'entries', None)
+        entries = []
+        _local.entries = entries
+        started = time.monotonic()
+        error_class = None
+        try:
+            yield entries
+        except Exception as e:
+            error_class = type(e).__name__
+            raise
+        finally:
+            _local.entries = previous
+            self._record(operation, model, entries, (time.monotonic() - started) * 1000, error_class)
+
+    def record_cache_hit(self, operation, model):
+        """Вердикт взят из собственного кеша сервиса, LLM не вызывался"""
+        self._enqueue({
+            'operation': operation, 'model': model, 'prompt_tokens': 0, 'completion_tokens': 0,
+            'latency_ms': 0, 'cost': 0.0, 'cache_hit': True, 'error_class': None
+        })
+
+    def _record(self, operation, model, entries, latency_ms, error_class):
+        prompt_tokens = completion_tokens = 0
+        cost = 0.0
+        cache_hit = bool(entries)
+        for entry in entries:
+            usage = entry.get('usage') or {}
+            prompt_tokens += int(usage.get('prompt_tokens') or 0)
+            completion_tokens += int(usage.get('completion_tokens') or 0)
+            cost += float(entry.get('cost') or 0.0)
+            model = entry.get('model') or model
+            cache_hit = cache_hit and self._is_cached(entry)
+
+        self._enqueue({
+            'operation': operation, 'model': model, 'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens, 'latency_ms': int(latency_ms), 'cost': cost,
+            'cache_hit': cache_hit and error_class is None, 'error_class': error_class
+        })
+
+    def _is_cached(self, entry):
+        """Ответ из кеша DSPy/LiteLLM: флаг LiteLLM или уже виденный id ответа"""
+        response = entry.get('response')
+        try:
+            hidden = getattr(response, '_hidden_params', None) or {}
+            if hidden.get('cache_hit'):
+                return True
+            response_id = response.get('id') if hasattr(response, 'get') else None
+        except Exception:
+            return False
+        if not response_id:
+            return False
+        if response_id in self._seen_responses:
+            return True
+        self._seen_responses.append(response_id)
+        return False
+
+    def _enqueue(self, row):
+        with self._stats_lock:
+            self.stats['calls'] += 1
+            self.stats['errors'] += 1 if row['error_class'] else 0
+            self.stats['cache_hits'] += 1 if row['cache_hit'] else 0
+            self.stats['prompt_tokens'] += row['prompt_tokens']
+            self.stats['completion_tokens'] += row['completion_tokens']
+            self.stats['latency_ms'] += row['latency_ms']
+            self.stats['cost'] += row['cost']
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            with self._stats_lock:
+                self.stats['dropped'] += 1
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _connect(self):
+        self.conn = psycopg2.connect(self.database_url)
+        self.conn.autocommit = True
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id BIGSERIAL PRIMARY KEY,
+                service VARCHAR(50) NOT NULL,
+                operation VARCHAR(50) NOT NULL,
+                model VARCHAR(100),
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                latency_ms INTEGER,
+                cost DECIMAL(12,6) DEFAULT 0,
+                cache_hit BOOLEAN DEFAULT FALSE,
+                error_class VARCHAR(100),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_created_at ON llm_calls(created_at)")
+        cursor.close()
+
+    def _flush(self, rows):
+        try:
+            if self.conn is None or self.conn.closed:
+                self._connect()
+            cursor = self.conn.cursor()
+            psycopg2.extras.execute_values(cursor, """
+                INSERT INTO llm_calls (service, operation, model, prompt_tokens, completion_tokens,
+                                       latency_ms, cost, cache_hit, error_class)
+                VALUES %s
+            """, [(self.service, row['operation'], row['model'], row['prompt_tokens'],
+                   row['completion_tokens'], row['latency_ms'], row['cost'],
+                   row['cache_hit'], row['error_class']) for row in rows])
+            cursor.close()
+        except Exception as e:
+            # Учёт не должен мешать основной работе - теряем пачку и переподключаемся
+            logger.error(f"LLM accounting flush failed ({len(rows)} rows): {e}")
+            with self._stats_lock:
+                self.stats['dropped'] += len(rows)
+            if self.conn is not None:
+                try:
+                    self.conn.close()
+                except Exception:
+                    pass
+            self.conn = None
+
+    def _writer_loop(self):
+        rows = []
+        deadline = time.monotonic() + self.flush_seconds
+        while not (self._stop.is_set() and self.queue.empty()):
+            try:
+                rows.append(self.queue.get(timeout=max(0.1, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+
+            if rows and (len(rows) >= self.flush_size or time.monotonic() >= deadline or self._stop.is_set()):
+                self._flush(rows)
+                rows = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_seconds
+
+        if rows:
+            self._flush(rows)
+
+    def close(self, timeout=5):
+        """Дописывает буфер и останавливает фоновый поток"""
+        self._stop.set()
+        self.worker.join(timeout)
@@ -3,9 +3,12 @@
 Main News Analyzer Service
 """
 import time
+import random
+import collections
+import itertools
 import signal
 import sys
-import requests
+import threading
 import logging
 from datetime import datetime, timezone, timedelta
 
@@ -18,7 +21,17 @@ except Exception as e:
 
 from config import Config
 from storage import NewsStorage
-from analyzer import NewsAnalyzer
+from analyzer import NewsAnalyzer, PROMPT_VERSION
+from verdict_cache import VerdictCache
+from scoring_pool import ScoringPool, PartialResult
+from dedup_index import NearDuplicateIndex
+from prefilter import NewsPrefilter
+from sources import (RateBudget, NewsIngester, FinnhubCategorySource,
+                     FinnhubCompanyNewsSource, FileDropSource)
+from news_writer import NewsWriter
+from poll_scheduler import PollScheduler
+from scoring_queue import ScoringQueue
+from llm_accounting import LLMCallRecorder
 
 logger = logging.getLogger(__name__)
 
@@ -27,17 +40,102 @@ class NewsAnalyzerService:
         self.config = Config()
         self.config.validate()
 
-        self.storage = NewsStorage(self.config.DATABASE_URL)
+        self.storage = NewsStorage(self.config.DATABASE_URL, self.config.SEEN_IDS_CAPACITY)
+        # Результаты пишутся пачками: по размеру, по задержке или сразу для значимых
+        self.writer = NewsWriter(
+            self.storage,
+            self.config.WRITE_BATCH_SIZE,
+            self.config.WRITE_MAX_LATENCY_SECONDS,
+            self.on_news_saved
+        )
+
+        # Кеш вердиктов LLM по содержимому новости
+        self.verdict_cache = None
+        if self.config.VERDICT_CACHE_ENABLED:
+            self.verdict_cache = VerdictCache(
+                self.config.DATABASE_URL,
+                self.config.LLM_MODEL,
+                PROMPT_VERSION,
+                self.config.VERDICT_CACHE_TTL_HOURS
+            )
+
+        # Локальный префильтр: отсекает явно нерелевантное и подменяет LLM при недоступности
+        self.prefilter = NewsPrefilter(
+            self.config.PREFILTER_LABEL_SCORE,
+            self.config.PREFILTER_MIN_PROBABILITY,
+            self.config.PREFILTER_MIN_TRAINING_ROWS
+        )
+        self.last_prefilter_training = None
+        self.train_prefilter()
+
+        # Токены, задержка и ошибки каждого вызова LLM - в таблицу llm_calls
+        self.llm_recorder = LLMCallRecorder(self.config.DATABASE_URL, "news_analyzer")
+
         self.analyzer = NewsAnalyzer(
             self.config.OPENROUTER_API_KEY,
             self.config.LLM_MODEL,
-            self.config.LLM_TEMPERATURE
+            self.config.LLM_TEMPERATURE,
+            cache=self.verdict_cache,
+            fallback_scorer=self.prefilter,
+            recorder=self.llm_recorder,
+            streaming=self.config.LLM_STREAMING,
+            cheap_model_name=self.config.LLM_CHEAP_MODEL,
+            escalation_band=(self.config.CASCADE_BAND_LOW, self.config.CASCADE_BAND_HIGH),
+            timeout_seconds=self.config.LLM_CALL_TIMEOUT_SECONDS
+        )
+        # В потоковом режиме пул отдаёт ранний вердикт до завершения вызова
+        self.scoring_pool = ScoringPool(
+            self.score_news_chunk,
+            self.config.LLM_CONCURRENCY,
+            self.config.LLM_CALL_TIMEOUT_SECONDS,
+            early_results=self.config.LLM_STREAMING
+        )
+
+        # Индекс почти-дубликатов, прогреваем из news_items
+        self.dedup_index = NearDuplicateIndex(
+            self.config.NEAR_DUP_WINDOW_HOURS,
+            self.config.NEAR_DUP_MAX_DISTANCE
+        )
+        self.seed_dedup_index()
+
+        # Источники новостей с общим бюджетом запросов к Finnhub
+        self.rate_budget = RateBudget(self.config.FINNHUB_CALLS_PER_MINUTE)
+        self.ingester = NewsIngester(self.build_sources())
+
+        # Очередь на LLM оценку: свежие новости первыми, устаревшие для всех волн отбрасываются
+        self.scoring_queue = ScoringQueue(
+            self.config.WAVE_INTERVALS,
+            self.config.PRIORITY_MAX_WAVE,
+            self.config.PRIORITY_KEYWORDS,
+            self.config.PRIORITY_KEYWORD_BOOST_MINUTES,
+            on_drop=self.save_unscored
         )
 
+        # Интервал опроса: фаза сессии (ET), интенсивность новостей и остаток квоты
+        self.poll_scheduler = PollScheduler(
+            {
+                'regular': self.config.CHECK_INTERVAL_SECONDS,
+                'premarket': self.config.POLL_INTERVAL_PREMARKET,
+                'afterhours': self.config.POLL_INTERVAL_AFTERHOURS,
+                'overnight': self.config.POLL_INTERVAL_OVERNIGHT,
+                'weekend': self.config.POLL_INTERVAL_WEEKEND
+            },
+            calls_per_poll=len(self.config.NEWS_CATEGORIES),
+            calls_per_minute=self.config.FINNHUB_CALLS_PER_MINUTE,
+            budget=self.rate_budget
+        )
+
+        # Накопленное вне сессии оцениваем при входе в фазу живой оценки (и после рестарта)
+        self.backlog_pending = True
+
         self.running = True
+        self.stop_event = threading.Event()
         self.stats = {
             'checks': 0,
             'news_processed': 0,
+            'near_duplicates': 0,
+            'raw_landed': 0,
+            'prefilter_rejected': 0,
             'significant_found': 0,
             'llm_calls': 0,
             'errors': 0,
@@ -49,20 +147,24 @@ class NewsAnalyzerService:
         signal.signal(signal.SIGTERM, self.shutdown)
 
     def is_market_open(self):
-        """Проверка открытости рынков (пн-пт 9:30-16:00 EST)"""
-        from zoneinfo import ZoneInfo
-        ny_tz = ZoneInfo('America/New_York')
-        now = datetime.now(ny_tz)
-
-        # Выходные - рынок закрыт
-        if now.weekday() >= 5:  # Суббота = 5, Воскресенье = 6
-            return False
-
-        # Проверка времени (9:30 - 16:00 EST)
-        market_open = now.replace(hour=9, minute=30, second=0, microsecond=0)
-        market_close = now.replace(hour=16, minute=0, second=0, microsecond=0)
-
-        return market_open <= now <= market_close
+        """Проверка открытости рынков (пн-пт 9:30-16:00 ET)"""
+        return self.poll_scheduler.phase() == 'regular'
+
+    def seed_dedup_index(self):
+        """Загружает недавние новости в индекс почти-дубликатов"""
+        recent = self.storage.get_recent_news(self.config.NEAR_DUP_WINDOW_HOURS)
+        for row in recent:
+            published_at = row['published_at']
+            if published_at.tzinfo is None:
+                published_at = published_at.replace(tzinfo=timezone.utc)
+            self.dedup_index.add(row['news_id'], row['headline'], row['summary'], published_at)
+        logger.info(f"Near-duplicate index seeded with {len(self.dedup_index)} news")
+
+    def train_prefilter(self):
+        """Обучает префильтр на оценках LLM из news_items"""
+        rows = self.storage.get_training_news(self.config.PREFILTER_TRAINING_DAYS, 20000)
+        self.prefilter.train(rows)
+        self.last_prefilter_training = datetime.now()
 
     def shutdown(self, signum, frame):
         """Graceful shutdown"""
@@ -71,28 +173,38 @@ class NewsAnalyzerService:
         significant = self.stats['significant_found']
         logger.info(f"Final stats: processed {total_processed} news, found {significant} significant")
         self.running = False
-
-    def fetch_finnhub_news(self):
-        """Получение новостей из Finnhub"""
-        try:
-            url = "https://finnhub.io/api/v1/news"
-            params = {
-                'category': 'general',
-                'token': self.config.FINNHUB_API_KEY
-            }
-
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
-
-            news_items = response.json()
-            logger.debug(f"Got {len(news_items)} news items")
-
-            return news_items[:self.config.MAX_NEWS_PER_CHECK]
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Finnhub API error: {e}")
-            self.stats['errors'] += 1
-            return []
+        self.stop_event.set()
+
+    def get_company_news_tickers(self):
+        """Тикеры для company-news: активные позиции и watchlist"""
+        tickers = set(self.config.COMPANY_NEWS_WATCHLIST)
+        if self.config.COMPANY_NEWS_ACTIVE_POSITIONS:
+            tickers.update(self.storage.get_active_tickers())
+        return sorted(tickers)
+
+    def build_sources(self):
+        """Собирает источники новостей по конфигурации"""
+        sources = []
+        for category in self.config.NEWS_CATEGORIES:
+            # Для general курсор продолжаем с последней сохранённой новости
+            initial_cursor = self.storage.get_max_finnhub_id() if category == 'general' else 0
+            sources.append(FinnhubCategorySource(
+                self.config.FINNHUB_API_KEY, category, self.rate_budget, initial_cursor
+            ))
+
+        if self.config.COMPANY_NEWS_WATCHLIST or self.config.COMPANY_NEWS_ACTIVE_POSITIONS:
+            sources.append(FinnhubCompanyNewsSource(
+                self.config.FINNHUB_API_KEY,
+                self.get_company_news_tickers,
+                self.rate_budget,
+                self.config.COMPANY_NEWS_REFRESH_SECONDS
+            ))
+
+        if self.config.FILE_DROP_DIR:
+            sources.append(FileDropSource(self.config.FILE_DROP_DIR))
+
+        logger.info(f"News sources: {', '.join(source.name for source in sources)}")
+        return sources
 
     def is_news_too_old(self, published_timestamp):
         """Проверка возраста новости"""
@@ -100,68 +212,252 @@ class NewsAnalyzerService:
         cutoff_time = datetime.now(timezone.utc) - timedelta(hours=self.config.SKIP_NEWS_OLDER_HOURS)
         return news_time < cutoff_time
 
-    def process_news_item(self, item):
-        """Обработка одной новости"""
-        try:
-            # Извлекаем данные
-            news_id = f"finnhub:{item['id']}"
-            headline = item.get('headline', '')
-            summary = item.get('summary', '')
-            url = item.get('url', '')
-            published_at = datetime.fromtimestamp(item['datetime'], tz=timezone.utc)
-
-            # ВРЕМЕННЫЙ DEBUG - проверим первые 3 новости подробно
-            if news_id in ['finnhub:7520222', 'finnhub:7520221', 'finnhub:7520218']:
-                hours_old = (datetime.now(timezone.utc) - published_at).total_seconds() / 3600
-                logger.info(f"🔍 DEBUG {news_id}: age={hours_old:.1f}h, published={published_at}")
-                dup_result = self.storage.is_duplicate(news_id)
-                logger.info(f"🔍 DEBUG {news_id}: duplicate_check={dup_result}")
-                if not dup_result:
-                    logger.info(f"🔍 DEBUG {news_id}: SHOULD BE NEW! Processing...")
-
-            # Проверки
-            if self.storage.is_duplicate(news_id):
-                logger.debug(f"Skipping duplicate: {news_id} already processed")
-                return
-
-            if self.is_news_too_old(item['datetime']):
-                hours_old = (datetime.now(timezone.utc) - published_at).total_seconds() / 3600
-                logger.debug(f"Skipping old news ({hours_old:.0f} hours): {headline[:50]}...")
-                return
-
-            logger.debug(f"Processing: {headline[:50]}...")
-
-            # LLM анализ
-            score, is_significant, reasoning = self.analyzer.analyze(headline, summary)
-            self.stats['llm_calls'] += 1
-
-            logger.debug(f"LLM response: score={score}, reasoning={reasoning[:50]}...")
-
-            # Сохранение в БД
-            success = self.storage.save_news(
-                news_id, headline, summary, url, published_at,
-                score, reasoning, is_significant
-            )
+    def prepare_news_item(self, news):
+        """Отсекает старые новости и почти-дубликаты до LLM анализа"""
+        news_id = news['news_id']
+        headline = news['headline']
+        published_at = news['published_at']
+
+        if self.is_news_too_old(published_at.timestamp()):
+            hours_old = (datetime.now(timezone.utc) - published_at).total_seconds() / 3600
+            logger.debug(f"Skipping old news ({hours_old:.0f} hours): {headline[:50]}...")
+            # Запоминаем, чтобы не проверять её в БД на каждом опросе
+            self.storage.mark_seen(news_id)
+            return None
+
+        # Копии одного события от разных агентств в LLM не отправляем
+        canonical_id = self.dedup_index.find(news_id, headline, news['summary'], published_at)
+        if canonical_id:
+            self.save_near_duplicate(news, canonical_id)
+            return None
+
+        self.dedup_index.add(news_id, headline, news['summary'], published_at)
+        return news
+
+    def score_news_chunk(self, chunk, notify_early=None):
+        """LLM анализ пачки новостей из очереди (выполняется в потоке пула)"""
+        news_list = [entry['news'] for entry in chunk]
+        for news in news_list:
+            logger.debug(f"Processing: {news['headline'][:50]}...")
+
+        on_early = None
+        if notify_early is not None:
+            on_early = lambda index, score, is_significant: notify_early((index, score, is_significant))
+        return self.analyzer.analyze_batch([(news['headline'], news['summary']) for news in news_list], on_early=on_early)
+
+    @staticmethod
+    def news_row(news, score, reasoning, is_significant, duplicate_of=None, scored_by=None):
+        """Строка news_items для буферизованной записи"""
+        return {
+            'news_id': news['news_id'],
+            'headline': news['headline'],
+            'summary': news['summary'],
+            'url': news['url'],
+            'published_at': news['published_at'],
+            'significance_score': score,
+            'reasoning': reasoning,
+            'is_significant': is_significant,
+            'duplicate_of': duplicate_of,
+            'scored_by': scored_by
+        }
 
-            # ВРЕМЕННЫЙ DEBUG для первых 3 новостей
-            if news_id in ['finnhub:7520222', 'finnhub:7520221', 'finnhub:7520218']:
-                logger.info(f"🔍 DEBUG {news_id}: save_success={success}, score={score}, significant={is_significant}")
-                logger.info(f"🔍 DEBUG {news_id}: headline='{headline[:100]}'")
+    def save_scored_news(self, news, score, is_significant, reasoning, scored_by):
+        """Ставит результат анализа в очередь записи; значимые пишутся сразу"""
+        logger.debug(f"LLM response: score={score}, scored_by={scored_by}, reasoning={reasoning[:50]}...")
 
-            if success:
-                self.stats['news_processed'] += 1
-                if is_significant:
-                    self.stats['significant_found'] += 1
-                    logger.info(f"📰 SIGNIFICANT [{score}]: {headline[:80]}...")
-                else:
-                    logger.debug(f"Not significant [{score}]: {headline[:50]}...")
-            else:
-                self.stats['errors'] += 1
-                logger.error(f"❌ Failed to save {news_id}: {headline[:50]}...")
+        # Отклонённые префильтром, но проверенные LLM - для оценки recall префильтра
+        if news.get('prefilter_audit') and scored_by.startswith('llm'):
+            scored_by = 'llm_audit'
+
+        if news.get('early_saved'):
+            self.complete_early_verdict(news, score, is_significant, reasoning, scored_by)
+            return
 
-        except Exception as e:
-            logger.error(f"Processing failed for news item: {e}")
+        self.writer.add(
+            self.news_row(news, score, reasoning, is_significant, scored_by=scored_by),
+            meta='scored', urgent=is_significant
+        )
+
+    def save_early_verdict(self, news, score):
+        """Значимая по раннему вердикту новость пишется сразу - NOTIFY уходит до конца reasoning"""
+        news['early_saved'] = True
+        self.writer.add(
+            self.news_row(news, score, "Reasoning pending (early streamed verdict)", True, scored_by='llm'),
+            meta='scored', urgent=True
+        )
+
+    def complete_early_verdict(self, news, score, is_significant, reasoning, scored_by):
+        """Дописывает reasoning к новости, сохранённой по раннему вердикту.
+
+        Если финальный вердикт снял значимость, отменяем сигналы, уже созданные по раннему.
+        """
+        fields = {'significance_score': score, 'reasoning': reasoning,
+                  'is_significant': is_significant, 'scored_by': scored_by}
+        if self.writer.update_pending(news['news_id'], **fields):
+            # Строка ещё не записана - NOTIFY не уходил, отменять нечего
+            return
+        if not self.storage.update_news_verdict(news['news_id'], score, reasoning, is_significant, scored_by):
             self.stats['errors'] += 1
+            logger.error(f"❌ Failed to complete early verdict for {news['news_id']}")
+            return
+
+        if not is_significant:
+            rejected = self.storage.retract_significance(news['news_id'])
+            logger.warning(f"Final verdict retracted early significance ({scored_by}, score={score}), "
+                           f"{rejected} pending signals rejected: {news['headline'][:50]}...")
+
+    def save_near_duplicate(self, news, canonical_id):
+        """Сохраняет почти-дубликат со ссылкой на каноническую новость, без LLM и без сигналов"""
+        self.writer.add(
+            self.news_row(news, None, f"Near-duplicate of {canonical_id}", False, duplicate_of=canonical_id),
+            meta='near_duplicate'
+        )
+        logger.debug(f"Near-duplicate of {canonical_id}: {news['headline'][:50]}...")
+
+    def save_prefilter_rejected(self, news, probability):
+        """Сохраняет новость, отсечённую префильтром, с локальной оценкой вместо LLM"""
+        score = self.prefilter.estimate_score(probability)
+        reasoning = f"Rejected by local prefilter (p={probability:.2f} < {self.config.PREFILTER_MIN_PROBABILITY})"
+        self.writer.add(self.news_row(news, score, reasoning, False, scored_by='prefilter'), meta='prefilter')
+        logger.debug(f"Prefilter rejected (p={probability:.2f}): {news['headline'][:50]}...")
+
+    def save_unscored(self, news, reason):
+        """Новость ушла из очереди без оценки LLM: пишем с терминальным scored_by, не значимой.
+
+        Иначе get_unscored_raw поднимала бы её снова, а почти-дубликаты ссылались бы на несуществующую строку.
+        """
+        reasoning = ("Not scored: all useful waves passed while queued" if reason == 'expired'
+                     else "Not scored: LLM scoring failed repeatedly")
+        self.writer.add(self.news_row(news, None, reasoning, False, scored_by=reason), meta='unscored')
+
+    def on_news_saved(self, row, kind, inserted):
+        """Учёт записанных строк; повторная вставка (inserted=False) не считается ошибкой"""
+        if not inserted:
+            logger.debug(f"Already stored, skipped: {row['news_id']}")
+            return
+
+        if kind == 'near_duplicate':
+            self.stats['near_duplicates'] += 1
+        elif kind == 'prefilter':
+            self.stats['prefilter_rejected'] += 1
+        elif kind == 'unscored':
+            logger.debug(f"Stored unscored ({row['scored_by']}): {row['headline'][:50]}...")
+        else:
+            self.stats['news_processed'] += 1
+            if row['is_significant']:
+                self.stats['significant_found'] += 1
+                logger.info(f"📰 SIGNIFICANT [{row['significance_score']}]: {row['headline'][:80]}...")
+            else:
+                logger.debug(f"Not significant [{row['significance_score']}]: {row['headline'][:50]}...")
+
+    def apply_prefilter(self, candidates):
+        """Оставляет для LLM только правдоподобно значимые новости"""
+        if not self.config.PREFILTER_ENABLED:
+            return candidates
+
+        passed = []
+        for news in candidates:
+            plausible, probability = self.prefilter.should_score(news['headline'], news['summary'])
+            if plausible:
+                passed.append(news)
+            elif random.random() < self.config.PREFILTER_AUDIT_RATE:
+                # Часть отклонённых всё равно оцениваем LLM, чтобы видеть пропуски префильтра
+                news['prefilter_audit'] = True
+                passed.append(news)
+            else:
+                self.save_prefilter_rejected(news, probability)
+        return passed
+
+    def enqueue_news(self, news_items):
+        """Проверки до LLM (дубликаты, возраст, почти-дубликаты, префильтр) и постановка в очередь"""
+        # Один запрос к БД на всю пачку - для id, которых нет в памяти
+        new_ids = self.storage.filter_new_ids([news['news_id'] for news in news_items])
+
+        candidates = []
+        for news in news_items:
+            if news['news_id'] not in new_ids:
+                logger.debug(f"Skipping duplicate: {news['news_id']} already processed")
+                continue
+            news = self.prepare_news_item(news)
+            if news:
+                candidates.append(news)
+
+        for news in self.apply_prefilter(candidates):
+            self.scoring_queue.push(news)
+
+    def drain_scoring_queue(self, max_items=None, batch_size=None):
+        """Параллельный LLM анализ из очереди: каждая следующая пачка - самые свежие новости на момент отправки"""
+        # При LLM_BATCH_SIZE > 1 несколько новостей оцениваются одним запросом
+        batch_size = max(1, batch_size or self.config.LLM_BATCH_SIZE)
+
+        # Новости, пропущенные в пакетном ответе, - отдельными задачами пула впереди новых пачек
+        singles = collections.deque()
+
+        def chunks():
+            for batch in self.scoring_queue.batches(batch_size, max_items):
+                while singles:
+                    yield [singles.popleft()]
+                yield batch
+
+        # Результаты пишем по мере готовности, а не в порядке очереди
+        pending = itertools.takewhile(lambda _: self.running, chunks())
+        while True:
+            self.score_chunks(pending, singles)
+            # Пропуски из последних пачек - когда очередь уже исчерпана
+            if not singles or not self.running:
+                break
+            pending = [[singles.popleft()] for _ in range(len(singles))]
+
+        # Перед паузой опроса буфер не держим
+        self.writer.flush()
+
+    def score_chunks(self, chunks, singles):
+        """Прогоняет пачки через пул и сохраняет результаты; пропуски пакетного ответа - в singles"""
+        for chunk, results in self.scoring_pool.score(chunks):
+            if isinstance(results, PartialResult):
+                index, score, is_significant = results.payload
+                if is_significant:
+                    self.save_early_verdict(chunk[index]['news'], score)
+                continue
+
+            if results is None:
+                self.stats['errors'] += len(chunk)
+                logger.warning(f"LLM scoring gave no result for {len(chunk)} news, requeued")
+                for entry in chunk:
+                    self.scoring_queue.requeue(entry)
+                continue
+
+            for entry, result in zip(chunk, results):
+                if result is None:
+                    singles.append(entry)
+                    continue
+                self.stats['llm_calls'] += 1
+                try:
+                    self.save_scored_news(entry['news'], *result)
+                except Exception as e:
+                    logger.error(f"Processing failed for news item: {e}")
+                    self.stats['errors'] += 1
+
+            self.writer.flush_if_stale()
+
+    def score_raw_backlog(self):
+        """Пред-открытие: оценивает накопленные вне сессии сырые новости параллельно"""
+        backlog = self.storage.get_unscored_raw(self.config.SKIP_NEWS_OLDER_HOURS, self.config.BACKLOG_MAX_ITEMS)
+        if not backlog:
+            logger.info("Raw backlog: nothing to score")
+            return
+
+        started = datetime.now()
+        processed_before = self.stats['news_processed']
+        logger.info(f"Raw backlog: scoring {len(backlog)} news collected off-hours")
+
+        # Очередь целиком - пул загружен полностью, задержка отдельной новости не важна
+        self.enqueue_news(backlog)
+        self.drain_scoring_queue(batch_size=self.config.BACKLOG_LLM_BATCH_SIZE)
+
+        elapsed = (datetime.now() - started).total_seconds()
+        logger.info(f"Raw backlog done in {elapsed:.0f}s: {self.stats['news_processed'] - processed_before} scored, "
+                    f"{len(self.scoring_queue)} left in queue")
 
     def log_hourly_stats(self):
         """Логирование статистики каждый час"""
@@ -172,20 +468,56 @@ class NewsAnalyzerService:
         percentage = (db_stats['significant'] / max(db_stats['total'], 1)) * 100
 
         logger.info("📊 Hourly stats:")
-        logger.info(f"  Checks: {self.stats['checks']}")
+        logger.info(f"  Checks: {self.stats['checks']} (phase {self.poll_scheduler.current_phase}, "
+                    f"interval {self.poll_scheduler.last_interval or 0:.0f}s, "
+                    f"~{self.poll_scheduler.arrival_rate or 0:.1f} news/min)")
         logger.info(f"  News processed: {db_stats['total']}")
         logger.info(f"  Significant: {db_stats['significant']} ({percentage:.1f}%)")
         logger.info(f"  LLM calls: {self.stats['llm_calls']}")
-        logger.info(f"  LLM tokens used: ~{self.stats['llm_calls'] * 200:,}")
+        for source_name, source_stats in self.ingester.stats.items():
+            logger.info(f"  Source {source_name}: {source_stats['fetched']} fetched, {source_stats['errors']} errors")
+        logger.info(f"  Raw news landed: {self.stats['raw_landed']}")
+        logger.info(f"  Near-duplicates skipped: {self.stats['near_duplicates']}")
+        logger.info(f"  Prefilter rejected: {self.stats['prefilter_rejected']} "
+                    f"({self.prefilter.stats['checked']} checked, trained on {self.prefilter.trained_rows})")
+        logger.info(f"  LLM timeouts: {self.scoring_pool.stats['timeouts']}")
+        queue_metrics = self.scoring_queue.get_metrics()
+        logger.info(f"  Scoring queue: depth {queue_metrics['depth']} (max {queue_metrics['max_depth']}), "
+                    f"wait avg {queue_metrics['avg_wait_seconds']:.1f}s / max {queue_metrics['max_wait_seconds']:.1f}s, "
+                    f"{queue_metrics['expired']} expired, {queue_metrics['gave_up']} gave up")
+        self.scoring_queue.reset_wait_stats()
+        writer_stats = self.writer.stats
+        logger.info(f"  DB writes: {writer_stats['flushes']} flushes, {writer_stats['inserted']} inserted, "
+                    f"{writer_stats['conflicts']} already stored, {writer_stats['failed_flushes']} failed")
+        analyzer_stats = self.analyzer.stats
+        logger.info(f"  LLM requests: {analyzer_stats['requests']} single ({analyzer_stats['streamed']} streamed, "
+                    f"{analyzer_stats['early_verdicts']} early verdicts), "
+                    f"{analyzer_stats['batch_requests']} batch ({analyzer_stats['batch_items']} news, "
+                    f"{analyzer_stats['batch_fallbacks']} fell back to single)")
+        if self.config.LLM_CHEAP_MODEL:
+            logger.info(f"  Cascade: {analyzer_stats['cascade_cheap_only']} cheap only, "
+                        f"{analyzer_stats['cascade_escalated']} escalated "
+                        f"({analyzer_stats['cascade_flipped']} changed significance)")
+        if self.verdict_cache:
+            cache_stats = self.verdict_cache.get_stats()
+            logger.info(f"  Verdict cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                        f"({cache_stats['hit_rate']:.1f}% hit rate), {cache_stats['errors']} errors")
+            self.verdict_cache.purge_expired()
+        self.storage.purge_raw(self.config.RAW_RETENTION_DAYS)
+        llm_usage = self.llm_recorder.get_stats()
+        avg_latency = llm_usage['latency_ms'] / max(llm_usage['calls'] - llm_usage['cache_hits'], 1)
+        logger.info(f"  LLM tokens used: {llm_usage['prompt_tokens']:,} prompt + {llm_usage['completion_tokens']:,} completion "
+                    f"(${llm_usage['cost']:.4f}), avg latency {avg_latency:.0f}ms, {llm_usage['errors']} errors")
         logger.info(f"  Errors: {self.stats['errors']}")
         logger.info(f"  Uptime: {uptime_str}")
 
     def run(self):
         """Основной цикл"""
         logger.info("Starting News Analyzer")
-        logger.info(f"Config: threshold={self.config.SIGNIFICANCE_THRESHOLD}, interval={self.config.CHECK_INTERVAL_SECONDS}s, model={self.config.LLM_MODEL}")
+        logger.info(f"Config: threshold={self.config.SIGNIFICANCE_THRESHOLD}, interval={self.config.CHECK_INTERVAL_SECONDS}s, model={self.config.LLM_MODEL}, concurrency={self.config.LLM_CONCURRENCY}, batch={self.config.LLM_BATCH_SIZE}")
 
         last_hourly_log = datetime.now()
+        next_poll_at = time.monotonic()
 
         while self.running:
             try:
@@ -194,38 +526,51 @@ class NewsAnalyzerService:
                     self.log_hourly_stats()
                     last_hourly_log = datetime.now()
 
-                # Проверяем состояние рынка на каждой итерации
-                if not self.is_market_open():
-                    from zoneinfo import ZoneInfo
-                    ny_tz = ZoneInfo('America/New_York')
-                    now = datetime.now(ny_tz)
-                    if now.weekday() >= 5:
-                        logger.info(f"🔴 Market closed: Weekend. Sleeping for 1 hour to save tokens...")
-                        time.sleep(3600)  # Спим час в выходные
+                # Периодически переобучаем префильтр на свежих оценках LLM
+                if datetime.now() - self.last_prefilter_training >= timedelta(hours=self.config.PREFILTER_RETRAIN_HOURS):
+                    self.train_prefilter()
+
+                # Опрашиваем во всех фазах сессии, частота зависит от фазы, потока новостей и квоты
+                if time.monotonic() >= next_poll_at:
+                    logger.debug("Fetching news from sources...")
+                    news_items = self.ingester.fetch_all()
+                    self.stats['checks'] += 1
+                    self.poll_scheduler.record_poll(len(news_items))
+
+                    # Все новости сначала попадают в news_raw - ничего не теряется вне сессии
+                    self.stats['raw_landed'] += self.storage.save_raw_batch(news_items)
+
+                    live = self.poll_scheduler.phase() in self.config.LIVE_SCORING_PHASES
+                    if not live:
+                        # Вне сессии только копим, LLM не вызываем
+                        self.backlog_pending = True
                     else:
-                        logger.info(f"🔴 Market closed: Outside trading hours ({now.strftime('%H:%M')} EST). Sleeping for 30 min...")
-                        time.sleep(1800)  # Спим 30 минут в нерабочее время
-                    continue
+                        if self.backlog_pending:
+                            self.backlog_pending = False
+                            self.score_raw_backlog()
+                        self.enqueue_news(news_items)
 
-                # Основная работа только когда рынок открыт
-                logger.debug("Fetching news from Finnhub...")
-                news_items = self.fetch_finnhub_news()
-                self.stats['checks'] += 1
+                    next_poll_at = time.monotonic() + self.poll_scheduler.next_delay()
 
-                for item in news_items:
-                    if not self.running:
-                        break
-                    self.process_news_item(item)
+                # Не больше MAX_NEWS_PER_CHECK за проход - затем снова опрос, чтобы свежие новости обгоняли очередь
+                if self.scoring_queue:
+                    self.drain_scoring_queue(max_items=self.config.MAX_NEWS_PER_CHECK)
 
-                # Пауза
-                time.sleep(self.config.CHECK_INTERVAL_SECONDS)
+                # Пауза до следующего опроса или до границы сессии (если очередь пуста)
+                if not self.scoring_queue:
+                    self.stop_event.wait(max(0.0, next_poll_at - time.monotonic()))
 
             except KeyboardInterrupt:
                 break
             except Exception as e:
                 logger.error(f"Unexpected error in main loop: {e}")
                 self.stats['errors'] += 1
-                time.sleep(self.config.CHECK_INTERVAL_SECONDS)
+                self.stop_event.wait(self.config.CHECK_INTERVAL_SECONDS)
+
+        self.writer.flush()
+        self.scoring_pool.shutdown()
+        self.ingester.shutdown()
+        self.llm_recorder.close()
 
 if __name__ == "__main__":
     service = NewsAnalyzerService()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Buffered news_items writer for News Analyzer - multi-row idempotent inserts
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class NewsWriter:
+    def __init__(self, storage, max_rows, max_latency_seconds, on_saved, max_buffer=1000):
+        # on_saved(row, meta, inserted) вызывается после записи для каждой строки;
+        # inserted=False - новость уже была в БД (гонка или повтор)
+        self.storage = storage
+        self.max_rows = max(1, max_rows)
+        self.max_latency_seconds = max_latency_seconds
+        self.on_saved = on_saved
+        self.max_buffer = max(self.max_rows, max_buffer)
+
+        self.buffer = []         # (row, meta)
+        self.oldest_at = None    # time.monotonic() первой строки в буфере
+        self.stats = {
+            'flushes': 0,
+            'rows': 0,
+            'inserted': 0,
+            'conflicts': 0,
+            'failed_flushes': 0,
+            'dropped': 0
+        }
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def add(self, row, meta=None, urgent=False):
+        """Добавляет строку в буфер. urgent - записать сразу (значимая новость ждёт сигналов)"""
+        if not self.buffer:
+            self.oldest_at = time.monotonic()
+        self.buffer.append((row, meta))
+        # Новость уже обработана - повторно из источников её не берём
+        self.storage.mark_seen(row['news_id'])
+
+        if urgent or len(self.buffer) >= self.max_rows:
+            self.flush()
+        else:
+            self.flush_if_stale()
+
+    def update_pending(self, news_id, **fields):
+        """Обновляет строку, ещё не записанную в БД. False - строки в буфере нет"""
+        for row, _ in self.buffer:
+            if row['news_id'] == news_id:
+                row.update(fields)
+                return True
+        return False
+
+    def flush_if_stale(self):
+        """Записывает буфер, если первая строка ждёт дольше max_latency_seconds"""
+        if self.buffer and time.monotonic() - self.oldest_at >= self.max_latency_seconds:
+            self.flush()
+
+    def flush(self):
+        """Пишет весь буфер одним INSERT. При недоступной БД строки остаются до следующей попытки,
+        строки, которые БД отвергает сами по себе (ограничения, длина полей), отбрасываются"""
+        if not self.buffer:
+            return
+
+        pending = self.buffer
+        inserted = self.storage.save_news_batch([row for row, _ in pending])
+        self.stats['flushes'] += 1
+
+        if inserted is None:
+            self.stats['failed_flushes'] += 1
+            if self.storage.ping():
+                # БД жива - виновата конкретная строка: делим пачку пополам, пока не найдём её
+                inserted, rejected = self._write_bisect(pending)
+                rejected_ids = {id(entry) for entry in rejected}
+                pending = [entry for entry in pending if id(entry) not in rejected_ids]
+            else:
+                # Ограничиваем буфер, чтобы долгий сбой БД не съел память
+                overflow = len(pending) - self.max_buffer
+                if overflow > 0:
+                    logger.error(f"News writer buffer full, dropping {overflow} oldest rows")
+                    self.stats['dropped'] += overflow
+                    self.buffer = pending[overflow:]
+                return
+
+        self.buffer = []
+        self.oldest_at = None
+        self.stats['rows'] += len(pending)
+        self.stats['inserted'] += len(inserted)
+        self.stats['conflicts'] += len(pending) - len(inserted)
+        logger.debug(f"News writer: flushed {len(pending)} rows, {len(inserted)} new")
+
+        for row, meta in pending:
+            try:
+                self.on_saved(row, meta, row['news_id'] in inserted)
+            except Exception as e:
+                logger.error(f"News writer callback failed for {row['news_id']}: {e}")
+
+    def _write_bisect(self, entries):
+        """Пачка не записалась одним INSERT - пишем половинами, пока не останутся отдельные
+        отвергнутые строки. Возвращает (вставленные news_id, отвергнутые строки)"""
+        if len(entries) == 1:
+            row = entries[0][0]
+            logger.error(f"News writer: dropping row {row['news_id']} rejected by database")
+            self.stats['dropped'] += 1
+            return set(), entries
+
+        middle = len(entries) // 2
+        inserted, rejected = set(), []
+        for half in (entries[:middle], entries[middle:]):
+            half_inserted = self.storage.save_news_batch([row for row, _ in half])
+            if half_inserted is None:
+                half_inserted, half_rejected = self._write_bisect(half)
+                rejected.extend(half_rejected)
+            inserted |= half_inserted
+        return inserted, rejected
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Adaptive polling scheduler for News Analyzer - session-aware cadence
+"""
+import logging
+from datetime import datetime, timedelta, time as dtime
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+NY_TZ = ZoneInfo('America/New_York')
+
+# Границы торговой сессии (ET): фаза действует с указанного времени
+SESSION_BOUNDARIES = [
+    (dtime(4, 0), 'premarket'),
+    (dtime(9, 30), 'regular'),
+    (dtime(16, 0), 'afterhours'),
+    (dtime(20, 0), 'overnight'),
+]
+
+class PollScheduler:
+    def __init__(self, phase_intervals, calls_per_poll, calls_per_minute, budget=None, ewma_alpha=0.3):
+        # phase_intervals: фаза -> базовый интервал опроса в секундах
+        self.phase_intervals = phase_intervals
+        self.calls_per_poll = max(1, calls_per_poll)
+        self.calls_per_minute = max(1, calls_per_minute)
+        self.budget = budget
+        self.ewma_alpha = ewma_alpha
+
+        self.arrival_rate = None   # EWMA новых новостей в минуту
+        self.last_poll_at = None
+        self.current_phase = None
+        self.last_interval = None
+
+    def phase(self, now=None):
+        """Фаза сессии: weekend, overnight, premarket, regular, afterhours"""
+        now = (now or datetime.now(NY_TZ)).astimezone(NY_TZ)
+        if now.weekday() >= 5:
+            return 'weekend'
+
+        current = 'overnight'
+        for boundary, name in SESSION_BOUNDARIES:
+            if now.time() >= boundary:
+                current = name
+        # Ночь пятницы относится к выходным
+        if current == 'overnight' and now.weekday() == 4:
+            return 'weekend'
+        return current
+
+    def next_boundary(self, now=None):
+        """Ближайший момент смены фазы"""
+        now = (now or datetime.now(NY_TZ)).astimezone(NY_TZ)
+        current = self.phase(now)
+        candidate = now.replace(second=0, microsecond=0)
+        for day in range(0, 4):
+            date = (now + timedelta(days=day)).date()
+            for boundary, _ in SESSION_BOUNDARIES:
+                candidate = datetime.combine(date, boundary, tzinfo=NY_TZ)
+                if candidate > now and self.phase(candidate) != current:
+                    return candidate
+        return candidate
+
+    def record_poll(self, new_items, now=None):
+        """Обновляет оценку интенсивности потока новостей"""
+        now = now or datetime.now(NY_TZ)
+        if self.last_poll_at is not None:
+            minutes = max((now - self.last_poll_at).total_seconds() / 60, 1 / 60)
+            rate = new_items / minutes
+            if self.arrival_rate is None:
+                self.arrival_rate = rate
+            else:
+                self.arrival_rate = self.ewma_alpha * rate + (1 - self.ewma_alpha) * self.arrival_rate
+        self.last_poll_at = now
+
+    def quota_floor(self):
+        """Минимальный интервал, при котором опрос укладывается в лимит API"""
+        floor = self.calls_per_poll * 60.0 / self.calls_per_minute
+        if self.budget is not None and self.budget.remaining() < self.calls_per_poll:
+            # Бюджет почти исчерпан другими источниками - ждём его восстановления
+            floor *= 2
+        return floor
+
+    def next_delay(self, now=None):
+        """Пауза до следующего опроса в секундах, не позже ближайшей границы сессии"""
+        now = (now or datetime.now(NY_TZ)).astimezone(NY_TZ)
+        phase = self.phase(now)
+        base = self.phase_intervals[phase]
+
+        # Поток новостей ускоряет опрос (до base/2), тишина замедляет (до base*4)
+        if self.arrival_rate is None:
+            interval = base
+        elif self.arrival_rate >= 2.0:
+            interval = base / 2
+        elif self.arrival_rate >= 0.5:
+            interval = base
+        elif self.arrival_rate >= 0.1:
+            interval = base * 2
+        else:
+            interval = base * 4
+        interval = max(interval, self.quota_floor())
+
+        until_boundary = (self.next_boundary(now) - now).total_seconds()
+        delay = max(0.0, min(interval, until_boundary))
+
+        if phase != self.current_phase:
+            logger.info(f"Session phase: {phase} (base interval {base}s, next boundary in {until_boundary / 60:.0f} min)")
+            self.current_phase = phase
+        self.last_interval = delay
+        return delay
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Local pre-filter for News Analyzer - cheap relevance model in front of the LLM
+"""
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+# Стартовые веса (log-odds) - работают и до обучения, и поверх обученной модели
+LEXICON = {
+    # Высокое влияние на рынок
+    'fed': 1.5, 'fomc': 2.0, 'powell': 1.5, 'rate': 0.8, 'rates': 0.8, 'hike': 1.2, 'cut': 0.8,
+    'inflation': 1.5, 'cpi': 2.0, 'ppi': 1.5, 'payrolls': 2.0, 'jobless': 1.5, 'gdp': 1.5,
+    'recession': 1.2, 'tariff': 1.5, 'tariffs': 1.5, 'sanctions': 1.2, 'opec': 1.5,
+    'merger': 2.0, 'acquisition': 2.0, 'acquire': 1.5, 'buyout': 1.5, 'takeover': 1.5,
+    'earnings': 1.5, 'revenue': 1.0, 'guidance': 1.5, 'forecast': 0.8, 'outlook': 0.8,
+    'bankruptcy': 2.0, 'default': 1.2, 'downgrade': 1.2, 'upgrade': 1.0, 'sec': 1.0,
+    'antitrust': 1.5, 'lawsuit': 0.8, 'probe': 1.0, 'recall': 1.0, 'layoffs': 1.0,
+    'ipo': 1.2, 'buyback': 1.2, 'dividend': 0.8, 'plunge': 1.0, 'surge': 1.0, 'crash': 1.2,
+    # Низкое влияние - советы, мнения, lifestyle
+    'tips': -1.5, 'best': -0.8, 'should': -0.8, 'opinion': -1.5, 'review': -1.0,
+    'retirement': -1.0, 'celebrity': -2.0, 'recipe': -2.0, 'travel': -1.0, 'podcast': -1.2,
+    'quiz': -2.0, 'horoscope': -2.0, 'movie': -1.5, 'wedding': -1.5
+}
+
+MAX_LOGIT = 20.0
+
+def _tokens(text):
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    return {w for w in words if len(w) > 1}
+
+class NewsPrefilter:
+    def __init__(self, label_score, min_probability, min_training_rows):
+        # Новость "правдоподобно значима", если LLM дал ей score >= label_score
+        self.label_score = label_score
+        self.min_probability = min_probability
+        self.min_training_rows = min_training_rows
+
+        self.weights = dict(LEXICON)
+        self.prior = 0.0
+        self.trained_rows = 0
+
+        # Средний балл LLM по классам - для перевода вероятности в оценку 0-100
+        self.positive_mean = 60.0
+        self.negative_mean = 15.0
+
+        self.stats = {
+            'checked': 0,
+            'passed': 0,
+            'rejected': 0
+        }
+
+    @property
+    def is_trained(self):
+        return self.trained_rows >= self.min_training_rows
+
+    def train(self, rows):
+        """Обучает Bernoulli naive Bayes по (headline, summary, significance_score) из news_items"""
+        positive_counts, negative_counts = {}, {}
+        positive_docs = negative_docs = 0
+        positive_total = negative_total = 0.0
+
+        for headline, summary, score in rows:
+            if score is None:
+                continue
+            score = float(score)
+            tokens = _tokens(f"{headline} {(summary or '')[:300]}")
+            if score >= self.label_score:
+                positive_docs += 1
+                positive_total += score
+                counts = positive_counts
+            else:
+                negative_docs += 1
+                negative_total += score
+                counts = negative_counts
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+
+        total = positive_docs + negative_docs
+        if total < self.min_training_rows or not positive_docs or not negative_docs:
+            logger.info(f"Prefilter: not enough training data ({positive_docs} positive, "
+                        f"{negative_docs} negative), all news go to LLM")
+            self.trained_rows = 0
+            return
+
+        weights = dict(LEXICON)
+        for token in set(positive_counts) | set(negative_counts):
+            pos = positive_counts.get(token, 0)
+            neg = negative_counts.get(token, 0)
+            if pos + neg < 2:
+                continue  # Редкие слова только шумят
+            weight = (math.log((pos + 1) / (positive_docs + 2))
+                      - math.log((neg + 1) / (negative_docs + 2)))
+            weights[token] = weights.get(token, 0.0) + weight
+
+        self.weights = weights
+        self.prior = math.log((positive_docs + 1) / (negative_docs + 1))
+        self.positive_mean = positive_total / positive_docs
+        self.negative_mean = negative_total / negative_docs
+        self.trained_rows = total
+
+        logger.info(f"Prefilter trained on {total} news ({positive_docs} with score >= {self.label_score}), "
+                    f"{len(weights)} features")
+
+    def probability(self, headline, summary):
+        """Вероятность того, что LLM оценит новость не ниже label_score"""
+        logit = self.prior
+        for token in _tokens(f"{headline} {(summary or '')[:300]}"):
+            logit += self.weights.get(token, 0.0)
+        logit = max(-MAX_LOGIT, min(MAX_LOGIT, logit))
+        return 1.0 / (1.0 + math.exp(-logit))
+
+    def estimate_score(self, probability):
+        """Ожидаемый балл LLM по вероятности класса"""
+        return int(round(probability * self.positive_mean + (1 - probability) * self.negative_mean))
+
+    def should_score(self, headline, summary):
+        """Решает, отправлять ли новость в LLM. Возвращает (passed, probability)"""
+        probability = self.probability(headline, summary)
+        self.stats['checked'] += 1
+
+        # Пока модель не обучена - пропускаем всё, чтобы не терять recall
+        passed = not self.is_trained or probability >= self.min_probability
+        self.stats['passed' if passed else 'rejected'] += 1
+        return passed, probability
+
+    def score(self, headline, summary, reason):
+        """Локальная оценка в формате вердикта LLM - для деградированного режима"""
+        probability = self.probability(headline, summary)
+        score = self.estimate_score(probability)
+        reasoning = f"Local prefilter estimate (p={probability:.2f}): {reason}"
+        return score, score >= 60, reasoning
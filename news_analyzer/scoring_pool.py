@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Bounded-concurrency LLM scoring pool for News Analyzer
+"""
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# Промежуточный результат, отданный score_fn до завершения вызова
+PartialResult = namedtuple('PartialResult', ['payload'])
+
+class ScoringPool:
+    def __init__(self, score_fn, max_workers, timeout_seconds, early_results=False):
+        # score_fn(item) -> результат анализа, вызывается в рабочих потоках.
+        # При early_results=True вызывается как score_fn(item, notify_early):
+        # notify_early(payload) один раз отдаёт промежуточный результат
+        self.score_fn = score_fn
+        self.early_results = early_results
+        self.max_workers = max(1, int(max_workers))
+        self.timeout_seconds = timeout_seconds
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="llm-scoring"
+        )
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'timeouts': 0,
+            'errors': 0
+        }
+
+    def _run(self, item, early):
+        """Выполняется в рабочем потоке"""
+        if early is None:
+            return self.score_fn(item)
+
+        def notify_early(payload):
+            if not early.done():
+                early.set_result(payload)
+
+        return self.score_fn(item, notify_early)
+
+    def score(self, items):
+        """Оценивает items параллельно и отдаёт (item, result) в порядке завершения.
+
+        В полёте не больше max_workers вызовов. Если item не получил результат за
+        timeout_seconds с момента постановки (включая ожидание свободного потока),
+        отдаём (item, None) и больше его не ждём. Сам вызов LLM ограничен таймаутом
+        клиента, поэтому зависший поток освобождается.
+        При early_results промежуточный результат отдаётся как
+        (item, PartialResult(payload)) сразу, до финального (item, result).
+        """
+        pending = iter(items)
+        in_flight = {}  # future -> (item, deadline)
+        early_futures = {}  # future промежуточного результата -> item
+
+        def drop_early(item):
+            for early, early_item in list(early_futures.items()):
+                if early_item is item:
+                    del early_futures[early]
+
+        def submit_next():
+            for item in pending:
+                early = Future() if self.early_results else None
+                future = self.executor.submit(self._run, item, early)
+                in_flight[future] = (item, time.monotonic() + self.timeout_seconds)
+                if early is not None:
+                    early_futures[early] = item
+                self.stats['submitted'] += 1
+                return True
+            return False
+
+        while len(in_flight) < self.max_workers and submit_next():
+            pass
+
+        while in_flight:
+            # Ждём до ближайшего дедлайна
+            wait_for = max(0, min(deadline for _, deadline in in_flight.values()) - time.monotonic())
+
+            done, _ = wait(list(in_flight) + list(early_futures), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            # Промежуточные результаты отдаём раньше финальных
+            for future in [f for f in done if f in early_futures]:
+                yield early_futures.pop(future), PartialResult(future.result())
+
+            for future in done:
+                if future not in in_flight:
+                    continue
+                item, _ = in_flight.pop(future)
+                drop_early(item)
+                try:
+                    result = future.result()
+                    self.stats['completed'] += 1
+                except Exception as e:
+                    logger.error(f"LLM scoring failed: {e}")
+                    self.stats['errors'] += 1
+                    result = None
+                yield item, result
+
+            # Снимаем просроченные: ещё не начатые отменяются, начатые дорабатывают до таймаута клиента
+            now = time.monotonic()
+            for future, (item, deadline) in list(in_flight.items()):
+                if now >= deadline:
+                    in_flight.pop(future)
+                    drop_early(item)
+                    future.cancel()
+                    self.stats['timeouts'] += 1
+                    logger.warning(f"LLM scoring timed out after {self.timeout_seconds}s")
+                    yield item, None
+
+            while len(in_flight) < self.max_workers and submit_next():
+                pass
+
+    def shutdown(self):
+        """Останавливает пул, не дожидаясь зависших вызовов"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Recency-priority work queue between news fetch and LLM scoring
+"""
+import heapq
+import itertools
+import logging
+import re
+import time
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger(__name__)
+
+class ScoringQueue:
+    def __init__(self, wave_intervals, max_wave, keywords, keyword_boost_minutes, max_attempts=3, on_drop=None):
+        # on_drop(news, reason) - новость уходит из очереди без оценки ('expired' / 'gave_up');
+        # вызывающий сохраняет её с терминальным scored_by, иначе она вернётся из news_raw
+        # Новость полезна, пока не закончилось окно последней полезной волны
+        self.useful_window = timedelta(minutes=max(
+            end for wave, (_, end) in wave_intervals.items() if wave <= max_wave
+        ))
+        self.keywords = {k.lower() for k in keywords}
+        self.keyword_boost = timedelta(minutes=keyword_boost_minutes)
+        self.max_attempts = max_attempts
+        self.on_drop = on_drop
+
+        self.heap = []  # (эффективное время публикации со знаком минус, seq, entry)
+        self.ids = set()
+        self._seq = itertools.count()
+        self.stats = {
+            'pushed': 0,
+            'popped': 0,
+            'expired': 0,
+            'gave_up': 0,
+            'max_depth': 0
+        }
+        self.reset_wait_stats()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def reset_wait_stats(self):
+        """Ожидание в очереди за текущий интервал статистики"""
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def has_priority_keyword(self, headline):
+        words = set(re.findall(r"[a-z0-9]+", (headline or "").lower()))
+        return bool(words & self.keywords)
+
+    def push(self, news, attempts=0, enqueued_at=None):
+        """Ставит новость в очередь: свежие и с ключевыми словами - раньше"""
+        if news['news_id'] in self.ids:
+            return
+        if attempts >= self.max_attempts:
+            self.stats['gave_up'] += 1
+            logger.warning(f"Scoring gave up after {attempts} attempts: {news['headline'][:50]}...")
+            self._drop(news, 'gave_up')
+            return
+
+        effective = news['published_at']
+        if self.keyword_boost and self.has_priority_keyword(news['headline']):
+            effective += self.keyword_boost
+
+        entry = {
+            'news': news,
+            'attempts': attempts,
+            'enqueued_at': enqueued_at or time.monotonic()
+        }
+        heapq.heappush(self.heap, (-effective.timestamp(), next(self._seq), entry))
+        self.ids.add(news['news_id'])
+        self.stats['pushed'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'], len(self.heap))
+
+    def requeue(self, entry):
+        """Возвращает неоценённую новость в очередь (с учётом числа попыток)"""
+        self.push(entry['news'], entry['attempts'] + 1, entry['enqueued_at'])
+
+    def pop(self):
+        """Самая приоритетная новость, у которой ещё открыто полезное окно"""
+        now = datetime.now(timezone.utc)
+        while self.heap:
+            _, _, entry = heapq.heappop(self.heap)
+            news = entry['news']
+            self.ids.discard(news['news_id'])
+
+            if now - news['published_at'] > self.useful_window:
+                self.stats['expired'] += 1
+                logger.debug(f"Dropped from scoring queue, all waves passed: {news['headline'][:50]}...")
+                self._drop(news, 'expired')
+                continue
+
+            waited = time.monotonic() - entry['enqueued_at']
+            self.wait_count += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.stats['popped'] += 1
+            return entry
+        return None
+
+    def _drop(self, news, reason):
+        if self.on_drop is None:
+            return
+        try:
+            self.on_drop(news, reason)
+        except Exception as e:
+            logger.error(f"Scoring queue drop callback failed for {news['news_id']}: {e}")
+
+    def batches(self, batch_size, max_items=None):
+        """Генератор пачек для пула - каждая берётся из очереди в момент отправки"""
+        taken = 0
+        while max_items is None or taken < max_items:
+            size = batch_size if max_items is None else min(batch_size, max_items - taken)
+            batch = []
+            while len(batch) < size:
+                entry = self.pop()
+                if entry is None:
+                    break
+                batch.append(entry)
+            if not batch:
+                return
+            taken += len(batch)
+            yield batch
+
+    def get_metrics(self):
+        """Глубина очереди и время ожидания"""
+        return {
+            'depth': len(self.heap),
+            **self.stats,
+            'avg_wait_seconds': self.wait_total / self.wait_count if self.wait_count else 0.0,
+            'max_wait_seconds': self.wait_max
+        }
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+News sources for News Analyzer - Finnhub categories, company news, local file drop
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import requests
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger(__name__)
+
+FINNHUB_BASE_URL = "https://finnhub.io/api/v1"
+
+class RateBudget:
+    """Общий бюджет запросов (token bucket), Finnhub free tier - 60 вызовов в минуту"""
+
+    def __init__(self, calls_per_minute):
+        self.capacity = max(1, calls_per_minute)
+        self.tokens = float(self.capacity)
+        self.refill_per_second = self.capacity / 60.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def try_acquire(self):
+        """Забирает токен, если он есть, не блокируя"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout):
+        """Ждёт токен не дольше timeout секунд"""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.try_acquire():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(min(1.0 / self.refill_per_second, max(0.0, deadline - time.monotonic())))
+
+    def remaining(self):
+        """Сколько запросов доступно прямо сейчас"""
+        with self._lock:
+            self._refill()
+            return int(self.tokens)
+
+def normalize_finnhub_item(item, source_name):
+    """Приводит новость Finnhub к формату news_items"""
+    return {
+        'news_id': f"finnhub:{item['id']}",
+        'headline': item.get('headline', ''),
+        'summary': item.get('summary', ''),
+        'url': item.get('url', ''),
+        'published_at': datetime.fromtimestamp(item['datetime'], tz=timezone.utc),
+        'source': source_name,
+        'raw': item
+    }
+
+class NewsSource(ABC):
+    """Базовый источник: fetch() возвращает новые новости в формате news_items"""
+    name = "source"
+
+    @abstractmethod
+    def fetch(self):
+        """Новые новости источника с прошлого вызова"""
+
+class FinnhubCategorySource(NewsSource):
+    def __init__(self, api_key, category, budget, initial_cursor=0):
+        self.api_key = api_key
+        self.category = category
+        self.budget = budget
+        self.name = f"finnhub:{category}"
+        self.cursor = initial_cursor
+        self.http = requests.Session()
+
+    def fetch(self):
+        """Новости категории с id больше курсора"""
+        if not self.budget.acquire(timeout=5):
+            logger.warning(f"{self.name}: rate budget exhausted, skipping this check")
+            return []
+
+        params = {'category': self.category, 'token': self.api_key}
+        if self.cursor:
+            params['minId'] = self.cursor
+
+        response = self.http.get(f"{FINNHUB_BASE_URL}/news", params=params, timeout=30)
+        response.raise_for_status()
+        news_items = response.json()
+
+        # minId поддерживается не всеми ответами - дополнительно фильтруем сами
+        new_items = [item for item in news_items if int(item.get('id') or 0) > self.cursor]
+        if new_items:
+            self.cursor = max(int(item['id']) for item in new_items)
+
+        logger.debug(f"{self.name}: got {len(news_items)} news items, {len(new_items)} new (cursor={self.cursor})")
+        return [normalize_finnhub_item(item, self.name) for item in new_items if item.get('datetime')]
+
+class FinnhubCompanyNewsSource(NewsSource):
+    name = "finnhub:company"
+
+    def __init__(self, api_key, tickers_fn, budget, refresh_seconds):
+        # tickers_fn() -> список тикеров (активные позиции + watchlist)
+        self.api_key = api_key
+        self.tickers_fn = tickers_fn
+        self.budget = budget
+        self.refresh_seconds = refresh_seconds
+        self.cursors = {}        # ticker -> максимальный id
+        self.last_fetched = {}   # ticker -> time.monotonic()
+        self.http = requests.Session()
+
+    def fetch(self):
+        """company-news для тикеров, которые давно не обновлялись, пока хватает бюджета"""
+        now = time.monotonic()
+        tickers = self.tickers_fn()
+        due = sorted(
+            (t for t in tickers if now - self.last_fetched.get(t, 0) >= self.refresh_seconds),
+            key=lambda t: self.last_fetched.get(t, 0)
+        )
+
+        today = datetime.now(timezone.utc).date()
+        results = []
+        for ticker in due:
+            # Компанийные новости не должны съедать бюджет общих категорий
+            if not self.budget.try_acquire():
+                logger.debug(f"{self.name}: rate budget exhausted, {ticker} deferred")
+                break
+
+            self.last_fetched[ticker] = now
+            try:
+                response = self.http.get(f"{FINNHUB_BASE_URL}/company-news", params={
+                    'symbol': ticker,
+                    'from': (today - timedelta(days=1)).isoformat(),
+                    'to': today.isoformat(),
+                    'token': self.api_key
+                }, timeout=30)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                logger.error(f"{self.name}: {ticker} request failed: {e}")
+                continue
+
+            cursor = self.cursors.get(ticker, 0)
+            new_items = [item for item in response.json() if int(item.get('id') or 0) > cursor]
+            if new_items:
+                self.cursors[ticker] = max(int(item['id']) for item in new_items)
+            results.extend(normalize_finnhub_item(item, f"{self.name}:{ticker}")
+                           for item in new_items if item.get('datetime'))
+
+        if due:
+            logger.debug(f"{self.name}: checked {len(due)} tickers, {len(results)} new items")
+        return results
+
+class FileDropSource(NewsSource):
+    """Локальный источник для тестов: JSON файлы в каталоге (объект или массив новостей)"""
+    name = "file"
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _normalize(self, item):
+        if 'news_id' not in item and 'datetime' in item and 'id' in item:
+            return normalize_finnhub_item(item, self.name)
+
+        published_at = item.get('published_at')
+        if isinstance(published_at, str):
+            published_at = datetime.fromisoformat(published_at)
+        elif published_at is None:
+            published_at = datetime.fromtimestamp(item['datetime'], tz=timezone.utc)
+        if published_at.tzinfo is None:
+            published_at = published_at.replace(tzinfo=timezone.utc)
+
+        news_id = item.get('news_id')
+        if not news_id:
+            digest = hashlib.sha1(f"{item.get('headline', '')}|{published_at.isoformat()}".encode('utf-8'))
+            news_id = f"file:{digest.hexdigest()[:16]}"
+
+        return {
+            'news_id': news_id,
+            'headline': item.get('headline', ''),
+            'summary': item.get('summary', ''),
+            'url': item.get('url', ''),
+            'published_at': published_at,
+            'source': self.name,
+            'raw': item
+        }
+
+    def fetch(self):
+        """Читает *.json и переименовывает обработанные файлы в *.json.done"""
+        results = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+            try:
+                with open(path) as f:
+                    payload = json.load(f)
+                items = payload if isinstance(payload, list) else [payload]
+                results.extend(self._normalize(item) for item in items)
+                os.rename(path, path + ".done")
+            except Exception as e:
+                logger.error(f"{self.name}: failed to load {path}: {e}")
+                try:
+                    os.rename(path, path + ".failed")
+                except OSError:
+                    pass
+
+        if results:
+            logger.info(f"{self.name}: loaded {len(results)} news from {self.directory}")
+        return results
+
+class NewsIngester:
+    """Опрашивает все источники параллельно и объединяет результаты"""
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(sources)), thread_name_prefix="news-source")
+        self.stats = {source.name: {'fetched': 0, 'errors': 0} for source in sources}
+
+    def fetch_all(self):
+        futures = {self.executor.submit(source.fetch): source for source in self.sources}
+        results = []
+        seen = set()
+
+        for future, source in futures.items():
+            try:
+                items = future.result()
+            except Exception as e:
+                logger.error(f"{source.name} fetch failed: {e}")
+                self.stats[source.name]['errors'] += 1
+                continue
+
+            self.stats[source.name]['fetched'] += len(items)
+            # Одна новость может прийти из нескольких категорий
+            for news in items:
+                if news['news_id'] not in seen:
+                    seen.add(news['news_id'])
+                    results.append(news)
+
+        return results
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -6,14 +6,25 @@ import psycopg2
 import psycopg2.extras
 from datetime import datetime, timedelta
 import logging
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+# Колонки news_items, которые заполняет анализатор
+NEWS_COLUMNS = ('news_id', 'headline', 'summary', 'url', 'published_at',
+                'significance_score', 'reasoning', 'is_significant', 'duplicate_of', 'scored_by')
+
 class NewsStorage:
-    def __init__(self, database_url):
+    def __init__(self, database_url, seen_ids_capacity=5000):
         self.database_url = database_url
         self.conn = None
+
+        # Недавно виденные news_id (LRU) - дубликаты отсекаются без запроса к БД
+        self.seen_ids = OrderedDict()
+        self.seen_ids_capacity = seen_ids_capacity
+
         self.connect()
+        self.warm_seen_ids()
 
     def connect(self):
         """Подключение к БД"""
@@ -26,7 +37,7 @@ class NewsStorage:
             cursor = self.conn.cursor()
 
             # Проверяем и добавляем недостающие колонки
-            missing_columns = ['summary', 'url', 'reasoning', 'significance_score', 'is_significant']
+            missing_columns = ['summary', 'url', 'reasoning', 'significance_score', 'is_significant', 'duplicate_of', 'scored_by']
 
             for col_name in missing_columns:
                 cursor.execute("""
@@ -47,6 +58,10 @@ class NewsStorage:
                             cursor.execute("ALTER TABLE news_items ADD COLUMN significance_score DECIMAL(3,2)")
                         elif col_name == 'is_significant':
                             cursor.execute("ALTER TABLE news_items ADD COLUMN is_significant BOOLEAN DEFAULT FALSE")
+                        elif col_name == 'duplicate_of':
+                            cursor.execute("ALTER TABLE news_items ADD COLUMN duplicate_of VARCHAR(255)")
+                        elif col_name == 'scored_by':
+                            cursor.execute("ALTER TABLE news_items ADD COLUMN scored_by VARCHAR(20)")
                         logger.info(f"Added {col_name} column to news_items")
                     except Exception as e:
                         logger.debug(f"Could not add {col_name} column: {e}")
@@ -64,6 +79,8 @@ class NewsStorage:
                     significance_score DECIMAL(3,2),
                     reasoning TEXT,
                     is_significant BOOLEAN DEFAULT FALSE,
+                    duplicate_of VARCHAR(255),
+                    scored_by VARCHAR(20),
                     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
                 )
             """)
@@ -73,6 +90,44 @@ class NewsStorage:
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_news_items_is_significant ON news_items(is_significant)
             """)
+
+            # Сырые новости из всех источников, пишутся 24/7 без LLM
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS news_raw (
+                    news_id VARCHAR(255) PRIMARY KEY,
+                    source VARCHAR(100),
+                    headline TEXT NOT NULL,
+                    summary TEXT,
+                    url VARCHAR(500),
+                    published_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                    payload JSONB,
+                    received_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_news_raw_published_at ON news_raw(published_at)
+            """)
+
+            # NOTIFY только при появлении значимости: дописывание вердикта (UPDATE) не будит
+            # Signal Extractor повторно. Ставим при старте - старые БД не проходят init-скрипты заново
+            cursor.execute("""
+                CREATE OR REPLACE FUNCTION notify_new_significant_news()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    IF NEW.is_significant = TRUE AND (TG_OP = 'INSERT' OR OLD.is_significant IS DISTINCT FROM TRUE) THEN
+                        PERFORM pg_notify('new_significant_news', NEW.id::text);
+                    END IF;
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            cursor.execute("""
+                DROP TRIGGER IF EXISTS trigger_notify_significant_news ON news_items;
+                CREATE TRIGGER trigger_notify_significant_news
+                    AFTER INSERT OR UPDATE ON news_items
+                    FOR EACH ROW
+                    EXECUTE FUNCTION notify_new_significant_news()
+            """)
             cursor.close()
             logger.info("News items table initialized")
 
@@ -80,32 +135,267 @@ class NewsStorage:
             logger.error(f"Database connection failed: {e}")
             raise
 
+    def mark_seen(self, news_id):
+        """Запоминает news_id в ограниченном множестве недавно виденных"""
+        self.seen_ids[news_id] = True
+        self.seen_ids.move_to_end(news_id)
+        while len(self.seen_ids) > self.seen_ids_capacity:
+            self.seen_ids.popitem(last=False)
+
+    def warm_seen_ids(self):
+        """Прогрев множества виденных id последними новостями из БД"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT news_id FROM news_items ORDER BY id DESC LIMIT %s
+            """, (self.seen_ids_capacity,))
+            for (news_id,) in reversed(cursor.fetchall()):
+                self.mark_seen(news_id)
+            logger.info(f"Seen ids warmed: {len(self.seen_ids)}")
+        except Exception as e:
+            logger.error(f"Seen ids warm-up failed: {e}")
+
+    def filter_new_ids(self, news_ids):
+        """Возвращает множество id, которых ещё нет в БД.
+
+        Сначала проверяем память, для остальных - один запрос news_id = ANY(...).
+        """
+        unknown = [news_id for news_id in dict.fromkeys(news_ids) if news_id not in self.seen_ids]
+        if not unknown:
+            return set()
+
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT news_id FROM news_items WHERE news_id = ANY(%s)", (unknown,))
+            existing = {row[0] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Duplicate check failed: {e}")
+            existing = set()
+
+        for news_id in existing:
+            self.mark_seen(news_id)
+
+        return set(unknown) - existing
+
     def is_duplicate(self, news_id):
         """Проверка дубликата"""
+        return news_id not in self.filter_new_ids([news_id])
+
+    def save_news(self, news_id, headline, summary, url, published_at,
+                  significance_score, reasoning, is_significant, duplicate_of=None, scored_by=None):
+        """Сохранение новости в БД (повторная вставка того же news_id не ошибка)"""
+        inserted = self.save_news_batch([{
+            'news_id': news_id, 'headline': headline, 'summary': summary, 'url': url,
+            'published_at': published_at, 'significance_score': significance_score,
+            'reasoning': reasoning, 'is_significant': is_significant,
+            'duplicate_of': duplicate_of, 'scored_by': scored_by
+        }])
+        return inserted is not None
+
+    def save_news_batch(self, rows):
+        """Сохраняет пачку новостей одним INSERT ... ON CONFLICT DO NOTHING.
+
+        rows - словари с ключами NEWS_COLUMNS. Возвращает множество news_id,
+        которые были вставлены (остальные уже были в БД), или None при ошибке.
+        """
+        if not rows:
+            return set()
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT 1 FROM news_items WHERE news_id = %s", (news_id,))
-            return cursor.fetchone() is not None
+            inserted = psycopg2.extras.execute_values(cursor, f"""
+                INSERT INTO news_items ({', '.join(NEWS_COLUMNS)})
+                VALUES %s
+                ON CONFLICT (news_id) DO NOTHING
+                RETURNING news_id
+            """, [tuple(row.get(col) for col in NEWS_COLUMNS) for row in rows],
+                page_size=len(rows), fetch=True)
+            cursor.close()
+
+            for row in rows:
+                self.mark_seen(row['news_id'])
+            return {news_id for (news_id,) in inserted}
         except Exception as e:
-            logger.error(f"Duplicate check failed: {e}")
+            logger.error(f"Save news batch failed ({len(rows)} rows): {e}")
+            return None
+
+    def ping(self):
+        """Соединение с БД живо"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.error(f"Database ping failed: {e}")
             return False
 
-    def save_news(self, news_id, headline, summary, url, published_at,
-                  significance_score, reasoning, is_significant):
-        """Сохранение новости в БД"""
+    def update_news_verdict(self, news_id, significance_score, reasoning, is_significant, scored_by):
+        """Дописывает вердикт уже сохранённой новости (после раннего вердикта из потока).
+
+        processed_at сдвигаем: окно догонки signal_extractor смотрит на него, а id строки уже ниже отметки.
+        """
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
-                INSERT INTO news_items (news_id, headline, summary, url, published_at,
-                                significance_score, reasoning, is_significant)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """, (news_id, headline, summary, url, published_at,
-                  significance_score, reasoning, is_significant))
-            return True
+                UPDATE news_items
+                SET significance_score = %s, reasoning = %s, is_significant = %s, scored_by = %s,
+                    processed_at = NOW()
+                WHERE news_id = %s
+            """, (significance_score, reasoning, is_significant, scored_by, news_id))
+            return cursor.rowcount > 0
         except Exception as e:
-            logger.error(f"Save news failed: {e}")
+            logger.error(f"Update news verdict failed: {e}")
             return False
 
+    def retract_significance(self, news_id):
+        """Финальный вердикт снял значимость раннего: отменяем ещё не исполненные сигналы
+        и задачи signal_jobs этой новости. Возвращает число отменённых сигналов"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                UPDATE trading_signals ts
+                SET state = 'rejected', state_reason = 'news significance retracted', state_updated_at = NOW()
+                FROM news_items ni
+                WHERE ni.news_id = %s
+                  AND (ts.news_item_id = ni.id OR ni.id = ANY(ts.source_news_ids))
+                  AND ts.state IN ('pending', 'scheduled')
+            """, (news_id,))
+            rejected = cursor.rowcount
+        except Exception as e:
+            logger.error(f"Retract signals failed for {news_id}: {e}")
+            rejected = 0
+
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                UPDATE signal_jobs sj
+                SET state = 'done', last_error = 'news significance retracted', lease_until = NULL
+                FROM news_items ni
+                WHERE ni.news_id = %s AND sj.news_id = ni.id AND sj.state = 'pending'
+            """, (news_id,))
+        except Exception as e:
+            # signal_jobs есть только в режиме очереди Signal Extractor
+            logger.debug(f"Retract signal jobs skipped for {news_id}: {e}")
+        return rejected
+
+    def save_raw_batch(self, news_list):
+        """Сохраняет сырые новости в news_raw (повторы игнорируются). Возвращает число новых"""
+        if not news_list:
+            return 0
+        try:
+            cursor = self.conn.cursor()
+            inserted = psycopg2.extras.execute_values(cursor, """
+                INSERT INTO news_raw (news_id, source, headline, summary, url, published_at, payload)
+                VALUES %s
+                ON CONFLICT (news_id) DO NOTHING
+                RETURNING news_id
+            """, [(news['news_id'], news.get('source'), news['headline'], news['summary'], news['url'],
+                   news['published_at'], psycopg2.extras.Json(news.get('raw')))
+                  for news in news_list],
+                page_size=len(news_list), fetch=True)
+            cursor.close()
+            return len(inserted)
+        except Exception as e:
+            logger.error(f"Save raw news failed ({len(news_list)} rows): {e}")
+            return 0
+
+    def get_unscored_raw(self, hours, limit):
+        """Сырые новости за последние N часов, которых ещё нет в news_items"""
+        try:
+            cursor = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            since = datetime.now() - timedelta(hours=hours)
+            cursor.execute("""
+                SELECT r.news_id, r.source, r.headline, r.summary, r.url, r.published_at, r.payload
+                FROM news_raw r
+                LEFT JOIN news_items n ON n.news_id = r.news_id
+                WHERE r.published_at > %s AND n.id IS NULL
+                ORDER BY r.published_at DESC
+                LIMIT %s
+            """, (since, limit))
+            return [{
+                'news_id': row['news_id'],
+                'headline': row['headline'],
+                'summary': row['summary'] or '',
+                'url': row['url'] or '',
+                'published_at': row['published_at'],
+                'source': row['source'],
+                'raw': row['payload']
+            } for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Raw backlog query failed: {e}")
+            return []
+
+    def purge_raw(self, days):
+        """Удаляет сырые новости старше N дней"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM news_raw WHERE received_at < NOW() - %s * INTERVAL '1 day'", (days,))
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Raw news purge failed: {e}")
+            return 0
+
+    def get_max_finnhub_id(self):
+        """Максимальный числовой id Finnhub среди сохранённых новостей - стартовый курсор"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT MAX(CAST(SUBSTRING(news_id FROM 9) AS BIGINT))
+                FROM news_items
+                WHERE news_id ~ '^finnhub:[0-9]+$'
+            """)
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] is not None else 0
+        except Exception as e:
+            logger.error(f"Finnhub cursor query failed: {e}")
+            return 0
+
+    def get_active_tickers(self):
+        """Тикеры открытых позиций experiment_manager"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT DISTINCT ticker FROM experiments WHERE status = 'active'")
+            return [row[0] for row in cursor.fetchall() if row[0]]
+        except Exception as e:
+            logger.debug(f"Active tickers query failed: {e}")
+            return []
+
+    def get_recent_news(self, hours):
+        """Канонические новости за последние N часов (для индекса почти-дубликатов)"""
+        try:
+            cursor = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            since = datetime.now() - timedelta(hours=hours)
+            cursor.execute("""
+                SELECT news_id, headline, summary, published_at
+                FROM news_items
+                WHERE published_at > %s AND duplicate_of IS NULL
+                ORDER BY published_at
+            """, (since,))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Recent news query failed: {e}")
+            return []
+
+    def get_training_news(self, days, limit):
+        """Новости с оценкой LLM для обучения локального префильтра"""
+        try:
+            cursor = self.conn.cursor()
+            since = datetime.now() - timedelta(days=days)
+            cursor.execute("""
+                SELECT headline, summary, significance_score
+                FROM news_items
+                WHERE processed_at > %s
+                  AND significance_score IS NOT NULL
+                  AND duplicate_of IS NULL
+                  AND (scored_by IS NULL OR scored_by IN ('llm', 'llm_cheap', 'llm_escalated', 'cache', 'llm_audit'))
+                ORDER BY processed_at DESC
+                LIMIT %s
+            """, (since, limit))
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Training news query failed: {e}")
+            return []
+
     def get_stats(self, hours=1):
         """Статистика за последние N часов"""
         try:
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for NewsWriter - одна плохая строка не блокирует запись пачки
+"""
+import unittest
+
+from news_writer import NewsWriter
+
+class FakeStorage:
+    """Пачка с url длиннее VARCHAR(500) целиком отвергается, как multi-row INSERT в Postgres"""
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.saved = []
+
+    def mark_seen(self, news_id):
+        pass
+
+    def ping(self):
+        return self.alive
+
+    def save_news_batch(self, rows):
+        if not self.alive or any(len(row['url']) > 500 for row in rows):
+            return None
+        self.saved.extend(row['news_id'] for row in rows)
+        return {row['news_id'] for row in rows}
+
+def make_row(news_id, url='https://example.com/news'):
+    return {'news_id': news_id, 'url': url}
+
+class NewsWriterTest(unittest.TestCase):
+    def make_writer(self, storage):
+        self.callbacks = []
+        return NewsWriter(storage, max_rows=10, max_latency_seconds=60,
+                          on_saved=lambda row, meta, inserted: self.callbacks.append((row['news_id'], inserted)))
+
+    def test_oversized_row_is_dropped_and_rest_saved(self):
+        storage = FakeStorage()
+        writer = self.make_writer(storage)
+        for news_id in ('a', 'b', 'c'):
+            writer.add(make_row(news_id))
+        writer.add(make_row('bad', url='https://example.com/' + 'x' * 600))
+        writer.add(make_row('urgent'), urgent=True)
+
+        self.assertEqual(sorted(storage.saved), ['a', 'b', 'c', 'urgent'])
+        self.assertEqual(len(writer), 0)
+        self.assertEqual(writer.stats['dropped'], 1)
+        self.assertNotIn('bad', [news_id for news_id, _ in self.callbacks])
+
+        # Следующие записи больше не спотыкаются о плохую строку
+        writer.add(make_row('d'), urgent=True)
+        self.assertIn('d', storage.saved)
+
+    def test_database_down_keeps_buffer(self):
+        storage = FakeStorage(alive=False)
+        writer = self.make_writer(storage)
+        writer.add(make_row('a'))
+        writer.add(make_row('b'), urgent=True)
+
+        self.assertEqual(len(writer), 2)
+        self.assertEqual(writer.stats['dropped'], 0)
+
+        storage.alive = True
+        writer.flush()
+        self.assertEqual(sorted(storage.saved), ['a', 'b'])
+        self.assertEqual(len(writer), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of LLM significance verdicts
+"""
+import hashlib
+import logging
+import re
+import threading
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+class VerdictCache:
+    def __init__(self, database_url, model_name, prompt_version, ttl_hours):
+        self.database_url = database_url
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.ttl_hours = ttl_hours
+        self.conn = None
+
+        # Кеш читается из потоков пула оценки - одно соединение под блокировкой
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'errors': 0
+        }
+        self.connect()
+
+    def connect(self):
+        """Подключение к БД и создание таблицы кеша"""
+        self.conn = psycopg2.connect(self.database_url)
+        self.conn.autocommit = True
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_verdict_cache (
+                cache_key CHAR(64) PRIMARY KEY,
+                model VARCHAR(100) NOT NULL,
+                prompt_version VARCHAR(20) NOT NULL,
+                significance_score INTEGER NOT NULL,
+                is_significant BOOLEAN NOT NULL,
+                reasoning TEXT,
+                hits INTEGER DEFAULT 0,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_verdict_cache_expires_at ON llm_verdict_cache(expires_at)
+        """)
+        cursor.close()
+        logger.info(f"Verdict cache initialized (ttl={self.ttl_hours}h, prompt v{self.prompt_version})")
+
+    def _ensure_connection(self):
+        if self.conn is None or self.conn.closed:
+            self.connect()
+
+    @staticmethod
+    def _normalize(text):
+        """Нормализация текста: регистр, пунктуация и пробелы не влияют на ключ"""
+        text = (text or "").lower()
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split())
+
+    def make_key(self, headline, summary, model_name=None):
+        """sha256 от нормализованных заголовка и содержания, модели и версии промпта.
+
+        model_name - модель, которая дала вердикт (каскад), по умолчанию основная.
+        """
+        parts = [
+            model_name or self.model_name,
+            self.prompt_version,
+            self._normalize(headline),
+            self._normalize((summary or "")[:500])
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, headline, summary, model_name=None):
+        """Возвращает (score, is_significant, reasoning) из кеша или None"""
+        key = self.make_key(headline, summary, model_name)
+        try:
+            with self._lock:
+                self._ensure_connection()
+                cursor = self.conn.cursor()
+                cursor.execute("""
+                    UPDATE llm_verdict_cache
+                    SET hits = hits + 1
+                    WHERE cache_key = %s AND expires_at > NOW()
+                    RETURNING significance_score, is_significant, reasoning
+                """, (key,))
+                row = cursor.fetchone()
+                cursor.close()
+
+                if row:
+                    self.stats['hits'] += 1
+                    return int(row[0]), bool(row[1]), row[2] or ""
+
+                self.stats['misses'] += 1
+                return None
+
+        except Exception as e:
+            logger.error(f"Verdict cache lookup failed: {e}")
+            self.stats['errors'] += 1
+            return None
+
+    def put(self, headline, summary, verdict, model_name=None):
+        """Сохраняет вердикт LLM с TTL"""
+        score, is_significant, reasoning = verdict
+        key = self.make_key(headline, summary, model_name)
+        try:
+            with self._lock:
+                self._ensure_connection()
+                cursor = self.conn.cursor()
+                cursor.execute("""
+                    INSERT INTO llm_verdict_cache (cache_key, model, prompt_version,
+                                                   significance_score, is_significant, reasoning, expires_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, NOW() + %s * INTERVAL '1 hour')
+                    ON CONFLICT (cache_key) DO UPDATE SET
+                        significance_score = EXCLUDED.significance_score,
+                        is_significant = EXCLUDED.is_significant,
+                        reasoning = EXCLUDED.reasoning,
+                        created_at = NOW(),
+                        expires_at = EXCLUDED.expires_at
+                """, (key, model_name or self.model_name, self.prompt_version,
+                      score, is_significant, reasoning, self.ttl_hours))
+                cursor.close()
+                self.stats['stores'] += 1
+
+        except Exception as e:
+            logger.error(f"Verdict cache store failed: {e}")
+            self.stats['errors'] += 1
+
+    def purge_expired(self):
+        """Удаляет просроченные записи"""
+        try:
+            with self._lock:
+                self._ensure_connection()
+                cursor = self.conn.cursor()
+                cursor.execute("DELETE FROM llm_verdict_cache WHERE expires_at <= NOW()")
+                deleted = cursor.rowcount
+                cursor.close()
+
+            if deleted:
+                logger.info(f"Verdict cache: purged {deleted} expired entries")
+            return deleted
+
+        except Exception as e:
+            logger.error(f"Verdict cache purge failed: {e}")
+            self.stats['errors'] += 1
+            return 0
+
+    def get_stats(self):
+        """Статистика попаданий"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': (self.stats['hits'] / lookups * 100) if lookups else 0.0
+        }
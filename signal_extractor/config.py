@@ -14,7 +14,41 @@ class Config:
     LLM_MODEL = os.getenv('LLM_MODEL', 'anthropic/claude-3.7-sonnet')
     LLM_TEMPERATURE = float(os.getenv('LLM_TEMPERATURE', '0.3'))  # Lower for more focused analysis
     LLM_MAX_TOKENS = int(os.getenv('LLM_MAX_TOKENS', '4000'))  # More tokens for detailed reasoning
-    LLM_TIMEOUT_SECONDS = int(os.getenv('LLM_TIMEOUT_SECONDS', '30'))
+    # Жёсткий таймаут логического вызова (вместе с хеджем). По умолчанию растёт с LLM_MAX_TOKENS:
+    # 15с + 1с на 40 токенов ответа (4000 -> 115с), чтобы длинные ответы ChainOfThought не обрывались
+    LLM_TIMEOUT_SECONDS = int(os.getenv('LLM_TIMEOUT_SECONDS', str(15 + LLM_MAX_TOKENS // 40)))
+    # Хеджирование: если LLM_MODEL не ответил за p-перцентиль задержки, дубль уходит на LLM_HEDGE_MODEL
+    LLM_HEDGE_MODEL = os.getenv('LLM_HEDGE_MODEL', '')  # Пусто - без хеджирования
+    LLM_HEDGE_PERCENTILE = int(os.getenv('LLM_HEDGE_PERCENTILE', '90'))
+    # Потолок $ на вызов: max_tokens ответа урезается, чтобы промпт + полный ответ укладывались; 0 - без потолка
+    LLM_CALL_BUDGET_USD = float(os.getenv('LLM_CALL_BUDGET_USD', '0.10'))
+    # Цены $ за 1M токенов (вход/выход) для моделей, которых нет в прайсе LiteLLM
+    LLM_DEFAULT_INPUT_PRICE = float(os.getenv('LLM_DEFAULT_INPUT_PRICE', '3.0'))
+    LLM_DEFAULT_OUTPUT_PRICE = float(os.getenv('LLM_DEFAULT_OUTPUT_PRICE', '15.0'))
+    # Волна и сигналы одним вызовом LLM (при сбое - прежние два вызова)
+    LLM_COMBINED_CALL = os.getenv('LLM_COMBINED_CALL', 'false').lower() == 'true'
+    # Сигналы JSON-массивом со строгой проверкой по схеме; пока не проверено на dspy 2.5.11 - включать явно
+    # (false - прежние строки через запятую)
+    LLM_JSON_SIGNALS = os.getenv('LLM_JSON_SIGNALS', 'false').lower() == 'true'
+
+    # Слушатель уведомлений
+    LISTEN_TIMEOUT_SECONDS = int(os.getenv('LISTEN_TIMEOUT_SECONDS', '60'))  # Проверка соединения при тишине
+    CATCHUP_MAX_AGE_HOURS = int(os.getenv('CATCHUP_MAX_AGE_HOURS', '24'))  # Первый запуск: не поднимаем новости старше
+    CATCHUP_GRACE_MINUTES = int(os.getenv('CATCHUP_GRACE_MINUTES', '15'))  # Новости, ставшие значимыми после вставки
+
+    # Режим очереди signal_jobs: несколько воркеров берут новости через FOR UPDATE SKIP LOCKED
+    SIGNAL_QUEUE_MODE = os.getenv('SIGNAL_QUEUE_MODE', 'false').lower() == 'true'
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))  # После - задачу может забрать другой воркер
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))  # Затем state='dead'
+    JOB_RETRY_BASE_SECONDS = int(os.getenv('JOB_RETRY_BASE_SECONDS', '30'))  # Отсрочка 30s, 60s, 120s...
+
+    # Склейка: значимые новости о пересекающихся тикерах за окно - одна генерация сигналов (0 - выключено)
+    COALESCE_WINDOW_SECONDS = int(os.getenv('COALESCE_WINDOW_SECONDS', '0'))
+
+    # Справочник символов США (NASDAQ Trader nasdaqlisted/otherlisted) для проверки тикеров без сети
+    SYMBOL_MASTER_PATH = os.getenv('SYMBOL_MASTER_PATH', 'data/symbol_master.tsv')
+    SYMBOL_MASTER_REFRESH_HOURS = int(os.getenv('SYMBOL_MASTER_REFRESH_HOURS', '24'))
+    TICKER_YFINANCE_FALLBACK = os.getenv('TICKER_YFINANCE_FALLBACK', 'true').lower() == 'true'  # Для неизвестных символов
 
     # Параметры сигналов
     MIN_EXPECTED_MOVE_PERCENT = float(os.getenv('MIN_EXPECTED_MOVE_PERCENT', '1.0'))
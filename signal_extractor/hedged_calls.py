@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Hedged LLM calls for Signal Extractor - дубль запроса на вторую модель при долгом ответе
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+class HedgedCaller:
+    def __init__(self, primary_lm, hedge_lm, timeout_seconds, max_call_cost,
+                 hedge_percentile=90, min_samples=20, window=200):
+        # call_fn(lm, role) выполняется в рабочем потоке: role = 'primary' / 'hedge'
+        self.primary_lm = primary_lm
+        self.hedge_lm = hedge_lm
+        self.timeout_seconds = timeout_seconds
+        self.max_call_cost = max_call_cost  # $ на один логический вызов, 0 - без ограничения
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        self.latencies = {}  # operation -> deque задержек основной модели, сек
+        self.window = window
+        self.avg_cost = {'primary': {}, 'hedge': {}}  # role -> operation -> EWMA стоимости
+
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-hedge")
+        self.stats = {
+            'calls': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'hedge_skipped_budget': 0,
+            'timeouts': 0,
+            'over_budget': 0
+        }
+
+    def hedge_delay(self, operation):
+        """Задержка перед дублем: p90 задержки основной модели (до накопления выборки - половина таймаута)"""
+        with self._lock:
+            samples = sorted(self.latencies.get(operation, ()))
+        if len(samples) < self.min_samples:
+            return self.timeout_seconds / 2
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))
+        return samples[index]
+
+    def _expected_cost(self, role, operation):
+        with self._lock:
+            return self.avg_cost[role].get(operation, 0.0)
+
+    def _observe(self, role, operation, latency, cost):
+        with self._lock:
+            if role == 'primary':
+                self.latencies.setdefault(operation, deque(maxlen=self.window)).append(latency)
+            if cost:
+                previous = self.avg_cost[role].get(operation)
+                self.avg_cost[role][operation] = cost if previous is None else 0.8 * previous + 0.2 * cost
+
+    def _run(self, call_fn, lm, role, operation):
+        started = time.monotonic()
+        result, cost = call_fn(lm, role)
+        self._observe(role, operation, time.monotonic() - started, cost)
+        return result, cost
+
+    def call(self, operation, call_fn):
+        """Вызов с хеджированием. call_fn(lm, role) -> (result, cost)
+
+        Если основная модель не ответила за p90, тот же запрос уходит на hedge_lm
+        (при условии, что ожидаемая стоимость пары укладывается в max_call_cost).
+        Берётся первый успешный ответ. Жёсткий таймаут - timeout_seconds на всё,
+        по нему бросается TimeoutError; зависший поток дорабатывает в фоне.
+        """
+        self.stats['calls'] += 1
+        started = time.monotonic()
+        deadline = started + self.timeout_seconds
+        hedge_delay = self.hedge_delay(operation)
+        hedge_at = None if self.hedge_lm is None else started + hedge_delay
+
+        roles = {self.executor.submit(self._run, call_fn, self.primary_lm, 'primary', operation): 'primary'}
+        pending = set(roles)
+        last_error = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wait_until = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(0, wait_until - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                try:
+                    result, cost = future.result()
+                except Exception as e:
+                    logger.warning(f"LLM {roles[future]} call failed ({operation}): {e}")
+                    last_error = e
+                    continue
+                if roles[future] == 'hedge':
+                    self.stats['hedge_wins'] += 1
+                if self.max_call_cost and cost and cost > self.max_call_cost:
+                    self.stats['over_budget'] += 1
+                    logger.warning(f"LLM call {operation} cost ${cost:.4f} > budget ${self.max_call_cost:.4f}")
+                for other in pending:
+                    other.cancel()
+                return result
+
+            # Дубль отправляем один раз: после p90 или сразу, если основной вызов упал
+            if hedge_at is not None and (not pending or time.monotonic() >= hedge_at):
+                hedge_at = None
+                expected = self._expected_cost('primary', operation) + self._expected_cost('hedge', operation)
+                if self.max_call_cost and expected > self.max_call_cost:
+                    self.stats['hedge_skipped_budget'] += 1
+                    logger.debug(f"Hedge skipped for {operation}: expected ${expected:.4f} > budget")
+                else:
+                    self.stats['hedged'] += 1
+                    logger.info(f"Hedging {operation} after {time.monotonic() - started:.1f}s "
+                                f"(p{self.hedge_percentile} {hedge_delay:.1f}s)")
+                    future = self.executor.submit(self._run, call_fn, self.hedge_lm, 'hedge', operation)
+                    roles[future] = 'hedge'
+                    pending.add(future)
+
+        if not pending and last_error is not None:
+            raise last_error
+        for future in pending:
+            future.cancel()
+        self.stats['timeouts'] += 1
+        raise TimeoutError(f"LLM call {operation} exceeded {self.timeout_seconds}s")
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -4,7 +4,10 @@ Signal Extractor Service - БЛОК 2
 """
 import psycopg2
 import psycopg2.extras
+import os
+import select
 import signal
+import socket
 import sys
 import logging
 import time
@@ -22,9 +25,15 @@ from config import Config
 from market_status import MarketDetector, MarketStatus
 from wave_analyzer import WaveAnalyzer
 from ticker_validator import TickerValidator
+from symbol_master import SymbolMaster
+from llm_accounting import LLMCallRecorder
+from news_coalescer import NewsCoalescer, extract_entities
 
 logger = logging.getLogger(__name__)
 
+# Имя слушателя в listener_state
+LISTENER_NAME = "signal_extractor"
+
 class SignalExtractorService:
     def __init__(self):
         self.config = Config()
@@ -32,14 +41,31 @@ class SignalExtractorService:
 
         # Инициализация компонентов
         self.market_detector = MarketDetector()
+        # Токены, задержка и ошибки каждого вызова LLM - в таблицу llm_calls
+        self.llm_recorder = LLMCallRecorder(self.config.DATABASE_URL, "signal_extractor")
         self.wave_analyzer = WaveAnalyzer(
             self.config.OPENROUTER_API_KEY,
             self.config.LLM_MODEL,
             self.config.LLM_TEMPERATURE,
             self.config.LLM_MAX_TOKENS,
-            self.config.LLM_TIMEOUT_SECONDS
+            self.config.LLM_TIMEOUT_SECONDS,
+            recorder=self.llm_recorder,
+            hedge_model_name=self.config.LLM_HEDGE_MODEL,
+            hedge_percentile=self.config.LLM_HEDGE_PERCENTILE,
+            max_call_cost=self.config.LLM_CALL_BUDGET_USD,
+            json_signals=self.config.LLM_JSON_SIGNALS,
+            default_prices=(self.config.LLM_DEFAULT_INPUT_PRICE, self.config.LLM_DEFAULT_OUTPUT_PRICE)
         )
-        self.ticker_validator = TickerValidator()
+        # Справочник листинга США: проверка тикеров без сети, yfinance - только для неизвестных
+        self.symbol_master = SymbolMaster(self.config.SYMBOL_MASTER_PATH, self.config.SYMBOL_MASTER_REFRESH_HOURS)
+        self.symbol_master.load()
+        self.symbol_master.start()
+        self.ticker_validator = TickerValidator(self.symbol_master, self.config.TICKER_YFINANCE_FALLBACK)
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        # Склейка новостей о тех же тикерах (0 - выключено)
+        self.coalescer = None
+        if self.config.COALESCE_WINDOW_SECONDS > 0:
+            self.coalescer = NewsCoalescer(self.config.COALESCE_WINDOW_SECONDS)
 
         # Подключение к БД
         self.conn = None
@@ -50,6 +76,12 @@ class SignalExtractorService:
             'news_processed': 0,
             'signals_generated': 0,
             'llm_calls': 0,
+            'combined_calls': 0,
+            'coalesced_news': 0,
+            'unknown_tickers': 0,
+            'jobs_claimed': 0,
+            'jobs_retried': 0,
+            'jobs_dead': 0,
             'errors': 0,
             'start_time': datetime.now(),
             'wave_distribution': {}
@@ -126,6 +158,81 @@ class SignalExtractorService:
                 )
             """)
 
+            # Высшая отметка обработанных новостей - с неё слушатель продолжает после переподключения
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS listener_state (
+                    listener VARCHAR(100) PRIMARY KEY,
+                    last_news_id INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                )
+            """)
+            # Очередь задач для нескольких воркеров (SIGNAL_QUEUE_MODE)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS signal_jobs (
+                    news_id INTEGER PRIMARY KEY REFERENCES news_items(id),
+                    state VARCHAR(20) NOT NULL DEFAULT 'pending'
+                        CHECK (state IN ('pending', 'running', 'done', 'dead')),
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    lease_until TIMESTAMP WITH TIME ZONE,
+                    worker_id VARCHAR(100),
+                    last_error TEXT,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_signal_jobs_claimable
+                ON signal_jobs(available_at) WHERE state IN ('pending', 'running')
+            """)
+            # Все новости, на которых основан сигнал (склейка новостей о тех же тикерах)
+            cursor.execute("ALTER TABLE trading_signals ADD COLUMN IF NOT EXISTS source_news_ids INTEGER[]")
+
+            # Функция ниже - уровня оператора (читает new_signals): снимаем все триггеры на ней,
+            # включая старые построчные под любыми именами, иначе они упадут на первом INSERT
+            cursor.execute("""
+                DO $$
+                DECLARE
+                    t RECORD;
+                BEGIN
+                    FOR t IN
+                        SELECT tg.tgname, tg.tgrelid::regclass AS rel
+                        FROM pg_trigger tg JOIN pg_proc p ON tg.tgfoid = p.oid
+                        WHERE p.proname = 'notify_new_trading_signals' AND NOT tg.tgisinternal
+                    LOOP
+                        EXECUTE format('DROP TRIGGER %I ON %s', t.tgname, t.rel);
+                    END LOOP;
+                END
+                $$
+            """)
+            # Одно уведомление на пачку сигналов: JSON с id вставленных строк
+            cursor.execute("""
+                CREATE OR REPLACE FUNCTION notify_new_trading_signals()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    IF EXISTS (SELECT 1 FROM new_signals) THEN
+                        PERFORM pg_notify('new_trading_signals',
+                            (SELECT json_build_object('ids', json_agg(id ORDER BY id))::text FROM new_signals));
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            cursor.execute("""
+                DROP TRIGGER IF EXISTS trigger_notify_new_signal ON trading_signals;
+                DROP TRIGGER IF EXISTS trigger_notify_new_signals ON trading_signals;
+                CREATE TRIGGER trigger_notify_new_signals
+                    AFTER INSERT ON trading_signals
+                    REFERENCING NEW TABLE AS new_signals
+                    FOR EACH STATEMENT
+                    EXECUTE FUNCTION notify_new_trading_signals()
+            """)
+
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_news_items_block2_pending
+                ON news_items(id) WHERE is_significant = TRUE AND processed_by_block2 = FALSE
+            """)
+
             cursor.close()
             logger.info("Database tables initialized")
 
@@ -138,45 +245,235 @@ class SignalExtractorService:
         logger.info("Shutting down Signal Extractor (SIGINT received)")
         logger.info(f"Final stats: processed {self.stats['news_processed']} news, "
                    f"generated {self.stats['signals_generated']} signals")
+        self.wave_analyzer.caller.shutdown()
+        self.symbol_master.stop()
+        self.llm_recorder.close()
         if self.conn:
             self.conn.close()
         sys.exit(0)
 
     def listen_for_notifications(self):
-        """Слушает уведомления от PostgreSQL"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("LISTEN new_significant_news;")
-            logger.info("Listening for notifications on channel 'new_significant_news'")
-
-            while True:
-                # Ожидаем уведомления (блокирующий вызов)
-                self.conn.poll()
-
-                while self.conn.notifies:
-                    notify = self.conn.notifies.pop(0)
-                    news_id = notify.payload
+        """Слушает уведомления от PostgreSQL: ждём на сокете через select(), без опроса в цикле.
 
-                    logger.info(f"Received notification: new_significant_news ({news_id})")
-                    self.process_news(news_id)
+        После каждого (пере)подключения сначала догоняем всё, что пришло без нас,
+        начиная с сохранённой высшей отметки (catch_up_news).
+        """
+        reconnect_delay = 5
+        last_hourly_log = datetime.now()
 
-        except KeyboardInterrupt:
-            logger.info("Interrupted by user")
+        while True:
+            try:
+                if self.conn is None or self.conn.closed:
+                    self.connect_db()
+                cursor = self.conn.cursor()
+                # LISTEN до догоняющей выборки - уведомления за время выборки не теряются
+                cursor.execute("LISTEN new_significant_news;")
+                logger.info("Listening for notifications on channel 'new_significant_news'")
+                reconnect_delay = 5
+
+                if self.config.SIGNAL_QUEUE_MODE:
+                    self.drain_job_queue()
+                else:
+                    self.catch_up_news()
+
+                while True:
+                    if datetime.now() - last_hourly_log >= timedelta(hours=1):
+                        self.log_hourly_stats()
+                        last_hourly_log = datetime.now()
+
+                    # Любой execute (догонялка, обработка, SELECT 1) переносит пришедшие NOTIFY
+                    # в conn.notifies - сокет после этого пуст, поэтому select() только если список пуст
+                    if not self.conn.notifies:
+                        timeout = self.config.LISTEN_TIMEOUT_SECONDS
+                        if self.coalescer is not None and self.coalescer.seconds_until_due() is not None:
+                            timeout = min(timeout, self.coalescer.seconds_until_due())
+
+                        if select.select([self.conn], [], [], timeout) == ([], [], []):
+                            # Тишина - проверяем, что соединение живо, и закрываем созревшие группы
+                            cursor.execute("SELECT 1")
+                            if self.coalescer is not None and self.coalescer.groups:
+                                self.flush_coalesced()
+                                self.advance_high_water_mark()
+                            if self.config.SIGNAL_QUEUE_MODE:
+                                # Подошли повторы с отсрочкой или истекли чужие аренды
+                                self.drain_job_queue()
+                            if not self.conn.notifies:
+                                continue
+                        else:
+                            self.conn.poll()
+
+                    if self.config.SIGNAL_QUEUE_MODE:
+                        # Уведомление - только сигнал проснуться, задачи берём из signal_jobs
+                        self.conn.notifies.clear()
+                        self.drain_job_queue()
+                        continue
+
+                    news_ids = []
+                    while self.conn.notifies:
+                        notify = self.conn.notifies.pop(0)
+                        if notify.payload not in news_ids:
+                            news_ids.append(notify.payload)
+
+                    for news_id in news_ids:
+                        logger.info(f"Received notification: new_significant_news ({news_id})")
+                        self.process_news(news_id)
+                    self.flush_coalesced()
+                    if news_ids:
+                        self.advance_high_water_mark()
+
+            except KeyboardInterrupt:
+                logger.info("Interrupted by user")
+                return
+            except Exception as e:
+                logger.error(f"Error in notification listener: {e}, reconnecting in {reconnect_delay}s")
+                self.stats['errors'] += 1
+                try:
+                    self.conn.close()
+                except Exception:
+                    pass
+                time.sleep(reconnect_delay)
+                reconnect_delay = min(reconnect_delay * 2, 60)
+
+    def drain_job_queue(self):
+        """Режим очереди: ставит новые значимые новости в signal_jobs и обрабатывает задачи, пока они есть"""
+        self.enqueue_jobs()
+        while True:
+            job = self.claim_job()
+            if job is None:
+                return
+            news_id, attempts = job
+            self.stats['jobs_claimed'] += 1
+            try:
+                self.process_news(news_id, raise_errors=True)
+            except Exception as e:
+                self.fail_job(news_id, attempts, e)
+            else:
+                self.complete_job(news_id)
+
+    def enqueue_jobs(self):
+        """Идемпотентно: повторная постановка той же новости игнорируется, в т.ч. другими воркерами"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO signal_jobs (news_id)
+            SELECT id FROM news_items
+            WHERE is_significant = TRUE
+              AND processed_by_block2 = FALSE
+              AND processed_at >= NOW() - make_interval(hours => %s)
+            ON CONFLICT (news_id) DO NOTHING
+        """, (self.config.CATCHUP_MAX_AGE_HOURS,))
+        if cursor.rowcount:
+            logger.info(f"Queued {cursor.rowcount} news for signal extraction")
+
+    def claim_job(self):
+        """Берёт одну задачу под аренду. Заблокированные другими воркерами строки пропускаются"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE signal_jobs
+            SET state = 'running', attempts = attempts + 1, worker_id = %s,
+                lease_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+            WHERE news_id = (
+                SELECT news_id FROM signal_jobs
+                WHERE (state = 'pending' AND available_at <= NOW())
+                   OR (state = 'running' AND lease_until < NOW())
+                ORDER BY available_at, news_id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING news_id, attempts
+        """, (self.worker_id, self.config.JOB_LEASE_SECONDS))
+        return cursor.fetchone()
+
+    def complete_job(self, news_id):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE signal_jobs
+            SET state = 'done', lease_until = NULL, updated_at = NOW()
+            WHERE news_id = %s AND worker_id = %s
+        """, (news_id, self.worker_id))
+
+    def fail_job(self, news_id, attempts, error):
+        """Повтор с экспоненциальной отсрочкой; после JOB_MAX_ATTEMPTS - в dead-letter (state='dead')"""
+        dead = attempts >= self.config.JOB_MAX_ATTEMPTS
+        delay = self.config.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE signal_jobs
+            SET state = %s, lease_until = NULL, last_error = %s, updated_at = NOW(),
+                available_at = NOW() + make_interval(secs => %s)
+            WHERE news_id = %s AND worker_id = %s
+        """, ('dead' if dead else 'pending', str(error)[:1000], delay, news_id, self.worker_id))
+
+        if dead:
+            self.stats['jobs_dead'] += 1
+            logger.error(f"News {news_id} moved to dead-letter after {attempts} attempts: {error}")
+        else:
+            self.stats['jobs_retried'] += 1
+            logger.warning(f"News {news_id} failed (attempt {attempts}), retry in {delay}s")
+
+    def catch_up_news(self):
+        """Обрабатывает все значимые новости, не обработанные с момента высшей отметки.
+
+        Новость, ставшая значимой уже после вставки (ранний вердикт дописан позже),
+        может оказаться ниже отметки - её ловит окно CATCHUP_GRACE_MINUTES по processed_at.
+        """
+        last_news_id, marked_at = self.load_high_water_mark()
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id FROM news_items
+            WHERE is_significant = TRUE
+              AND processed_by_block2 = FALSE
+              AND (id > %s OR processed_at >= %s)
+            ORDER BY id
+        """, (last_news_id, marked_at - timedelta(minutes=self.config.CATCHUP_GRACE_MINUTES)))
+        pending_news = cursor.fetchall()
+
+        if pending_news:
+            logger.info(f"Catching up {len(pending_news)} unprocessed news since #{last_news_id}")
+            for (news_id,) in pending_news:
+                self.process_news(news_id)
+        self.advance_high_water_mark()
+
+    def load_high_water_mark(self):
+        """(last_news_id, updated_at) слушателя. При первом запуске старые новости не поднимаем"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO listener_state (listener, last_news_id)
+            SELECT %s, COALESCE(MAX(id), 0) FROM news_items
+            WHERE published_at < NOW() - make_interval(hours => %s)
+            ON CONFLICT (listener) DO NOTHING
+        """, (LISTENER_NAME, self.config.CATCHUP_MAX_AGE_HOURS))
+        cursor.execute("SELECT last_news_id, updated_at FROM listener_state WHERE listener = %s", (LISTENER_NAME,))
+        return cursor.fetchone()
+
+    def advance_high_water_mark(self):
+        """Двигает отметку до последней новости, ниже которой всё значимое обработано"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                UPDATE listener_state
+                SET last_news_id = GREATEST(last_news_id, COALESCE(
+                        (SELECT MIN(id) - 1 FROM news_items
+                         WHERE id > listener_state.last_news_id
+                           AND is_significant = TRUE AND processed_by_block2 = FALSE),
+                        (SELECT MAX(id) FROM news_items),
+                        last_news_id)),
+                    updated_at = NOW()
+                WHERE listener = %s
+            """, (LISTENER_NAME,))
         except Exception as e:
-            logger.error(f"Error in notification listener: {e}")
-            self.stats['errors'] += 1
-            # Переподключаемся и продолжаем
-            time.sleep(5)
-            self.connect_db()
-            self.listen_for_notifications()
+            logger.error(f"Failed to advance high-water mark: {e}")
+
+    def process_news(self, news_id: str, raise_errors: bool = False):
+        """Обрабатывает одну новость.
 
-    def process_news(self, news_id: str):
-        """Обрабатывает одну новость"""
+        raise_errors - ошибку пробрасываем вызывающему (очередь signal_jobs повторит),
+        а не отмечаем новость пропущенной.
+        """
         start_time = time.time()
 
         try:
             # Загружаем данные новости
-            news_data = self.load_news_data(news_id)
+            news_data = self.load_news_data(news_id, raise_errors=raise_errors)
             if not news_data:
                 logger.warning(f"News {news_id} not found or already processed")
                 return
@@ -203,63 +500,170 @@ class SignalExtractorService:
                 self.mark_news_skipped(news_id, delay_info['reason'])
                 return
 
+            # Окно склейки: новости о тех же тикерах обработаем одной генерацией
+            if self.coalescer is not None and not raise_errors:
+                is_known = self.ticker_validator.is_listed if self.ticker_validator.has_symbol_master() else None
+                entities = extract_entities(news_data['headline'], news_data['summary'],
+                                            self.load_related_tickers(news_data['source_key']), is_known)
+                if entities:
+                    if self.coalescer.add(news_data, entities):
+                        logger.info(f"News {news_id} buffered for coalescing on {sorted(entities)}")
+                    return
+
+            self.generate_and_save(news_data, [news_data['id']], market_status, wave_status, raise_errors, start_time)
+
+        except Exception as e:
+            logger.error(f"Failed to process news {news_id}: {e}")
+            self.stats['errors'] += 1
+            if raise_errors:
+                raise
+            self.mark_news_skipped(news_id, f"Processing error: {str(e)}")
+
+    def process_news_group(self, items: List[Dict]):
+        """Группа новостей о пересекающихся тикерах - один анализ волн и одна генерация сигналов.
+
+        Волна отсчитывается от самой ранней новости группы, сигналы ссылаются на все новости.
+        """
+        start_time = time.time()
+        items = sorted(items, key=lambda item: item['published_at'])
+        source_ids = [item['id'] for item in items]
+
+        try:
+            primary = items[0]
+            news_data = dict(primary)
+            news_data['age_minutes'] = int((datetime.now(timezone.utc) - primary['published_at']).total_seconds() / 60)
+            if len(items) > 1:
+                self.stats['coalesced_news'] += len(items) - 1
+                news_data['headline'] = f"{primary['headline']} (+{len(items) - 1} related stories)"
+                news_data['summary'] = "\n".join(
+                    f"[{i + 1}] {item['headline']}: {item['summary'][:400]}" for i, item in enumerate(items)
+                )
+                logger.info(f"Processing {len(items)} coalesced news {source_ids}: {primary['headline'][:50]}...")
+
+            market_status = self.market_detector.get_current_status()
+            wave_status = self.config.get_wave_info(news_data['age_minutes'])
+            self.generate_and_save(news_data, source_ids, market_status, wave_status, False, start_time)
+
+        except Exception as e:
+            logger.error(f"Failed to process news group {source_ids}: {e}")
+            self.stats['errors'] += 1
+            for news_id in source_ids:
+                self.mark_news_skipped(news_id, f"Processing error: {str(e)}")
+
+    def flush_coalesced(self):
+        """Обрабатывает группы, у которых закончилось окно склейки"""
+        if self.coalescer is None:
+            return
+        for group in self.coalescer.pop_due():
+            self.process_news_group(group['items'])
+
+    def generate_and_save(self, news_data: Dict, source_ids: List[int], market_status, wave_status,
+                          raise_errors: bool, start_time: float):
+        """LLM-часть обработки: волна, сигналы, валидация, сохранение и отметка source_ids"""
+        wave_analysis, signals = None, None
+        if self.config.LLM_COMBINED_CALL:
+            # Волна и сигналы одним вызовом LLM
+            logger.info("Analyzing waves and generating signals with one LLM call...")
+            combined = self.wave_analyzer.analyze_and_generate(
+                news_data, wave_status, market_status.value
+            )
+            self.stats['llm_calls'] += 1
+            if combined is not None:
+                wave_analysis, signals = combined
+                self.stats['combined_calls'] += 1
+
+        if wave_analysis is None:
             # Анализ волн через LLM
             logger.info("Analyzing waves with LLM...")
             wave_analysis = self.wave_analyzer.analyze_waves(
-                news_data, wave_status, market_status.value
+                news_data, wave_status, market_status.value, raise_errors=raise_errors
             )
             self.stats['llm_calls'] += 1
 
-            logger.info(f"Wave analysis complete:")
-            logger.info(f"  Optimal wave: {wave_analysis['optimal_wave']}")
-            logger.info(f"  News type: {wave_analysis['news_type']}")
-            logger.info(f"  Reasoning: {wave_analysis['wave_reasoning'][:100]}...")
+        logger.info(f"Wave analysis complete:")
+        logger.info(f"  Optimal wave: {wave_analysis['optimal_wave']}")
+        logger.info(f"  News type: {wave_analysis['news_type']}")
+        logger.info(f"  Reasoning: {wave_analysis['wave_reasoning'][:100]}...")
 
+        if signals is None:
             # Генерация сигналов
             logger.info(f"Generating signals for wave {wave_analysis['optimal_wave']}...")
-            signals = self.wave_analyzer.generate_signals(news_data, wave_analysis)
+            signals = self.wave_analyzer.generate_signals(news_data, wave_analysis, raise_errors=raise_errors)
             self.stats['llm_calls'] += 1
 
-            if not signals:
-                logger.warning("No signals generated")
+        if not signals:
+            logger.warning("No signals generated")
+            for news_id in source_ids:
                 self.mark_news_processed(news_id, "No signals generated")
-                return
+            return
 
-            # Валидация и фильтрация сигналов
-            valid_signals = self.validate_and_filter_signals(signals)
+        # Валидация и фильтрация сигналов
+        valid_signals = self.validate_and_filter_signals(signals)
 
-            if not valid_signals:
-                logger.warning("All signals filtered out")
+        if not valid_signals:
+            logger.warning("All signals filtered out")
+            for news_id in source_ids:
                 self.mark_news_processed(news_id, "All signals filtered")
-                return
+            return
 
-            # Сохранение сигналов
-            saved_count = self.save_signals(news_id, valid_signals, wave_analysis)
+        # Пока шёл LLM, финальный вердикт мог снять значимость раннего (News Analyzer)
+        if not self.still_significant(source_ids):
+            logger.warning(f"News {source_ids} no longer significant, signals discarded")
+            for news_id in source_ids:
+                self.mark_news_processed(news_id, "Significance retracted")
+            return
 
-            # Обновляем статистику
-            self.stats['news_processed'] += 1
-            self.stats['signals_generated'] += saved_count
+        # Сохранение сигналов
+        saved_count = self.save_signals(news_data['id'], valid_signals, wave_analysis, source_ids)
+        if raise_errors and saved_count == 0:
+            raise RuntimeError("Failed to save signals")
 
-            wave = wave_analysis['optimal_wave']
-            self.stats['wave_distribution'][wave] = self.stats['wave_distribution'].get(wave, 0) + saved_count
+        # Обновляем статистику
+        self.stats['news_processed'] += len(source_ids)
+        self.stats['signals_generated'] += saved_count
+
+        wave = wave_analysis['optimal_wave']
+        self.stats['wave_distribution'][wave] = self.stats['wave_distribution'].get(wave, 0) + saved_count
 
-            processing_time = time.time() - start_time
-            logger.info(f"News processed successfully: {saved_count} signals saved in {processing_time:.1f}s")
+        processing_time = time.time() - start_time
+        logger.info(f"News processed successfully: {saved_count} signals saved in {processing_time:.1f}s")
 
-            # Отмечаем новость как обработанную
+        # Отмечаем новости как обработанные
+        for news_id in source_ids:
             self.mark_news_processed(news_id)
 
+    def still_significant(self, news_ids: List[int]) -> bool:
+        """Хотя бы одна из новостей всё ещё значима. При ошибке БД считаем значимой"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT bool_or(is_significant) FROM news_items WHERE id = ANY(%s)", (list(news_ids),))
+            row = cursor.fetchone()
+            return row[0] is not False
         except Exception as e:
-            logger.error(f"Failed to process news {news_id}: {e}")
-            self.stats['errors'] += 1
-            self.mark_news_skipped(news_id, f"Processing error: {str(e)}")
+            logger.error(f"Significance re-check failed for {news_ids}: {e}")
+            return True
+
+    def load_related_tickers(self, source_key: str) -> str:
+        """Поле related из сырой новости источника (Finnhub company news), если есть"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT payload->>'related' FROM news_raw WHERE news_id = %s", (source_key,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.debug(f"No related tickers for {source_key}: {e}")
+            return None
+
+    def load_news_data(self, news_id: str, raise_errors: bool = False) -> Dict:
+        """Загружает данные новости из БД.
 
-    def load_news_data(self, news_id: str) -> Dict:
-        """Загружает данные новости из БД"""
+        None - новости нет или она уже обработана; ошибку БД при raise_errors пробрасываем,
+        чтобы задача signal_jobs ушла на повтор, а не считалась выполненной.
+        """
         try:
             cursor = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
             cursor.execute("""
-                SELECT id, headline, summary, published_at, significance_score, reasoning, processed_by_block2
+                SELECT id, news_id, headline, summary, published_at, significance_score, reasoning, processed_by_block2
                 FROM news_items
                 WHERE id = %s AND is_significant = TRUE
             """, (news_id,))
@@ -282,6 +686,7 @@ class SignalExtractorService:
 
             return {
                 'id': row['id'],
+                'source_key': row['news_id'],
                 'headline': row['headline'],
                 'summary': row['summary'] or '',
                 'published_at': published_at,
@@ -292,6 +697,8 @@ class SignalExtractorService:
 
         except Exception as e:
             logger.error(f"Failed to load news {news_id}: {e}")
+            if raise_errors:
+                raise
             return None
 
     def validate_and_filter_signals(self, signals: List[Dict]) -> List[Dict]:
@@ -311,59 +718,69 @@ class SignalExtractorService:
                            f"({signal['confidence']}% < {self.config.MIN_CONFIDENCE}%)")
                 continue
 
-            # Отключаем валидацию тикеров - LLM генерирует валидные тикеры
-            # Yahoo Finance rate limits (429) блокируют валидацию на Railway
-            signal['ticker_validated'] = False
-            signal['ticker_exists'] = True  # Доверяем LLM
+            # Проверка тикера: справочник символов, yfinance - только для неизвестных.
+            # Ошибка yfinance (429, сеть) - тикер не подтверждён, но и не отклонён
+            validation = self.ticker_validator.validate_ticker(signal['ticker'])
+            if not validation['exists'] and 'error' not in validation:
+                logger.warning(f"Signal filtered: unknown ticker {signal['ticker']}")
+                self.stats['unknown_tickers'] += 1
+                continue
+            signal['ticker_validated'] = validation['exists']
+            signal['ticker_exists'] = True
 
             valid_signals.append(signal)
 
         logger.info(f"Validation complete: {len(valid_signals)}/{len(signals)} signals valid")
         return valid_signals
 
-    def save_signals(self, news_id: str, signals: List[Dict], wave_analysis: Dict) -> int:
-        """Сохраняет сигналы в БД"""
-        try:
-            cursor = self.conn.cursor()
-            saved_count = 0
+    def save_signals(self, news_id: str, signals: List[Dict], wave_analysis: Dict,
+                     source_news_ids: List[int] = None) -> int:
+        """Сохраняет все сигналы новости одним INSERT.
 
-            for signal in signals:
-                # Рассчитываем временные окна
-                now = datetime.now(timezone.utc)
-                wave = wave_analysis['optimal_wave']
-                wave_timing = self._calculate_entry_timing(wave)
+        source_news_ids - все новости, на которых основаны сигналы (склейка), по умолчанию [news_id].
 
-                # Calculate max_hold based on wave
-                wave_intervals = self.config.WAVE_INTERVALS
-                start_min, end_min = wave_intervals.get(wave, (0, 1440))
-                max_hold_minutes = end_min - start_min
-                max_hold_hours = max(max_hold_minutes / 60, 0.5)  # Минимум 30 минут
+        Один оператор - одна транзакция и одно уведомление new_trading_signals
+        со списком id (триггер уровня оператора).
+        """
+        try:
+            wave = wave_analysis['optimal_wave']
 
-                cursor.execute("""
-                    INSERT INTO trading_signals (
-                        news_item_id, signal_type, confidence, elliott_wave,
-                        wave_description, reasoning, market_conditions
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    news_id,
-                    signal['action'],  # BUY/SELL/HOLD
-                    signal['confidence'],  # Already 0-100, store as-is
-                    wave,
-                    f"Wave {wave} - {signal.get('wave_description', 'Elliott Wave analysis')}",
-                    signal['reasoning'],
-                    psycopg2.extras.Json({
-                        'ticker': signal['ticker'],
-                        'expected_move': signal.get('expected_move', 0),
-                        'stop_loss_percent': self.config.DEFAULT_STOP_LOSS_PERCENT,
-                        'take_profit_percent': self.config.DEFAULT_TAKE_PROFIT_PERCENT,
-                        'max_hold_hours': max_hold_hours,  # Dynamic based on wave
-                        'ticker_validated': signal.get('ticker_validated', True),
-                        'ticker_exists': signal.get('ticker_exists', True)
-                    })
-                ))
-                saved_count += 1
-
-            logger.info(f"Saved {saved_count} signals to database")
+            # Calculate max_hold based on wave
+            wave_intervals = self.config.WAVE_INTERVALS
+            start_min, end_min = wave_intervals.get(wave, (0, 1440))
+            max_hold_minutes = end_min - start_min
+            max_hold_hours = max(max_hold_minutes / 60, 0.5)  # Минимум 30 минут
+
+            rows = [(
+                news_id,
+                signal['action'],  # BUY/SELL/HOLD
+                signal['confidence'],  # Already 0-100, store as-is
+                wave,
+                f"Wave {wave} - {signal.get('wave_description', 'Elliott Wave analysis')}",
+                signal['reasoning'],
+                psycopg2.extras.Json({
+                    'ticker': signal['ticker'],
+                    'expected_move': signal.get('expected_move', 0),
+                    'stop_loss_percent': self.config.DEFAULT_STOP_LOSS_PERCENT,
+                    'take_profit_percent': self.config.DEFAULT_TAKE_PROFIT_PERCENT,
+                    'max_hold_hours': max_hold_hours,  # Dynamic based on wave
+                    'ticker_validated': signal.get('ticker_validated', True),
+                    'ticker_exists': signal.get('ticker_exists', True)
+                }),
+                source_news_ids or [news_id]
+            ) for signal in signals]
+
+            cursor = self.conn.cursor()
+            signal_ids = psycopg2.extras.execute_values(cursor, """
+                INSERT INTO trading_signals (
+                    news_item_id, signal_type, confidence, elliott_wave,
+                    wave_description, reasoning, market_conditions, source_news_ids
+                ) VALUES %s
+                RETURNING id
+            """, rows, page_size=max(len(rows), 1), fetch=True)
+
+            saved_count = len(signal_ids)
+            logger.info(f"Saved {saved_count} signals to database: {[row[0] for row in signal_ids]}")
             return saved_count
 
         except Exception as e:
@@ -418,7 +835,25 @@ class SignalExtractorService:
         logger.info("📊 Hourly stats:")
         logger.info(f"  News processed: {self.stats['news_processed']}")
         logger.info(f"  Signals generated: {self.stats['signals_generated']}")
-        logger.info(f"  LLM calls: {self.stats['llm_calls']}")
+        logger.info(f"  LLM calls: {self.stats['llm_calls']} ({self.stats['combined_calls']} combined wave+signal)")
+        if self.coalescer is not None:
+            logger.info(f"  Coalescing: {self.stats['coalesced_news']} news merged into "
+                        f"{self.coalescer.stats['groups']} groups")
+        llm_usage = self.llm_recorder.get_stats()
+        avg_latency = llm_usage['latency_ms'] / max(llm_usage['calls'], 1)
+        logger.info(f"  LLM tokens used: {llm_usage['prompt_tokens']:,} prompt + {llm_usage['completion_tokens']:,} completion "
+                    f"(${llm_usage['cost']:.4f}), avg latency {avg_latency:.0f}ms")
+        hedge_stats = self.wave_analyzer.caller.get_stats()
+        logger.info(f"  LLM hedging: {hedge_stats['hedged']}/{hedge_stats['calls']} hedged, "
+                    f"{hedge_stats['hedge_wins']} won by hedge, {hedge_stats['timeouts']} timeouts, "
+                    f"{hedge_stats['hedge_skipped_budget']} skipped by budget")
+        if self.config.LLM_JSON_SIGNALS:
+            schema_stats = self.wave_analyzer.stats
+            logger.info(f"  Signal JSON: {schema_stats['invalid_signals']} invalid, "
+                        f"{schema_stats['repaired_signals']} repaired, {schema_stats['dropped_signals']} dropped")
+        if self.config.SIGNAL_QUEUE_MODE:
+            logger.info(f"  Jobs ({self.worker_id}): {self.stats['jobs_claimed']} claimed, "
+                        f"{self.stats['jobs_retried']} retried, {self.stats['jobs_dead']} dead-lettered")
         logger.info(f"  Errors: {self.stats['errors']}")
         logger.info(f"  Uptime: {uptime_str}")
 
@@ -432,6 +867,9 @@ class SignalExtractorService:
         logger.info(f"  Ticker cache: {cache_stats['valid_count']} valid, "
                    f"{cache_stats['invalid_count']} invalid, "
                    f"age {cache_stats['cache_age_minutes']:.1f} min")
+        logger.info(f"  Symbol master: {cache_stats['master_symbols']} symbols, "
+                    f"{cache_stats['master_hits']} hits, {cache_stats['yfinance_lookups']} yfinance lookups, "
+                    f"{self.stats['unknown_tickers']} unknown tickers filtered")
 
     def run(self):
         """Основной цикл"""
@@ -440,48 +878,15 @@ class SignalExtractorService:
                    f"min_move={self.config.MIN_EXPECTED_MOVE_PERCENT}%, "
                    f"min_confidence={self.config.MIN_CONFIDENCE}%")
 
-        last_hourly_log = datetime.now()
-
         try:
-            # Обрабатываем необработанные новости
-            self.process_pending_news()
-
-            # Основной цикл прослушивания
-            while True:
-                # Логируем статистику каждый час
-                if datetime.now() - last_hourly_log >= timedelta(hours=1):
-                    self.log_hourly_stats()
-                    last_hourly_log = datetime.now()
-
-                # Слушаем уведомления (блокирующий вызов)
-                self.listen_for_notifications()
+            # Догоняем необработанные новости и слушаем уведомления (переподключение внутри)
+            self.listen_for_notifications()
 
         except KeyboardInterrupt:
             logger.info("Service stopped by user")
         except Exception as e:
             logger.error(f"Service error: {e}")
 
-    def process_pending_news(self):
-        """Обрабатывает необработанные новости при запуске"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT id FROM news_items
-                WHERE is_significant = TRUE
-                  AND processed_by_block2 = FALSE
-                ORDER BY processed_at DESC
-                LIMIT 10
-            """)
-
-            pending_news = cursor.fetchall()
-            if pending_news:
-                logger.info(f"Found {len(pending_news)} pending news items")
-                for (news_id,) in pending_news:
-                    self.process_news(news_id)
-
-        except Exception as e:
-            logger.error(f"Failed to process pending news: {e}")
-
 if __name__ == "__main__":
     service = SignalExtractorService()
-    service.run()
\ No newline at end of file
+    service.run()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Coalescing of concurrent significant news on the same symbols - одна генерация сигналов на группу
+"""
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Тикеры в тексте: $NVDA, (NASDAQ: NVDA), отдельное слово капсом
+CASHTAG_RE = re.compile(r"\$([A-Z]{1,5}(?:\.[A-Z])?)\b")
+EXCHANGE_RE = re.compile(r"\((?:NASDAQ|NYSE|NYSE American|AMEX|OTC)\s*:\s*([A-Z]{1,5}(?:\.[A-Z])?)\)")
+CAPS_RE = re.compile(r"\b([A-Z]{2,5})\b")
+
+# Слова капсом, которые не тикеры
+NOT_TICKERS = {
+    'AI', 'US', 'USA', 'UK', 'EU', 'CEO', 'CFO', 'CTO', 'IPO', 'ETF', 'SEC', 'FDA', 'FTC', 'DOJ', 'FED',
+    'GDP', 'CPI', 'PPI', 'PMI', 'EPS', 'YOY', 'QOQ', 'NYSE', 'NASDAQ', 'OTC',
+    'AMEX', 'ET', 'PT', 'EST', 'UPDATE', 'BREAKING', 'LLC', 'INC', 'LTD', 'PLC', 'AG', 'SA', 'NV', 'THE',
+    'AND', 'FOR', 'NEW', 'OPEC', 'ECB', 'BOJ', 'IMF', 'WHO', 'EV', 'EVS', 'ESG', 'API', 'IT'
+}
+
+def extract_entities(headline, summary, related=None, is_known=None):
+    """Множество тикеров, упомянутых в новости.
+
+    related - поле related источника (Finnhub company news), is_known(symbol) -
+    необязательная проверка по справочнику символов для слов капсом.
+    """
+    text = f"{headline or ''} {summary or ''}"
+    entities = set(CASHTAG_RE.findall(text)) | set(EXCHANGE_RE.findall(text))
+    if related:
+        entities |= {t.strip().upper() for t in related.split(',') if t.strip()}
+
+    for word in CAPS_RE.findall(headline or ''):
+        if word in NOT_TICKERS:
+            continue
+        if is_known is None or is_known(word):
+            entities.add(word)
+    return entities
+
+class NewsCoalescer:
+    def __init__(self, window_seconds):
+        # Группа копит новости window_seconds с момента появления первой
+        self.window_seconds = window_seconds
+        self.groups = []  # {'entities': set, 'items': [...], 'opened_at': monotonic}
+        self.stats = {
+            'news': 0,
+            'groups': 0,
+            'merged': 0
+        }
+
+    def __len__(self):
+        return sum(len(group['items']) for group in self.groups)
+
+    def __contains__(self, news_id):
+        return any(item['id'] == news_id for group in self.groups for item in group['items'])
+
+    def add(self, item, entities):
+        """Кладёт новость в группу с пересекающимися тикерами (группы, связанные новостью, сливаются).
+
+        Новость, уже лежащая в открытой группе (догонялка после переподключения), игнорируется.
+        """
+        if item['id'] in self:
+            logger.debug(f"News {item['id']} already buffered for coalescing")
+            return False
+        self.stats['news'] += 1
+        overlapping = [group for group in self.groups if entities and group['entities'] & entities]
+
+        if not overlapping:
+            self.groups.append({'entities': set(entities), 'items': [item], 'opened_at': time.monotonic()})
+            self.stats['groups'] += 1
+            return True
+
+        target = overlapping[0]
+        for group in overlapping[1:]:
+            target['entities'] |= group['entities']
+            target['items'].extend(group['items'])
+            target['opened_at'] = min(target['opened_at'], group['opened_at'])
+            self.groups.remove(group)
+        target['entities'] |= entities
+        target['items'].append(item)
+        self.stats['merged'] += 1
+        logger.info(f"Coalesced news into group {sorted(target['entities'])} ({len(target['items'])} items)")
+        return True
+
+    def seconds_until_due(self):
+        """Сколько ждать до закрытия ближайшей группы (None - групп нет)"""
+        if not self.groups:
+            return None
+        oldest = min(group['opened_at'] for group in self.groups)
+        return max(0.0, oldest + self.window_seconds - time.monotonic())
+
+    def pop_due(self):
+        """Группы, у которых закончилось окно"""
+        now = time.monotonic()
+        due = [group for group in self.groups if now - group['opened_at'] >= self.window_seconds]
+        for group in due:
+            self.groups.remove(group)
+        return due
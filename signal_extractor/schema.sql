@@ -66,25 +66,38 @@ CREATE TRIGGER trigger_notify_significant_news
     FOR EACH ROW
     EXECUTE FUNCTION notify_new_significant_news();
 
--- Функция для уведомлений о новых сигналах
-CREATE OR REPLACE FUNCTION notify_new_trading_signals() RETURNS TRIGGER AS $$
+-- Снимаем все триггеры на функции сигналов (старые построчные под любыми именами)
+DO $$
 DECLARE
-    signal_count INTEGER;
+    t RECORD;
 BEGIN
-    -- Считаем количество сигналов для этой новости
-    SELECT COUNT(*) INTO signal_count
-    FROM signals
-    WHERE news_id = NEW.news_id;
-
-    -- Отправляем уведомление с количеством сигналов
-    PERFORM pg_notify('new_trading_signals', signal_count::text);
+    FOR t IN
+        SELECT tg.tgname, tg.tgrelid::regclass AS rel
+        FROM pg_trigger tg JOIN pg_proc p ON tg.tgfoid = p.oid
+        WHERE p.proname = 'notify_new_trading_signals' AND NOT tg.tgisinternal
+    LOOP
+        EXECUTE format('DROP TRIGGER %I ON %s', t.tgname, t.rel);
+    END LOOP;
+END
+$$;
 
-    RETURN NEW;
+-- Функция для уведомлений о новых сигналах
+CREATE OR REPLACE FUNCTION notify_new_trading_signals()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Одно уведомление на INSERT: JSON со всеми id вставленных сигналов
+    IF EXISTS (SELECT 1 FROM new_signals) THEN
+        PERFORM pg_notify('new_trading_signals',
+            (SELECT json_build_object('ids', json_agg(id ORDER BY id))::text FROM new_signals));
+    END IF;
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
--- Триггер для уведомлений о новых сигналах
+-- Триггер уровня оператора: пачка сигналов одной новости - одно уведомление
+DROP TRIGGER IF EXISTS trigger_notify_trading_signals ON signals;
 CREATE TRIGGER trigger_notify_trading_signals
     AFTER INSERT ON signals
-    FOR EACH ROW
+    REFERENCING NEW TABLE AS new_signals
+    FOR EACH STATEMENT
     EXECUTE FUNCTION notify_new_trading_signals();
\ No newline at end of file
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+JSON schema of LLM trading signals - strict validation of per-signal objects
+"""
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Схема одного сигнала в ответе LLM (JSON-массив таких объектов).
+# Лишние ключи допустимы: validate_signal их не проверяет, to_signal отбрасывает
+SIGNAL_SCHEMA = {
+    "type": "array",
+    "maxItems": 5,
+    "items": {
+        "type": "object",
+        "required": ["ticker", "action", "expected_move", "confidence", "reasoning"],
+        "properties": {
+            "ticker": {"type": "string", "pattern": "^[A-Z]{1,5}([.-][A-Z])?$"},
+            "action": {"type": "string", "enum": ["BUY", "SHORT"]},
+            "expected_move": {"type": "number", "exclusiveMinimum": 0, "maximum": 50},
+            "confidence": {"type": "integer", "minimum": 0, "maximum": 100},
+            "reasoning": {"type": "string", "minLength": 10}
+        }
+    }
+}
+
+SIGNAL_FIELDS = SIGNAL_SCHEMA['items']['properties']
+TICKER_RE = re.compile(SIGNAL_FIELDS['ticker']['pattern'])
+FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+def schema_prompt():
+    """Схема для описания поля вывода"""
+    return json.dumps(SIGNAL_SCHEMA, separators=(',', ':'))
+
+def parse_json(text):
+    """JSON из ответа LLM (допускаем обёртку ```json ... ```). Ошибка - ValueError"""
+    if not isinstance(text, str):
+        return text
+    return json.loads(FENCE_RE.sub("", text.strip()))
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def field_error(name, value):
+    """Ошибка значения поля сигнала по схеме или None. Без приведения типов"""
+    if name == 'ticker':
+        if not isinstance(value, str) or not TICKER_RE.match(value):
+            return "must be one uppercase US ticker symbol like NVDA or BRK.B"
+    elif name == 'action':
+        if value not in SIGNAL_FIELDS['action']['enum']:
+            return "must be BUY or SHORT"
+    elif name == 'expected_move':
+        if not _is_number(value) or not 0 < value <= SIGNAL_FIELDS['expected_move']['maximum']:
+            return "must be a positive number of percent, at most 50, without % sign"
+    elif name == 'confidence':
+        if not _is_number(value) or not 0 <= value <= 100 or value != int(value):
+            return "must be an integer 0-100"
+    elif name == 'reasoning':
+        if not isinstance(value, str) or len(value.strip()) < SIGNAL_FIELDS['reasoning']['minLength']:
+            return "must be a non-empty explanation"
+    return None
+
+def validate_signal(obj):
+    """Проверяет объект сигнала. Возвращает {поле: ошибка}; пустой словарь - сигнал валиден.
+
+    Лишние поля не считаются ошибкой - to_signal их отбрасывает.
+    """
+    if not isinstance(obj, dict):
+        return {'*': "must be a JSON object"}
+    errors = {}
+    for name in SIGNAL_FIELDS:
+        error = "missing" if name not in obj else field_error(name, obj[name])
+        if error:
+            errors[name] = error
+    return errors
+
+def to_signal(obj):
+    """Валидный объект схемы -> сигнал в формате сервиса"""
+    return {
+        'ticker': obj['ticker'],
+        'action': obj['action'],
+        'expected_move': float(obj['expected_move']),
+        'confidence': int(obj['confidence']),
+        'reasoning': obj['reasoning'].strip()
+    }
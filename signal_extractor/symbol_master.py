@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Offline symbol master for Signal Extractor - справочник листинга США без обращения к yfinance
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Ежедневные файлы NASDAQ Trader: все бумаги NASDAQ и остальных бирж США
+NASDAQ_LISTED_URL = "https://www.nasdaqtrader.com/dynamic/SymDir/nasdaqlisted.txt"
+OTHER_LISTED_URL = "https://www.nasdaqtrader.com/dynamic/SymDir/otherlisted.txt"
+
+# Коды бирж в otherlisted.txt
+EXCHANGE_CODES = {
+    'A': 'NYSE American',
+    'N': 'NYSE',
+    'P': 'NYSE Arca',
+    'Z': 'Cboe BZX',
+    'V': 'IEX'
+}
+
+def normalize_symbol(symbol):
+    """BRK-B, brk.b, BRK/B -> BRK.B"""
+    return symbol.strip().upper().replace('-', '.').replace('/', '.')
+
+def _parse_listing(text, symbol_col, exchange_col=None):
+    """Строки pipe-файла NASDAQ Trader -> {symbol: (exchange, name)}, без тестовых бумаг"""
+    lines = text.strip().splitlines()
+    header = lines[0].split('|')
+    symbol_idx = header.index(symbol_col)
+    name_idx = header.index('Security Name')
+    test_idx = header.index('Test Issue')
+    exchange_idx = header.index(exchange_col) if exchange_col else None
+
+    listing = {}
+    for line in lines[1:]:
+        if line.startswith('File Creation Time'):
+            continue
+        parts = line.split('|')
+        if len(parts) != len(header) or parts[test_idx] == 'Y':
+            continue
+        exchange = 'NASDAQ' if exchange_idx is None else EXCHANGE_CODES.get(parts[exchange_idx], parts[exchange_idx])
+        listing[normalize_symbol(parts[symbol_idx])] = (exchange, parts[name_idx].strip())
+    return listing
+
+class SymbolMaster:
+    def __init__(self, path, refresh_hours=24, retry_minutes=30):
+        # Локальный файл: symbol \t exchange \t name \t sector, обновляется раз в refresh_hours
+        self.path = path
+        self.refresh_seconds = refresh_hours * 3600
+        self.retry_seconds = retry_minutes * 60
+        self.index = {}  # symbol -> (exchange, name, sector)
+        self.loaded_at = 0.0  # mtime загруженного файла
+        self.last_attempt = 0.0
+        self.http = requests.Session()
+        # add() и замена индекса при обновлении - под одной блокировкой;
+        # добавленные во время скачивания символы переносятся в новый индекс
+        self._lock = threading.Lock()
+        self._pending_adds = {}
+        self._stop = threading.Event()
+        self.thread = None
+        self.stats = {
+            'refreshes': 0,
+            'refresh_errors': 0
+        }
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, symbol):
+        return normalize_symbol(symbol) in self.index
+
+    def get(self, symbol):
+        """(exchange, name, sector) или None"""
+        return self.index.get(normalize_symbol(symbol))
+
+    def load(self):
+        """Загружает сохранённый файл в память; скачивание (нет файла или устарел) - в фоне после start()"""
+        if os.path.exists(self.path):
+            self._read_file()
+        return len(self.index)
+
+    def start(self):
+        """Фоновое обновление: первое - сразу, валидация тикеров только читает загруженный индекс"""
+        self.thread = threading.Thread(target=self._refresh_loop, name="symbol-master", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        # Проверяем не реже retry_seconds: после сбоя повтор, иначе ждём устаревания файла
+        while True:
+            try:
+                self.refresh_if_stale()
+            except Exception as e:
+                logger.error(f"Symbol master refresh loop error: {e}")
+            if self._stop.wait(min(self.retry_seconds, self.refresh_seconds)):
+                break
+
+    def refresh_if_stale(self):
+        """Перекачивает файл, если он старше refresh_hours. Сбой не трогает текущий индекс"""
+        now = time.time()
+        if self.index and now - self.loaded_at < self.refresh_seconds:
+            return False
+        if now - self.last_attempt < self.retry_seconds:
+            return False
+        self.last_attempt = now
+
+        try:
+            listing = _parse_listing(self._download(NASDAQ_LISTED_URL), 'Symbol')
+            listing.update(_parse_listing(self._download(OTHER_LISTED_URL), 'ACT Symbol', 'Exchange'))
+            if len(listing) < 1000:
+                raise ValueError(f"only {len(listing)} symbols in listing files")
+        except Exception as e:
+            self.stats['refresh_errors'] += 1
+            logger.warning(f"Symbol master refresh failed, keeping {len(self.index)} symbols: {e}")
+            return False
+
+        # В файлах NASDAQ Trader нет сектора - переносим уже известные (из файла или yfinance)
+        index = {}
+        for symbol, (exchange, name) in listing.items():
+            previous = self.index.get(symbol)
+            index[symbol] = (sys.intern(exchange), name, previous[2] if previous else None)
+
+        with self._lock:
+            # add() во время скачивания: нового листинга в файле ещё нет, сектор в файле не бывает
+            for symbol, entry in self._pending_adds.items():
+                listed = index.get(symbol)
+                index[symbol] = entry if listed is None else (listed[0], listed[1], entry[2] or listed[2])
+            self._pending_adds.clear()
+            # Замена ссылки атомарна - читатели видят либо старый, либо новый индекс
+            self.index = index
+            self.loaded_at = now
+
+        self._write_file(index)
+        self.stats['refreshes'] += 1
+        logger.info(f"Symbol master refreshed: {len(index)} symbols")
+        return True
+
+    def add(self, symbol, exchange, name, sector=None):
+        """Добавляет символ, подтверждённый в обход файла (например, yfinance для нового листинга)"""
+        symbol = normalize_symbol(symbol)
+        entry = (sys.intern(exchange or ''), name or '', sector)
+        with self._lock:
+            self.index[symbol] = entry
+            self._pending_adds[symbol] = entry
+
+    def _download(self, url):
+        response = self.http.get(url, timeout=30)
+        response.raise_for_status()
+        return response.text
+
+    def _read_file(self):
+        try:
+            index = {}
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) != 4:
+                        continue
+                    symbol, exchange, name, sector = parts
+                    index[symbol] = (sys.intern(exchange), name, sector or None)
+            self.index = index
+            self.loaded_at = os.path.getmtime(self.path)
+            logger.info(f"Symbol master loaded: {len(index)} symbols from {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to read symbol master {self.path}: {e}")
+
+    def _write_file(self, index):
+        """Атомарная запись: временный файл + rename"""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for symbol in sorted(index):
+                    exchange, name, sector = index[symbol]
+                    f.write(f"{symbol}\t{exchange}\t{name.replace(chr(9), ' ')}\t{sector or ''}\n")
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Failed to write symbol master {self.path}: {e}")
+
+    def get_stats(self):
+        return {
+            'symbols': len(self.index),
+            'age_hours': (time.time() - self.loaded_at) / 3600 if self.loaded_at else None,
+            **self.stats
+        }
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Ticker Validation using yfinance - БЛОК 2
+Ticker Validation - локальный справочник символов, yfinance только для неизвестных - БЛОК 2
 """
 import yfinance as yf
 import logging
@@ -10,20 +10,53 @@ import time
 logger = logging.getLogger(__name__)
 
 class TickerValidator:
-    def __init__(self):
+    def __init__(self, symbol_master=None, yfinance_fallback=True):
+        # Справочник листинга (SymbolMaster): O(1) проверка без сети
+        self.symbol_master = symbol_master
+        # Неизвестные справочнику символы проверяем через yfinance (новые листинги, OTC)
+        self.yfinance_fallback = yfinance_fallback
+        self.stats = {
+            'master_hits': 0,
+            'yfinance_lookups': 0
+        }
+
         # Кеш валидированных тикеров
         self.valid_tickers: Set[str] = set()
         self.invalid_tickers: Set[str] = set()
         self.last_cache_clear = time.time()
         self.cache_duration = 3600  # 1 час
 
+    def has_symbol_master(self) -> bool:
+        return self.symbol_master is not None and len(self.symbol_master) > 0
+
+    def is_listed(self, ticker: str) -> bool:
+        """Символ есть в справочнике листинга (без сети)"""
+        return self.symbol_master is not None and ticker in self.symbol_master
+
     def validate_ticker(self, ticker: str) -> Dict[str, any]:
-        """Валидирует тикер через yfinance"""
+        """Валидирует тикер: сначала справочник символов, для неизвестных - yfinance"""
         ticker = ticker.upper().strip()
 
         # Очищаем кеш каждый час
         self._clear_old_cache()
 
+        if self.symbol_master is not None:
+            # Только чтение загруженного индекса - обновление идёт в фоне (SymbolMaster.start)
+            entry = self.symbol_master.get(ticker)
+            if entry is not None:
+                self.stats['master_hits'] += 1
+                exchange, name, sector = entry
+                return {
+                    'ticker': ticker,
+                    'exists': True,
+                    'cached': True,
+                    'info': {
+                        'name': name,
+                        'exchange': exchange,
+                        'sector': sector
+                    }
+                }
+
         # Проверяем кеш
         if ticker in self.valid_tickers:
             logger.debug(f"Ticker {ticker} found in valid cache")
@@ -43,7 +76,18 @@ class TickerValidator:
                 'info': None
             }
 
+        if self.has_symbol_master() and not self.yfinance_fallback:
+            self.invalid_tickers.add(ticker)
+            logger.warning(f"Ticker {ticker} not found in symbol master")
+            return {
+                'ticker': ticker,
+                'exists': False,
+                'cached': False,
+                'info': None
+            }
+
         # Валидируем через yfinance
+        self.stats['yfinance_lookups'] += 1
         try:
             logger.debug(f"Validating ticker {ticker} via yfinance...")
 
@@ -54,6 +98,9 @@ class TickerValidator:
             if self._is_valid_info(info, ticker):
                 self.valid_tickers.add(ticker)
                 logger.debug(f"Ticker {ticker} validated successfully")
+                if self.symbol_master is not None:
+                    self.symbol_master.add(ticker, info.get('exchange'),
+                                           info.get('longName', info.get('shortName', ticker)), info.get('sector'))
 
                 return {
                     'ticker': ticker,
@@ -97,7 +144,8 @@ class TickerValidator:
         for ticker in tickers:
             results[ticker] = self.validate_ticker(ticker)
             # Небольшая задержка чтобы не спамить yfinance
-            time.sleep(0.1)
+            if not results[ticker]['cached']:
+                time.sleep(0.1)
 
         return results
 
@@ -155,5 +203,7 @@ class TickerValidator:
         return {
             'valid_count': len(self.valid_tickers),
             'invalid_count': len(self.invalid_tickers),
-            'cache_age_minutes': (time.time() - self.last_cache_clear) / 60
+            'cache_age_minutes': (time.time() - self.last_cache_clear) / 60,
+            'master_symbols': len(self.symbol_master) if self.symbol_master is not None else 0,
+            **self.stats
         }
\ No newline at end of file
@@ -2,13 +2,23 @@
 """
 Wave Analysis using DSPy + Claude Sonnet - БЛОК 2
 """
+import contextlib
 import dspy
+import json
+import litellm
 import logging
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Any
+from hedged_calls import HedgedCaller
+from signal_schema import schema_prompt, parse_json, validate_signal, to_signal
 
 logger = logging.getLogger(__name__)
 
+# Оценка промпта для бюджета: инструкции сигнатуры + ~4 символа на токен во входах
+PROMPT_OVERHEAD_TOKENS = 800
+# Меньше этого ответ ChainOfThought не помещается - вызов при таком бюджете не делаем
+MIN_CALL_TOKENS = 300
+
 class WaveAnalysisSignature(dspy.Signature):
     """Анализ волновых эффектов новости"""
 
@@ -56,24 +66,155 @@ class SignalGenerationSignature(dspy.Signature):
     confidences = dspy.OutputField(desc="Confidence 0-100 for each trade (realistic: 40-80), comma-separated as integers")
     reasoning = dspy.OutputField(desc="Detailed reasoning for each ticker: why this direction, what catalysts, what risks")
 
+SIGNALS_JSON_DESC = ("JSON array of trade objects, one per ticker (max 5), matching this JSON schema: "
+                     + schema_prompt() + ". BUY for positive impact, SHORT for negative impact - "
+                     "MUST analyze both directions. Numbers without % signs. Output only the JSON array.")
+
+class SignalJSONSignature(dspy.Signature):
+    """Generate trading signals for optimal Elliott Wave with deep market analysis.
+
+    CRITICAL INSTRUCTIONS:
+    1. Analyze both BULLISH and BEARISH implications of the news
+    2. Use SHORT signals when news is NEGATIVE for a company/sector
+    3. Use BUY signals when news is POSITIVE for a company/sector
+    4. Consider:
+       - Direct impact on mentioned companies
+       - Indirect impact on competitors/suppliers
+       - Sector-wide effects
+       - Market sentiment shifts
+    5. Be selective - only high-conviction trades with clear rationale
+    6. Confidence should reflect realistic probabilities (40-80% typical range)
+    """
+
+    # Входные данные
+    headline = dspy.InputField(desc="News headline")
+    summary = dspy.InputField(desc="News summary with key details")
+    optimal_wave = dspy.InputField(desc="Optimal Elliott Wave number (0-6)")
+    wave_start_minutes = dspy.InputField(desc="Wave start in minutes from now")
+    wave_end_minutes = dspy.InputField(desc="Wave end in minutes from now")
+    news_type = dspy.InputField(desc="News type: earnings/macro/regulatory/tech/crypto/other")
+
+    # Выходные данные
+    signals_json = dspy.OutputField(desc=SIGNALS_JSON_DESC)
+
+class SignalRepairSignature(dspy.Signature):
+    """Fix only the listed invalid fields of trading signals so they match the JSON schema.
+
+    Keep the meaning of the original values (e.g. "2.5%" -> 2.5, "nvda" -> "NVDA").
+    Return a JSON object with the same keys as invalid_json, containing only the fixed fields.
+    """
+
+    headline = dspy.InputField(desc="News headline the signals were generated for")
+    invalid_json = dspy.InputField(desc="Invalid fields by signal index, JSON object")
+    errors = dspy.InputField(desc="Validation error of each invalid field")
+    json_schema = dspy.InputField(desc="JSON schema of the signal list")
+
+    fixed_json = dspy.OutputField(desc="JSON object with the same keys as invalid_json and fixed values")
+
+class WaveSignalSignature(dspy.Signature):
+    """Choose the optimal Elliott Wave for the news AND generate trading signals for it in one answer.
+
+    CRITICAL INSTRUCTIONS:
+    1. Pick the optimal wave among waves that are not missed, using the wave windows given
+    2. Analyze both BULLISH and BEARISH implications of the news
+    3. Use SHORT signals when news is NEGATIVE for a company/sector, BUY when POSITIVE
+    4. Consider direct impact, competitors/suppliers, sector-wide effects and sentiment shifts
+    5. Be selective - only high-conviction trades with clear rationale
+    6. Confidence should reflect realistic probabilities (40-80% typical range)
+    """
+
+    # Входные данные
+    headline = dspy.InputField(desc="News headline")
+    summary = dspy.InputField(desc="News summary with key details")
+    news_age_minutes = dspy.InputField(desc="News age in minutes")
+    market_status = dspy.InputField(desc="Market status: open/closed/weekend/pre_market/after_hours")
+    wave_status = dspy.InputField(desc="Wave status: missed/ongoing/upcoming for each wave 0-6")
+    wave_windows = dspy.InputField(desc="Entry window of each wave in minutes from now")
+
+    # Выходные данные: волна
+    optimal_wave = dspy.OutputField(desc="Optimal wave number (0-6)")
+    wave_reasoning = dspy.OutputField(desc="Why this wave is optimal")
+    news_type = dspy.OutputField(desc="News type: earnings/macro/regulatory/tech/crypto/other")
+    market_impact = dspy.OutputField(desc="Expected market impact: high/medium/low")
+
+    # Выходные данные: сигналы для выбранной волны
+    tickers = dspy.OutputField(desc="List of stock tickers comma-separated (max 5, US markets only)")
+    actions = dspy.OutputField(desc="Actions: BUY for positive impact, SHORT for negative impact, comma-separated. MUST analyze both directions.")
+    expected_moves = dspy.OutputField(desc="Expected price moves in percent (absolute values, e.g. 2.5, 3.0), comma-separated")
+    confidences = dspy.OutputField(desc="Confidence 0-100 for each trade (realistic: 40-80), comma-separated as integers")
+    reasoning = dspy.OutputField(desc="Detailed reasoning for each ticker: why this direction, what catalysts, what risks")
+
+# Тот же комбинированный вызов, но сигналы - JSON-массив по схеме
+WaveSignalJSONSignature = (WaveSignalSignature
+                           .delete('tickers').delete('actions').delete('expected_moves')
+                           .delete('confidences').delete('reasoning')
+                           .append('signals_json', dspy.OutputField(desc=SIGNALS_JSON_DESC)))
+
 class WaveAnalyzer:
-    def __init__(self, openrouter_api_key, model_name, temperature, max_tokens, timeout):
+    def __init__(self, openrouter_api_key, model_name, temperature, max_tokens, timeout, recorder=None,
+                 hedge_model_name=None, hedge_percentile=90, max_call_cost=0.0, json_signals=True,
+                 default_prices=(3.0, 15.0)):
         # Настройка OpenRouter через DSPy (правильный способ)
         import os
         os.environ['OPENROUTER_API_KEY'] = openrouter_api_key
 
+        self.model_name = model_name
+        # Учёт токенов и задержек (LLMCallRecorder)
+        self.recorder = recorder
+        # Бюджет вызова: max_tokens ответа урезается так, чтобы худший случай укладывался в max_call_cost.
+        # Цены ($ за 1M токенов вход/выход) - из LiteLLM, для неизвестных моделей - default_prices
+        self.max_tokens = max_tokens
+        self.max_call_cost = max_call_cost
+        self.default_prices = default_prices
+        self._prices = {}
+
+        # timeout уходит в LiteLLM - HTTP-запрос не висит дольше LLM_TIMEOUT_SECONDS
         self.lm = dspy.LM(
             model=f"openrouter/{model_name}",
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            timeout=timeout
         )
         dspy.settings.configure(lm=self.lm)
+        if self.recorder is not None:
+            self.recorder.instrument(self.lm)
+
+        # Хеджирование: дубль запроса на вторую модель, если основная не ответила за p90
+        self.hedge_lm = None
+        if hedge_model_name:
+            self.hedge_lm = dspy.LM(
+                model=f"openrouter/{hedge_model_name}",
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+            if self.recorder is not None:
+                self.recorder.instrument(self.hedge_lm)
+            logger.info(f"Hedged LLM calls enabled: {model_name} -> {hedge_model_name} after p{hedge_percentile}")
+        self.caller = HedgedCaller(self.lm, self.hedge_lm, timeout, max_call_cost, hedge_percentile)
 
         self.wave_predictor = dspy.ChainOfThought(WaveAnalysisSignature)
-        self.signal_predictor = dspy.ChainOfThought(SignalGenerationSignature)
+        # json_signals: сигналы JSON-массивом по схеме, иначе - прежние строки через запятую
+        self.json_signals = json_signals
+        if json_signals:
+            self.signal_predictor = dspy.ChainOfThought(SignalJSONSignature)
+            self.combined_predictor = dspy.ChainOfThought(WaveSignalJSONSignature)
+        else:
+            self.signal_predictor = dspy.ChainOfThought(SignalGenerationSignature)
+            self.combined_predictor = dspy.ChainOfThought(WaveSignalSignature)
+        self.repair_predictor = dspy.Predict(SignalRepairSignature)
+
+        self.stats = {
+            'invalid_signals': 0,
+            'repaired_signals': 0,
+            'dropped_signals': 0
+        }
 
-    def analyze_waves(self, news_data, wave_status, market_status):
-        """Анализирует волны и определяет оптимальную"""
+    def analyze_waves(self, news_data, wave_status, market_status, raise_errors=False):
+        """Анализирует волны и определяет оптимальную.
+
+        raise_errors - ошибка LLM пробрасывается (режим очереди повторит задачу) вместо выбора волны по возрасту
+        """
         try:
             # Подготавливаем данные о статусе волн
             wave_status_str = self._format_wave_status(wave_status)
@@ -82,7 +223,9 @@ class WaveAnalyzer:
             logger.debug(f"News age: {news_data['age_minutes']} minutes")
             logger.debug(f"Market status: {market_status}")
 
-            response = self.wave_predictor(
+            response = self._predict(
+                'wave_analysis',
+                self.wave_predictor,
                 headline=news_data['headline'],
                 summary=news_data['summary'],
                 news_age_minutes=str(news_data['age_minutes']),
@@ -111,6 +254,8 @@ class WaveAnalyzer:
 
         except Exception as e:
             logger.error(f"Wave analysis failed: {e}")
+            if raise_errors:
+                raise
             # Fallback: выбираем волну на основе возраста новости
             fallback_wave = self._fallback_wave_selection(news_data['age_minutes'])
             return {
@@ -120,8 +265,11 @@ class WaveAnalyzer:
                 'market_impact': 'medium'
             }
 
-    def generate_signals(self, news_data, wave_info):
-        """Генерирует торговые сигналы для оптимальной волны"""
+    def generate_signals(self, news_data, wave_info, raise_errors=False):
+        """Генерирует торговые сигналы для оптимальной волны.
+
+        raise_errors - ошибка LLM пробрасывается вместо пустого списка сигналов
+        """
         try:
             optimal_wave = wave_info['optimal_wave']
             wave_start = self._calculate_wave_timing(optimal_wave)['start_minutes']
@@ -130,7 +278,9 @@ class WaveAnalyzer:
             logger.debug(f"Generating signals for wave {optimal_wave}")
             logger.debug(f"Wave timing: {wave_start}-{wave_end} minutes from now")
 
-            response = self.signal_predictor(
+            response = self._predict(
+                'signal_generation',
+                self.signal_predictor,
                 headline=news_data['headline'],
                 summary=news_data['summary'],
                 optimal_wave=str(optimal_wave),
@@ -140,7 +290,7 @@ class WaveAnalyzer:
             )
 
             # Парсим ответ
-            signals = self._parse_signals(response)
+            signals = self._signals_from_response(response, news_data['headline']) or []
 
             logger.info(f"Generated {len(signals)} signals:")
             for signal in signals:
@@ -152,8 +302,172 @@ class WaveAnalyzer:
 
         except Exception as e:
             logger.error(f"Signal generation failed: {e}")
+            if raise_errors:
+                raise
             return []
 
+    def analyze_and_generate(self, news_data, wave_status, market_status):
+        """Выбор волны и генерация сигналов одним вызовом LLM.
+
+        Возвращает (wave_info, signals). signals=None - сигналы не разобрались,
+        их нужно сгенерировать отдельно для wave_info. None вместо пары - вызов
+        не удался, нужен обычный путь analyze_waves + generate_signals.
+        """
+        try:
+            wave_windows = ", ".join(
+                f"Wave {wave}: {timing['start_minutes']}-{timing['end_minutes']} min"
+                for wave, timing in ((w, self._calculate_wave_timing(w)) for w in range(7))
+            )
+
+            response = self._predict(
+                'wave_signal_generation',
+                self.combined_predictor,
+                headline=news_data['headline'],
+                summary=news_data['summary'],
+                news_age_minutes=str(news_data['age_minutes']),
+                market_status=market_status,
+                wave_status=self._format_wave_status(wave_status),
+                wave_windows=wave_windows
+            )
+
+            wave_info = {
+                'optimal_wave': max(0, min(10, int(response.optimal_wave))),
+                'wave_reasoning': response.wave_reasoning,
+                'news_type': response.news_type,
+                'market_impact': response.market_impact
+            }
+        except Exception as e:
+            logger.error(f"Combined wave/signal call failed, falling back to two calls: {e}")
+            return None
+
+        signals = self._signals_from_response(response, news_data['headline'])
+        if signals is None:
+            # Волна выбрана, а сигналы не разобрались - вызывающий перегенерирует только их
+            logger.warning("Combined call returned unparseable signals, regenerating them separately")
+
+        logger.info(f"Combined analysis: wave {wave_info['optimal_wave']}, {wave_info['news_type']}, "
+                    f"impact {wave_info['market_impact']}, {len(signals or [])} signals")
+        return wave_info, signals
+
+    def _signals_from_response(self, response, headline):
+        """Сигналы из ответа предиктора. None - ответ не удалось разобрать"""
+        if self.json_signals:
+            return self._parse_json_signals(response.signals_json, headline)
+
+        signals = self._parse_signals(response)
+        if not signals and (response.tickers or '').strip():
+            return None
+        return signals
+
+    def _parse_json_signals(self, raw, headline):
+        """Строгая проверка JSON-сигналов по схеме.
+
+        Невалидные поля всех сигналов чинятся одним маленьким запросом
+        (SignalRepairSignature), генерация целиком не повторяется. Сигналы,
+        оставшиеся невалидными после починки, отбрасываются.
+        """
+        try:
+            items = parse_json(raw)
+        except ValueError as e:
+            logger.warning(f"Signals are not valid JSON ({e}), repairing")
+            fixed = self._repair(headline, {'signals': raw}, {'signals': f"not a valid JSON array: {e}"})
+            items = fixed.get('signals') if isinstance(fixed, dict) else None
+
+        if isinstance(items, dict) and isinstance(items.get('signals'), list):
+            items = items['signals']
+        if not isinstance(items, list):
+            logger.error(f"Signals JSON is not an array: {str(raw)[:200]}")
+            return None
+
+        items = [dict(item) if isinstance(item, dict) else item for item in items[:5]]
+        errors = {str(i): validate_signal(item) for i, item in enumerate(items)}
+        errors = {key: field_errors for key, field_errors in errors.items() if field_errors}
+
+        repairable = {key: field_errors for key, field_errors in errors.items() if '*' not in field_errors}
+        if repairable:
+            self.stats['invalid_signals'] += len(repairable)
+            logger.warning(f"Repairing {len(repairable)} invalid signals: {repairable}")
+            invalid = {key: {name: items[int(key)].get(name) for name in field_errors}
+                       for key, field_errors in repairable.items()}
+            fixed = self._repair(headline, invalid, repairable)
+            if isinstance(fixed, dict):
+                for key, field_errors in repairable.items():
+                    fixed_fields = fixed.get(key)
+                    if isinstance(fixed_fields, dict):
+                        items[int(key)].update({name: fixed_fields[name] for name in field_errors if name in fixed_fields})
+
+        signals = []
+        for i, item in enumerate(items):
+            item_errors = validate_signal(item)
+            if item_errors:
+                self.stats['dropped_signals'] += 1
+                logger.warning(f"Dropping invalid signal {item}: {item_errors}")
+                continue
+            if str(i) in repairable:
+                self.stats['repaired_signals'] += 1
+            signals.append(to_signal(item))
+        return signals
+
+    def _repair(self, headline, invalid, errors):
+        """Запрос на исправление только невалидных полей. Ответ - разобранный JSON или None"""
+        try:
+            response = self._predict(
+                'signal_repair',
+                self.repair_predictor,
+                headline=headline,
+                invalid_json=json.dumps(invalid, default=str)[:4000],
+                errors=json.dumps(errors),
+                json_schema=schema_prompt()
+            )
+            return parse_json(response.fixed_json)
+        except Exception as e:
+            logger.error(f"Signal repair failed: {e}")
+            return None
+
+    def _predict(self, operation, predictor, **inputs):
+        """Вызов предиктора с жёстким таймаутом и хеджированием (см. HedgedCaller)"""
+        def call_fn(lm, role):
+            tracked_as = operation if role == 'primary' else f"{operation}_hedge"
+            max_tokens = self._token_cap(lm, inputs)
+            with self._track(tracked_as, lm) as entries, dspy.context(lm=lm):
+                response = predictor(**inputs, config={'max_tokens': max_tokens})
+            cost = sum(float(entry.get('cost') or 0.0) for entry in entries or ())
+            return response, cost
+
+        return self.caller.call(operation, call_fn)
+
+    def _model_prices(self, model):
+        """($ за токен входа, $ за токен выхода) для модели"""
+        if model not in self._prices:
+            try:
+                info = litellm.get_model_info(model)
+                prices = (float(info['input_cost_per_token']), float(info['output_cost_per_token']))
+            except Exception:
+                logger.info(f"No LiteLLM prices for {model}, budgeting with "
+                            f"${self.default_prices[0]}/${self.default_prices[1]} per 1M tokens")
+                prices = (self.default_prices[0] / 1e6, self.default_prices[1] / 1e6)
+            self._prices[model] = prices
+        return self._prices[model]
+
+    def _token_cap(self, lm, inputs):
+        """max_tokens вызова, при котором промпт + полный ответ не дороже max_call_cost"""
+        if not self.max_call_cost:
+            return self.max_tokens
+        input_price, output_price = self._model_prices(lm.model)
+        prompt_tokens = PROMPT_OVERHEAD_TOKENS + sum(len(str(value)) for value in inputs.values()) // 4
+        left = self.max_call_cost - prompt_tokens * input_price
+        cap = min(self.max_tokens, int(left / output_price)) if output_price > 0 else self.max_tokens
+        if cap < MIN_CALL_TOKENS:
+            raise ValueError(f"LLM call budget ${self.max_call_cost:.4f} too small for {lm.model} "
+                             f"({cap} completion tokens)")
+        return cap
+
+    def _track(self, operation, lm=None):
+        """Учёт вызова LLM, если подключён recorder"""
+        if self.recorder is None:
+            return contextlib.nullcontext()
+        return self.recorder.track(operation, (lm or self.lm).model)
+
     def _format_wave_status(self, wave_status):
         """Форматирует статус волн для LLM"""
         status_parts = []